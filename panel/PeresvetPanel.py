@@ -1,14 +1,20 @@
 import json
 import os.path
 import sys
+import threading
+import time
 import traceback
 
-from PyQt5.QtCore import Qt, QCoreApplication
+from PyQt5.QtCore import Qt, QCoreApplication, QFileSystemWatcher, QTimer, pyqtSignal
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QPushButton, QLabel, QVBoxLayout, QDialog, QComboBox
 
 from design.peresvet_ui import Ui_Peresvet
-from panel.modules_manager import ApachePHP, NginxPHP, PHP, HybridServer
+from panel.modules_manager import ApachePHP, NginxPHP, PHP, HybridServer, MySQL, Postgresql, Redis, MongoDB, \
+    discover_sites, forget_htaccess_prefixes, DATABASE_PROFILES, PGPOOL_DEFAULT_SIZE, PGPOOL_PORT, PHP_HANDLERS, \
+    PHP_INI_PROFILES, POSTGRESQL_PORT, REDIS_PROFILES, SITE_MANIFEST, prepare_mysql_datadir, \
+    prepare_postgresql_datadir, set_postgresql_environment, set_redis_environment, tune_nginx, tune_apache, \
+    purge_fastcgi_cache
 
 PERESVET_PATH = os.path.dirname(os.path.abspath(sys.argv[0]))
 
@@ -19,198 +25,89 @@ MODULES_LOGS_DIR = os.path.join(USERDATA_DIR, "modules_logs")
 MODULES_DIR = os.path.join(PERESVET_PATH, "bin")
 
 CONFIG_FILE = os.path.join(USERDATA_DIR, "config.json")
-NGINX_CONF_FILE = os.path.join(USERDATA_DIR, "nginx.conf")
-APACHE_CONF_FILE = os.path.join(USERDATA_DIR, "apache.conf")
-HYBRID_APACHE_CONF_FILE = os.path.join(USERDATA_DIR, "apache_hybrid.conf")
-HYBRID_NGINX_CONF_FILE = os.path.join(USERDATA_DIR, "nginx_hybrid.conf")
+NGINX_CACHE_DIR = os.path.join(USERDATA_DIR, "nginx_cache")
+
+SERVICE_STATE_TITLES = {
+    "stopped": "остановлен",
+    "initializing": "создаётся каталог данных",
+    "starting": "запускается",
+    "running": "работает",
+    "failed": "не отвечает, смотри лог",
+}
 
 for check_dir in [SITES_DIR, USERDATA_DIR, LOGS_DIR, MODULES_DIR, MODULES_LOGS_DIR]:
     not os.path.exists(check_dir) and os.makedirs(check_dir)
 
-import os
-
-
-def init_conf_files(self):
-    # 1. Базовый конфиг Apache
-    apache_config = f"""
-        ServerRoot "{self.apache_path}"
-        Listen 80
-        DocumentRoot "{self.project_path}/sites/localhost"
-        <Directory "{self.project_path}/sites/localhost">
-            Options Indexes FollowSymLinks
-            AllowOverride All
-            Require all granted
-        </Directory>
-
-        ErrorLog "{self.module_log_dir}/apache_error.log"
-        CustomLog "{self.module_log_dir}/apache_access.log" common
-
-        LoadModule authz_core_module {self.authz_core_module}
-        LoadModule authz_host_module {self.mod_authz_host}
-        LoadModule mime_module {self.mod_mime}
-        LoadModule php{self.php_e}_module "{self.apache_dll_path}"
-        AddHandler application/x-httpd-php .php
-        PHPIniDir "{self.php_path}"
-    """
-
-    # 2. Базовый конфиг Nginx
-    nginx_config = f"""
-        worker_processes  1;
-        events {{
-            worker_connections  1024;
-        }}
-        http {{
-            include       mime.types;
-            default_type  application/octet-stream;
-            sendfile        on;
-            keepalive_timeout  65;
-
-            error_log  {self.module_log_dir}/nginx_error.log;
-            access_log {self.module_log_dir}/nginx_access.log;
-
-            server {{
-                listen 80;
-                server_name localhost;
-                root {self.sites_path}/localhost;
-                index index.php index.html;
-
-                error_log  {self.module_log_dir}/nginx_error.log;
-                access_log {self.module_log_dir}/nginx_access.log;
-
-                location / {{
-                    try_files $uri $uri/ =404;
-                }}
-
-                location ~ \\.php$ {{
-                    include fastcgi_params;
-                    fastcgi_pass 127.0.0.1:9000;
-                    fastcgi_index index.php;
-                    fastcgi_param SCRIPT_FILENAME $document_root$fastcgi_script_name;
-                    fastcgi_param PATH_TRANSLATED $document_root$fastcgi_script_name;
-                    fastcgi_param QUERY_STRING $query_string;
-                    fastcgi_param REQUEST_METHOD $request_method;
-                    fastcgi_param CONTENT_TYPE $content_type;
-                    fastcgi_param CONTENT_LENGTH $content_length;
-                    fastcgi_param SCRIPT_NAME $fastcgi_script_name;
-                    fastcgi_param REQUEST_URI $request_uri;
-                    fastcgi_param DOCUMENT_URI $document_uri;
-                    fastcgi_param DOCUMENT_ROOT $document_root;
-                    fastcgi_param SERVER_PROTOCOL $server_protocol;
-                    fastcgi_param REMOTE_ADDR $remote_addr;
-                    fastcgi_param REMOTE_PORT $remote_port;
-                    fastcgi_param SERVER_ADDR $server_addr;
-                    fastcgi_param SERVER_PORT $server_port;
-                    fastcgi_param SERVER_NAME $server_name;
-                }}
-            }}
-        }}
-    """
-
-    # 3. Гибридный конфиг Apache (слушает на 8080)
-    apache_hybrid_config = f"""
-        Listen 8080
-        <VirtualHost *:8080>
-            ServerName site1.su
-            DocumentRoot "{self.sites_path}/site1"
-            <Directory "{self.sites_path}/site1">
-                AllowOverride All
-                Require all granted
-            </Directory>
-        </VirtualHost>
-
-        <VirtualHost *:8080>
-            ServerName localhost
-            DocumentRoot "{self.sites_path}/site2"
-            <Directory "{self.sites_path}/site2">
-                AllowOverride All
-                Require all granted
-            </Directory>
-        </VirtualHost>
-
-        ErrorLog "{self.module_log_dir}/apache_error.log"
-
-        LoadModule authz_core_module {self.authz_core_module}
-        LoadModule authz_host_module {self.mod_authz_host}
-        LoadModule mime_module {self.mod_mime}
-        LoadModule php{self.php_e}_module "{self.apache_dll_path}"
-        AddHandler application/x-httpd-php .php
-        PHPIniDir "{self.php_path}"
-    """
-
-    # 4. Гибридный конфиг Nginx (прокси на Apache:8080)
-    nginx_hybrid_config = f"""
-        worker_processes  1;
-        events {{
-            worker_connections  1024;
-        }}
-        http {{
-            include       mime.types;
-            default_type  application/octet-stream;
-            sendfile        on;
-            keepalive_timeout  65;
-
-            error_log  {self.module_log_dir}/nginx_error.log;
-            access_log {self.module_log_dir}/nginx_access.log;
-
-            server {{
-                listen 80;
-                server_name site1.su;
-
-                # Реверс-прокси
-                location / {{
-                    proxy_pass http://127.0.0.1:8080;
-                    proxy_set_header Host $host;
-                    proxy_set_header X-Real-IP $remote_addr;
-                }}
-            }}
-
-            server {{
-                listen 80;
-                server_name site2.ru;
-
-                location / {{
-                    proxy_pass http://127.0.0.1:8080;
-                    proxy_set_header Host $host;
-                    proxy_set_header X-Real-IP $remote_addr;
-                }}
-            }}
-        }}
-    """
-
-    # Создаём или перезаписываем эти конфиги в userdata
-    with open(APACHE_CONF_FILE, "w", encoding="utf-8") as f:
-        f.write(apache_config.strip() + "\n")
-
-    with open(NGINX_CONF_FILE, "w", encoding="utf-8") as f:
-        f.write(nginx_config.strip() + "\n")
-
-    with open(HYBRID_APACHE_CONF_FILE, "w", encoding="utf-8") as f:
-        f.write(apache_hybrid_config.strip() + "\n")
-
-    with open(HYBRID_NGINX_CONF_FILE, "w", encoding="utf-8") as f:
-        f.write(nginx_hybrid_config.strip() + "\n")
-
-    print("Все конфигурационные файлы успешно созданы или обновлены.")
+
+def get_mysql_path(version):
+    return os.path.join(PERESVET_PATH, "bin", "mysql", version, f"mysql-{version}-winx64")
+
+
+def get_postgresql_path(version):
+    return os.path.join(PERESVET_PATH, "bin", "postgresql", version, "pgsql")
+
+
+def get_redis_path(version):
+    return os.path.join(PERESVET_PATH, "bin", "redis", version)
+
+
+def get_mongodb_path(version):
+    # архив распаковывается во вложенную папку с полной версией, а она не всегда совпадает с ключом версии
+    version_path = os.path.join(PERESVET_PATH, "bin", "mongodb", version)
+    for item in sorted(os.listdir(version_path)) if os.path.isdir(version_path) else []:
+        if os.path.isfile(os.path.join(version_path, item, "bin", "mongod.exe")):
+            return os.path.join(version_path, item)
+    return version_path
+
+
+def default_config():
+    modules = {
+        "apache": {"version": None, "is_active": False},
+        "nginx": {"version": None, "is_active": False, "microcache": False, "microcache_ttl": "1s"},
+        "php": {"version": None, "is_active": False, "workers": 0, "max_requests": 500,
+                "max_memory_mb": 256, "ini_profile": "development", "handler": "module"},
+        "postgresql": {"version": None, "is_active": False, "profile": "dev-fast", "pooler": False,
+                       "pool_size": PGPOOL_DEFAULT_SIZE, "ephemeral": False, "seed_snapshot": ""},
+        "mysql": {"version": None, "is_active": False, "profile": "dev-fast", "ephemeral": False,
+                  "seed_snapshot": ""},
+        "redis": {"version": None, "is_active": False, "profile": "cache", "ephemeral": False,
+                  "seed_snapshot": ""},
+        "mongodb": {"version": None, "is_active": False, "profile": "dev-fast"}
+    }
+    return {
+        "modules": modules,
+        "sites": {},
+        "tuning": {"nginx": {}, "apache": {}, "mysql": {}, "postgresql": {}, "redis": {}, "mongodb": {}},
+        "run_startup": False,
+    }
 
 
 def load_config():
     not os.path.exists(USERDATA_DIR) and os.makedirs(USERDATA_DIR)
     if not os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE, 'w') as file:
-            config_data = {}
-            modules = {
-                "apache": {"version": None, "is_active": False},
-                "nginx": {"version": None, "is_active": False},
-                "php": {"version": None, "is_active": False},
-                "postgresql": {"version": None, "is_active": False},
-                "mysql": {"version": None, "is_active": False},
-                "redis": {"version": None, "is_active": False}
-            }
-            config_data["modules"] = modules
-            config_data["run_startup"] = False
-
+            file.write(json.dumps(default_config()))
+    config_data = json.loads(open(CONFIG_FILE, 'r').read())
+
+    # config.json из прошлых версий дополняется новыми модулями, параметрами и разделами
+    original = json.dumps(config_data, sort_keys=True)
+    defaults = default_config()
+    for section in ("sites", "tuning", "run_startup"):
+        config_data.setdefault(section, defaults[section])
+    for name, options in defaults["tuning"].items():
+        config_data["tuning"].setdefault(name, options)
+    if not config_data.get("modules"):
+        config_data["modules"] = {}
+    for name, options in defaults["modules"].items():
+        module = config_data["modules"].setdefault(name, {})
+        for option, value in options.items():
+            module.setdefault(option, value)
+    # выбор транспорта FastCGI убран: PHP всегда слушает TCP
+    config_data["modules"].get("php", {}).pop("transport", None)
+    if json.dumps(config_data, sort_keys=True) != original:
+        with open(CONFIG_FILE, 'w') as file:
             file.write(json.dumps(config_data))
-    return json.loads(open(CONFIG_FILE, 'r').read())
+    return config_data
 
 
 def save_config(modules=None, run_startup=None):
@@ -221,6 +118,17 @@ def save_config(modules=None, run_startup=None):
         file.write(json.dumps(config_data))
 
 
+def save_config_section(section, value):
+    config_data = load_config()
+    config_data[section] = value
+    with open(CONFIG_FILE, 'w') as file:
+        file.write(json.dumps(config_data))
+
+
+def get_site_php(config):
+    return {site: options.get("php") for site, options in config.get("sites", {}).items() if options.get("php")}
+
+
 class CustomDialog(QDialog):
     def __init__(self):
         super().__init__()
@@ -263,11 +171,22 @@ class CustomDialog(QDialog):
 
 
 class PeresvetPanel(QMainWindow, Ui_Peresvet):
+    # итог фоновой операции со снимком: модуль, снимок для выбора в списке, сообщение, текст ошибки
+    snapshot_finished = pyqtSignal(str, str, str, str)
+    reload_finished = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.hybrid = None
         self.nginx = None
         self.apache = None
+        self.mysql = None
+        self.postgresql = None
+        self.redis = None
+        self.mongodb = None
+        self.reload_thread = None
+        self.reload_pending = False
+        self.stop_thread = None
         self.setupUi(self)
 
         self.load_versions()
@@ -283,6 +202,7 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
         self.postgresql_list.currentTextChanged.connect(lambda text: self.update_version("postgresql", text))
         self.mysql_list.currentTextChanged.connect(lambda text: self.update_version("mysql", text))
         self.redis_list.currentTextChanged.connect(lambda text: self.update_version("redis", text))
+        self.mongodb_list.currentTextChanged.connect(lambda text: self.update_version("mongodb", text))
 
         self.apache_checkbox.stateChanged.connect(
             lambda state: self.update_checkbox("apache", state, [self.apache_list, self.php_list], ["apache", "php"]))
@@ -294,12 +214,68 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
             lambda state: self.update_checkbox("mysql", state, [self.mysql_list], ["mysql"]))
         self.redis_checkbox.stateChanged.connect(
             lambda state: self.update_checkbox("redis", state, [self.redis_list], ["redis"]))
+        self.mongodb_checkbox.stateChanged.connect(
+            lambda state: self.update_checkbox("mongodb", state, [self.mongodb_list], ["mongodb"]))
+
+        self.php_workers.valueChanged.connect(lambda value: self.update_option("php", "workers", value))
+        self.php_max_requests.valueChanged.connect(lambda value: self.update_option("php", "max_requests", value))
+        self.php_max_memory.valueChanged.connect(lambda value: self.update_option("php", "max_memory_mb", value))
+        self.ini_profile_list.currentTextChanged.connect(lambda text: self.update_option("php", "ini_profile", text))
+        self.php_handler_list.currentTextChanged.connect(lambda text: self.update_option("php", "handler", text))
+        self.mysql_profile_list.currentTextChanged.connect(lambda text: self.update_option("mysql", "profile", text))
+        self.postgresql_profile_list.currentTextChanged.connect(
+            lambda text: self.update_option("postgresql", "profile", text))
+        self.redis_profile_list.currentTextChanged.connect(lambda text: self.update_option("redis", "profile", text))
+        self.mongodb_profile_list.currentTextChanged.connect(
+            lambda text: self.update_option("mongodb", "profile", text))
+        self.pgpool_checkbox.stateChanged.connect(
+            lambda state: self.update_option("postgresql", "pooler", bool(state)))
+        self.pgpool_size.valueChanged.connect(lambda value: self.update_option("postgresql", "pool_size", value))
+        self.microcache_checkbox.stateChanged.connect(
+            lambda state: self.update_option("nginx", "microcache", bool(state)))
+        self.purge_cache.clicked.connect(self.purge_microcache)
+        self.snapshot_service_list.currentTextChanged.connect(self.show_snapshots)
+        for module_name, checkbox, seed_list in self.ephemeral_widgets():
+            checkbox.stateChanged.connect(lambda state, name=module_name: self.update_ephemeral(name, state))
+            seed_list.currentTextChanged.connect(
+                lambda text, name=module_name: self.update_option(name, "seed_snapshot", text))
+        self.snapshot_create.clicked.connect(lambda: self.snapshot_action("create"))
+        self.snapshot_restore.clicked.connect(lambda: self.snapshot_action("restore"))
+        self.snapshot_delete.clicked.connect(lambda: self.snapshot_action("delete"))
+        self.snapshot_finished.connect(self.show_snapshot_result)
+        self.site_list.currentTextChanged.connect(self.show_site_php)
+        self.nginx_directive_list.currentTextChanged.connect(lambda text: self.show_directive("nginx", text))
+        self.nginx_directive_value.editingFinished.connect(lambda: self.update_directive("nginx"))
+        self.apache_directive_list.currentTextChanged.connect(lambda text: self.show_directive("apache", text))
+        self.apache_directive_value.editingFinished.connect(lambda: self.update_directive("apache"))
+        self.site_php_list.currentTextChanged.connect(self.update_site_php)
 
         pixmap = QPixmap("images/small_icon.ico")
         self.set_pixmaps(pixmap, [self.icon1, self.icon2])
 
         self.icon1.mousePressEvent = lambda event: self.start_manual()
 
+        # изменения настроек и папки сайтов собираются в одну мягкую перезагрузку сервера
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(500)
+        self.reload_timer.timeout.connect(self.reload_server)
+        self.reload_finished.connect(self.finish_reload)
+        self.sites_timer = QTimer(self)
+        self.sites_timer.setSingleShot(True)
+        self.sites_timer.setInterval(500)
+        self.sites_timer.timeout.connect(self.refresh_sites)
+        self.sites_watcher = QFileSystemWatcher(self)
+        self.sites_watcher.directoryChanged.connect(self.site_changed)
+        self.sites_watcher.fileChanged.connect(lambda path: self.site_changed(os.path.dirname(path)))
+        self.watch_sites()
+
+        # состояние СУБД берётся из проверки по их протоколу, а не из факта запуска процесса
+        self.status_timer = QTimer(self)
+        self.status_timer.setInterval(2000)
+        self.status_timer.timeout.connect(self.update_services_status)
+        self.status_timer.start()
+
     def load_versions(self):
         all_modules = {}
         for item in os.listdir(MODULES_DIR):
@@ -319,13 +295,34 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
         self.postgresql_checkbox.setDisabled(True) if "postgresql" not in all_modules else None
         self.mysql_checkbox.setDisabled(True) if "mysql" not in all_modules else None
         self.redis_checkbox.setDisabled(True) if "redis" not in all_modules else None
+        self.mongodb_checkbox.setDisabled(True) if "mongodb" not in all_modules else None
 
         self.apache_list.addItems(all_modules["apache"] if "apache" in all_modules else [])
         self.nginx_list.addItems(all_modules["nginx"] if "nginx" in all_modules else [])
         self.php_list.addItems(all_modules["php"] if "php" in all_modules else [])
         self.postgresql_list.addItems(all_modules["postgresql"] if "postgresql" in all_modules else [])
         self.mysql_list.addItems(all_modules["mysql"] if "mysql" in all_modules else [])
+        # первый mysqld --initialize идёт десятки секунд: каталоги данных готовятся в фоне сразу после установки
+        for version in all_modules.get("mysql", []):
+            prepare_mysql_datadir(get_mysql_path(version), os.path.join(LOGS_DIR, "mysql.log"))
+        for version in all_modules.get("postgresql", []):
+            prepare_postgresql_datadir(get_postgresql_path(version), os.path.join(LOGS_DIR, "postgresql.log"))
         self.redis_list.addItems(all_modules["redis"] if "redis" in all_modules else [])
+        self.mongodb_list.addItems(all_modules["mongodb"] if "mongodb" in all_modules else [])
+
+        self.ini_profile_list.addItems(PHP_INI_PROFILES)
+        self.php_handler_list.addItems(PHP_HANDLERS)
+        self.mysql_profile_list.addItems(DATABASE_PROFILES)
+        self.postgresql_profile_list.addItems(DATABASE_PROFILES)
+        self.redis_profile_list.addItems(REDIS_PROFILES)
+        self.mongodb_profile_list.addItems(DATABASE_PROFILES)
+        self.snapshot_service_list.addItems([name for name in ("mysql", "postgresql", "redis", "mongodb")
+                                             if name in all_modules])
+        self.site_php_list.addItem("")
+        self.site_php_list.addItems(all_modules["php"] if "php" in all_modules else [])
+        self.site_list.addItems(discover_sites(SITES_DIR))
+        self.nginx_directive_list.addItems(dict.fromkeys([*tune_nginx("nginx"), *tune_nginx("hybrid")]))
+        self.apache_directive_list.addItems(dict.fromkeys([*tune_apache("apache"), *tune_apache("hybrid")]))
 
     def load_config(self):
 
@@ -345,19 +342,288 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
         set_version_for_combobox(modules, "postgresql", self.postgresql_list)
         set_version_for_combobox(modules, "mysql", self.mysql_list)
         set_version_for_combobox(modules, "redis", self.redis_list)
+        set_version_for_combobox(modules, "mongodb", self.mongodb_list)
 
         set_checkbox_state(modules, "apache", self.apache_checkbox)
         set_checkbox_state(modules, "nginx", self.nginx_checkbox)
         set_checkbox_state(modules, "postgresql", self.postgresql_checkbox)
         set_checkbox_state(modules, "mysql", self.mysql_checkbox)
         set_checkbox_state(modules, "redis", self.redis_checkbox)
-
-    @staticmethod
-    def update_version(module_name, text):
+        set_checkbox_state(modules, "mongodb", self.mongodb_checkbox)
+
+        php = modules.get("php", {})
+        self.php_workers.setValue(php.get("workers") or 0)
+        self.php_max_requests.setValue(php.get("max_requests", 500))
+        self.php_max_memory.setValue(php.get("max_memory_mb", 256))
+        self.ini_profile_list.setCurrentText(php.get("ini_profile", "development"))
+        self.php_handler_list.setCurrentText(php.get("handler", "module"))
+        self.mysql_profile_list.setCurrentText(modules.get("mysql", {}).get("profile", "dev-fast"))
+        self.postgresql_profile_list.setCurrentText(modules.get("postgresql", {}).get("profile", "dev-fast"))
+        self.redis_profile_list.setCurrentText(modules.get("redis", {}).get("profile", "cache"))
+        self.mongodb_profile_list.setCurrentText(modules.get("mongodb", {}).get("profile", "dev-fast"))
+        self.pgpool_checkbox.setChecked(modules.get("postgresql", {}).get("pooler", False))
+        self.pgpool_size.setValue(modules.get("postgresql", {}).get("pool_size", PGPOOL_DEFAULT_SIZE))
+        self.microcache_checkbox.setChecked(modules.get("nginx", {}).get("microcache", False))
+        self.show_site_php(self.site_list.currentText())
+        self.show_snapshots(self.snapshot_service_list.currentText())
+        for module_name, checkbox, _ in self.ephemeral_widgets():
+            checkbox.setChecked(modules.get(module_name, {}).get("ephemeral", False))
+        self.show_seed_snapshots()
+        self.show_directive("nginx", self.nginx_directive_list.currentText())
+        self.show_directive("apache", self.apache_directive_list.currentText())
+
+    def update_version(self, module_name, text):
         config = load_config()
         modules = config["modules"]
         modules[module_name]["version"] = text
         save_config(modules)
+        self.reload_timer.start()
+
+    def update_option(self, module_name, option, value):
+        config = load_config()
+        modules = config["modules"]
+        modules[module_name][option] = value
+        save_config(modules)
+        self.reload_timer.start()
+
+    def watch_sites(self):
+        paths = [SITES_DIR] + [os.path.join(SITES_DIR, site) for site in discover_sites(SITES_DIR)]
+        paths += [os.path.join(path, SITE_MANIFEST) for path in paths[1:]
+                  if os.path.exists(os.path.join(path, SITE_MANIFEST))]
+        watched = self.sites_watcher.directories() + self.sites_watcher.files()
+        stale = [path for path in watched if path not in paths]
+        new = [path for path in paths if path not in watched]
+        self.sites_watcher.removePaths(stale) if stale else None
+        self.sites_watcher.addPaths(new) if new else None
+
+    def site_changed(self, path):
+        # .htaccess изменившегося сайта гибридный режим найдёт заново, остальные сайты не обходятся
+        forget_htaccess_prefixes(path)
+        self.sites_timer.start()
+
+    def refresh_sites(self):
+        self.watch_sites()
+        current = self.site_list.currentText()
+        self.site_list.blockSignals(True)
+        self.site_list.clear()
+        self.site_list.addItems(discover_sites(SITES_DIR))
+        self.site_list.setCurrentText(current)
+        self.site_list.blockSignals(False)
+        self.show_site_php(self.site_list.currentText())
+        self.reload_server()
+
+    def reload_server(self):
+        """Применяет изменённые настройки к запущенному серверу мягкой перезагрузкой, без остановки.
+
+        Переключение версий и замена процессов PHP ждут дообслуживания запросов и портов несколько секунд,
+        поэтому идут в фоновом потоке. Одновременно выполняется одна перезагрузка: изменения, пришедшие
+        во время неё, применяются следующей.
+        """
+        if self.reload_thread and self.reload_thread.is_alive():
+            self.reload_pending = True
+            return
+        self.reload_pending = False
+        self.reload_thread = threading.Thread(target=self.apply_settings, name="reload-server", daemon=True)
+        self.reload_thread.start()
+
+    def finish_reload(self):
+        if self.reload_pending:
+            self.reload_timer.start()
+
+    def wait_reload(self):
+        # остановка не должна пересекаться с переключением версий, которое ещё держит старые процессы
+        self.reload_pending = False
+        if self.reload_thread:
+            self.reload_thread.join()
+
+    def apply_settings(self):
+        """Выполняется в фоновом потоке reload_server."""
+        config = load_config()
+        modules = config["modules"]
+        try:
+            self.switch_versions(modules)
+            if self.apache:
+                self.apache.reload(php_options=self.get_php_options(modules), site_php=get_site_php(config),
+                                   tuning_overrides=config.get("tuning"))
+            if self.nginx:
+                self.nginx.reload(php_options=self.get_php_options(modules), site_php=get_site_php(config),
+                                  tuning_overrides=config.get("tuning"), nginx_options=modules["nginx"])
+            if self.hybrid:
+                self.hybrid.reload(php_options=self.get_php_options(modules), site_php=get_site_php(config),
+                                   tuning_overrides=config.get("tuning"))
+            if self.mysql:
+                self.mysql.reload(mysql_options=modules["mysql"], tuning_overrides=config.get("tuning"))
+            if self.postgresql:
+                self.postgresql.reload(postgresql_options=modules["postgresql"], tuning_overrides=config.get("tuning"))
+            if self.redis:
+                self.redis.reload(redis_options=modules["redis"], tuning_overrides=config.get("tuning"))
+            if self.mongodb:
+                self.mongodb.reload(mongodb_options=modules["mongodb"], tuning_overrides=config.get("tuning"))
+        except:
+            traceback.print_exc()
+        self.reload_finished.emit()
+
+    def switch_versions(self, modules):
+        """Переводит запущенный сервер на выбранные в панели версии: новая версия поднимается рядом со старой
+        и получает трафик только после проверки."""
+        if modules["php"]["version"]:
+            php_path = os.path.join(PERESVET_PATH, "bin", "php", modules["php"]["version"])
+            for server in (self.apache, self.nginx, self.hybrid):
+                server.switch_php(php_path) if server else None
+        if modules["nginx"]["version"] and (self.nginx or self.hybrid):
+            nginx_v = modules["nginx"]["version"]
+            (self.nginx or self.hybrid).switch_nginx(os.path.join(PERESVET_PATH, "bin", "nginx", nginx_v,
+                                                                  f"nginx-{nginx_v}"))
+        if modules["apache"]["version"] and (self.apache or self.hybrid):
+            (self.apache or self.hybrid).switch_apache(os.path.join(PERESVET_PATH, "bin", "apache",
+                                                                    modules["apache"]["version"], "Apache24"))
+
+    def show_site_php(self, site):
+        version = get_site_php(load_config()).get(site, "")
+        self.site_php_list.blockSignals(True)
+        self.site_php_list.setCurrentText(version)
+        self.site_php_list.blockSignals(False)
+
+    def update_site_php(self, version):
+        site = self.site_list.currentText()
+        if not site:
+            return
+        sites = load_config().get("sites", {})
+        sites.setdefault(site, {})["php"] = version or None
+        save_config_section("sites", sites)
+        self.reload_timer.start()
+
+    def directive_widgets(self, server):
+        if server == "apache":
+            return self.apache_directive_list, self.apache_directive_value
+        return self.nginx_directive_list, self.nginx_directive_value
+
+    def show_directive(self, server, directive):
+        if server == "apache":
+            auto_values = {**tune_apache("hybrid"), **tune_apache("apache")}
+        else:
+            auto_values = {**tune_nginx("hybrid"), **tune_nginx("nginx")}
+        override = load_config().get("tuning", {}).get(server, {}).get(directive, "")
+        _, value_edit = self.directive_widgets(server)
+        value_edit.setPlaceholderText(str(auto_values.get(directive, "")))
+        value_edit.setText(str(override))
+
+    def update_directive(self, server):
+        directive_list, value_edit = self.directive_widgets(server)
+        directive = directive_list.currentText()
+        if not directive:
+            return
+        tuning = load_config().get("tuning", {})
+        overrides = tuning.setdefault(server, {})
+        value = value_edit.text().strip()
+        if value:
+            overrides[directive] = value
+        else:
+            overrides.pop(directive, None)
+        save_config_section("tuning", tuning)
+        self.reload_timer.start()
+
+    def purge_microcache(self):
+        prefix = self.purge_prefix.text().strip() or None
+        removed = purge_fastcgi_cache(NGINX_CACHE_DIR, prefix)
+        QMessageBox.information(self, "Микрокэш", f"Удалено записей кэша: {removed}")
+
+    def ephemeral_widgets(self):
+        return (("postgresql", self.postgresql_ephemeral, self.postgresql_seed),
+                ("mysql", self.mysql_ephemeral, self.mysql_seed),
+                ("redis", self.redis_ephemeral, self.redis_seed))
+
+    def update_ephemeral(self, module_name, state):
+        self.update_option(module_name, "ephemeral", bool(state))
+        if state:
+            QMessageBox.warning(self, "Данные в памяти",
+                                f"Данные {module_name} будут храниться в памяти без сброса на диск и удалятся "
+                                f"при остановке сервера. Заполнить их при запуске можно из снимка.")
+
+    def show_seed_snapshots(self):
+        modules = load_config()["modules"]
+        for module_name, _, seed_list in self.ephemeral_widgets():
+            server = self.database_server(module_name)
+            seed_list.blockSignals(True)
+            seed_list.clear()
+            seed_list.addItems([""] + ([snapshot["name"] for snapshot in server.snapshots()] if server else []))
+            seed_list.setCurrentText(modules.get(module_name, {}).get("seed_snapshot") or "")
+            seed_list.blockSignals(False)
+
+    def database_server(self, module_name):
+        """Запущенный сервер модуля или новый объект для выбранной версии; None - версия не выбрана."""
+        running = {"mysql": self.mysql, "postgresql": self.postgresql, "redis": self.redis, "mongodb": self.mongodb}
+        if running.get(module_name):
+            return running[module_name]
+        config = load_config()
+        options = config["modules"].get(module_name, {})
+        if not options.get("version"):
+            return None
+        server_class, get_path = {"mysql": (MySQL, get_mysql_path), "postgresql": (Postgresql, get_postgresql_path),
+                                  "redis": (Redis, get_redis_path), "mongodb": (MongoDB, get_mongodb_path)}[module_name]
+        return server_class(get_path(options["version"]), PERESVET_PATH, options, config.get("tuning"))
+
+    def show_snapshots(self, module_name):
+        server = self.database_server(module_name) if module_name else None
+        self.snapshot_list.clear()
+        self.snapshot_list.addItems([snapshot["name"] for snapshot in reversed(server.snapshots())] if server else [])
+
+    def snapshot_action(self, action):
+        """Снимает, восстанавливает или удаляет снимок в фоновом потоке: копирование большого каталога данных
+        не должно замораживать окно. Итог приходит сигналом snapshot_finished."""
+        module_name = self.snapshot_service_list.currentText()
+        name = self.snapshot_list.currentText().strip()
+        server = self.database_server(module_name) if module_name else None
+        if not server or not name:
+            return
+        self.set_snapshot_buttons_enabled(False)
+        threading.Thread(target=self.run_snapshot_action, args=(server, module_name, action, name),
+                         name=f"snapshot-{module_name}", daemon=True).start()
+
+    def run_snapshot_action(self, server, module_name, action, name):
+        """Выполняется в фоновом потоке. Работающий сервер на время операции останавливается
+        и запускается снова."""
+        was_running = server.is_running and action != "delete"
+        started = time.monotonic()
+        message = error = ""
+        try:
+            if was_running:
+                # данные эфемерного сервера нужны для снимка и после перезапуска
+                server.stop(discard=False)
+            if action == "create":
+                snapshot = server.snapshot(name)
+                message = f"Снимок {name} ({snapshot['method']}) создан"
+            elif action == "restore":
+                server.restore(name)
+                message = f"{server.title} возвращён к снимку {name}"
+            else:
+                server.delete_snapshot(name)
+                message = f"Снимок {name} удалён"
+            message += f" за {time.monotonic() - started:.1f} с"
+        except Exception as e:
+            traceback.print_exc()
+            error = str(e)
+        try:
+            if was_running and not server.is_running:
+                server.run()
+        except Exception:
+            traceback.print_exc()
+        self.snapshot_finished.emit(module_name, name if action != "delete" else "", message, error)
+
+    def show_snapshot_result(self, module_name, name, message, error):
+        self.set_snapshot_buttons_enabled(True)
+        if error:
+            QMessageBox.warning(self, "Снимки БД", error)
+        else:
+            QMessageBox.information(self, "Снимки БД", message)
+        self.show_snapshots(module_name)
+        self.show_seed_snapshots()
+        self.snapshot_list.setCurrentText(name)
+
+    def set_snapshot_buttons_enabled(self, enabled):
+        # вторая операция над тем же каталогом данных, пока идёт первая, испортила бы его
+        for widget in (self.snapshot_create, self.snapshot_restore, self.snapshot_delete, self.snapshot_service_list):
+            widget.setEnabled(enabled)
 
     def update_checkbox(self, module_name, state, combo_boxes: [QComboBox], combo_names: [str]):
         for i, combo_box in enumerate(combo_boxes):
@@ -390,13 +656,51 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
         else:
             self.server_type.setText("Веб-сервер отключён")
 
+    def update_services_status(self):
+        services = {"MySQL": self.mysql, "PostgreSQL": self.postgresql,
+                    "Пул PostgreSQL": self.postgresql and self.postgresql.pooler, "Redis": self.redis,
+                    "MongoDB": self.mongodb}
+        lines = [f"{name}{' (в памяти)' if getattr(service, 'ephemeral', False) else ''}: "
+                 f"{SERVICE_STATE_TITLES[service.status()]}" for name, service in services.items() if service]
+        if self.ephemeral_servers():
+            lines.append("Данные в памяти удалятся при остановке")
+        self.services_status.setText("\n".join(lines))
+
+    def ephemeral_servers(self):
+        return [server.title for server in (self.mysql, self.postgresql, self.redis) if server and server.ephemeral]
+
+    def get_php_options(self, modules):
+        """Настройки PHP из конфигурации; с включённым Redis сессии PHP хранятся в нём."""
+        if not self.redis:
+            return modules["php"]
+        return {**modules["php"], "redis_session": self.redis.session_save_path()}
+
     def run_server(self):
+        if self.stop_thread and self.stop_thread.is_alive():
+            QMessageBox.information(self, "Пересвет", "Сервер ещё останавливается, запустите его чуть позже.")
+            return
         config = load_config()
         modules = config["modules"]
+        if modules["postgresql"]["is_active"] and modules["postgresql"]["version"]:
+            # процессы PHP наследуют окружение панели: pgsql и pdo_pgsql без явного адреса подключатся к пулу
+            server_port = config.get("tuning", {}).get("postgresql", {}).get("port", POSTGRESQL_PORT)
+            set_postgresql_environment(PGPOOL_PORT if modules["postgresql"].get("pooler") else server_port)
+        # Redis запускается раньше PHP: сессии и объектный кэш сайтов настраиваются на его адрес
+        if modules["redis"]["is_active"] and modules["redis"]["version"]:
+            self.redis = Redis(get_redis_path(modules["redis"]["version"]), PERESVET_PATH,
+                               redis_options=modules["redis"], tuning_overrides=config.get("tuning"))
+            set_redis_environment(self.redis.port, self.redis.socket_path)
+            try:
+                self.redis.run()
+            except:
+                traceback.print_exc()
+
         if modules["apache"]["is_active"] and not modules["nginx"]["is_active"] and modules["php"]["version"]:
             apache_path = os.path.join(PERESVET_PATH, "bin", "apache", modules["apache"]["version"], "Apache24")
             php_path = os.path.join(PERESVET_PATH, "bin", "php", modules["php"]["version"])
-            self.apache = ApachePHP(apache_path, php_path, PERESVET_PATH)
+            self.apache = ApachePHP(apache_path, php_path, PERESVET_PATH,
+                                    php_options=self.get_php_options(modules), site_php=get_site_php(config),
+                                    tuning_overrides=config.get("tuning"))
             try:
                 self.apache.run()
             except:
@@ -405,7 +709,9 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
             nginx_v = modules["nginx"]["version"]
             nginx_path = os.path.join(PERESVET_PATH, "bin", "nginx", nginx_v, f"nginx-{nginx_v}")
             php_path = os.path.join(PERESVET_PATH, "bin", "php", modules["php"]["version"])
-            self.nginx = NginxPHP(nginx_path, php_path, PERESVET_PATH)
+            self.nginx = NginxPHP(nginx_path, php_path, PERESVET_PATH,
+                                  php_options=self.get_php_options(modules), site_php=get_site_php(config),
+                                  tuning_overrides=config.get("tuning"), nginx_options=modules["nginx"])
             try:
                 self.nginx.run()
             except:
@@ -416,23 +722,68 @@ class PeresvetPanel(QMainWindow, Ui_Peresvet):
             nginx_path = os.path.join(PERESVET_PATH, "bin", "nginx", nginx_v, f"nginx-{nginx_v}")
             php_path = os.path.join(PERESVET_PATH, "bin", "php", modules["php"]["version"])
 
-            self.hybrid = HybridServer(apache_path, nginx_path, php_path, PERESVET_PATH)
+            self.hybrid = HybridServer(apache_path, nginx_path, php_path, PERESVET_PATH,
+                                       php_options=self.get_php_options(modules), site_php=get_site_php(config),
+                                       tuning_overrides=config.get("tuning"))
             try:
                 self.hybrid.run()
             except:
                 traceback.print_exc()
 
+        if modules["mysql"]["is_active"] and modules["mysql"]["version"]:
+            self.mysql = MySQL(get_mysql_path(modules["mysql"]["version"]), PERESVET_PATH,
+                               mysql_options=modules["mysql"], tuning_overrides=config.get("tuning"))
+            try:
+                self.mysql.run()
+            except:
+                traceback.print_exc()
+
+        if modules["postgresql"]["is_active"] and modules["postgresql"]["version"]:
+            self.postgresql = Postgresql(get_postgresql_path(modules["postgresql"]["version"]), PERESVET_PATH,
+                                         postgresql_options=modules["postgresql"],
+                                         tuning_overrides=config.get("tuning"))
+            try:
+                self.postgresql.run()
+            except:
+                traceback.print_exc()
+
+        if modules["mongodb"]["is_active"] and modules["mongodb"]["version"]:
+            self.mongodb = MongoDB(get_mongodb_path(modules["mongodb"]["version"]), PERESVET_PATH,
+                                   mongodb_options=modules["mongodb"], tuning_overrides=config.get("tuning"))
+            try:
+                self.mongodb.run()
+            except:
+                traceback.print_exc()
+
     def stop_server(self):
-        self.apache.stop() if self.apache else None
-        self.nginx.stop() if self.nginx else None
-        self.hybrid.stop() if self.hybrid else None
+        ephemeral = self.ephemeral_servers()
+        if ephemeral and QMessageBox.question(
+                self, "Данные в памяти", f"Данные {', '.join(ephemeral)} хранятся в памяти и будут удалены. "
+                                         f"Остановить сервер?") != QMessageBox.Yes:
+            return
+        self.wait_reload()
+        servers = [self.apache, self.nginx, self.hybrid, self.mysql, self.postgresql, self.redis, self.mongodb]
+        self.apache = self.nginx = self.hybrid = self.mysql = self.postgresql = self.redis = self.mongodb = None
+        # СУБД дожидаются завершения запуска и закрытия порта до stop_timeout секунд: окно при этом не замирает
+        self.stop_thread = threading.Thread(target=self.stop_servers, args=(servers,), name="stop-servers",
+                                            daemon=True)
+        self.stop_thread.start()
+
+    @staticmethod
+    def stop_servers(servers):
+        for server in servers:
+            try:
+                server.stop() if server else None
+            except:
+                traceback.print_exc()
         PHP.stop_php()
 
     def closeEvent(self, event):
-        self.apache.stop() if self.apache else None
-        self.nginx.stop() if self.nginx else None
-        self.hybrid.stop() if self.hybrid else None
-        PHP.stop_php()
+        self.wait_reload()
+        if self.stop_thread:
+            self.stop_thread.join()
+        self.stop_servers([self.apache, self.nginx, self.hybrid, self.mysql, self.postgresql, self.redis,
+                           self.mongodb])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,341 @@
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from panel.modules_manager import ApachePHP, NginxPHP, PGPOOL_PORT, PG_PROTOCOL_VERSION, Postgresql, Redis, \
+    pg_message, purge_fastcgi_cache, wait_for_address, wait_for_port
+
+PERESVET_PATH = os.path.dirname(os.path.abspath(sys.argv[0]))
+BENCH_SITE = ".peresvet_bench"
+
+
+def latency_stats(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+    }
+
+
+def run_load(host, port, path, requests=2000, concurrency=8, method="GET", headers=None):
+    """Нагружает сервер по keep-alive соединениям и возвращает задержки и пропускную способность."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+
+    def worker():
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        local = []
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            for retry in (False, True):
+                try:
+                    connection.request(method, path, headers=headers or {})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 500:
+                        raise http.client.HTTPException(f"HTTP {response.status}")
+                    local.append(time.perf_counter() - started)
+                    break
+                except (OSError, http.client.HTTPException) as error:
+                    connection.close()
+                    connection = http.client.HTTPConnection(host, port, timeout=10)
+                    # сервер закрыл простаивающее keep-alive соединение (например, при reload),
+                    # браузеры в этом случае молча повторяют запрос
+                    if not retry and isinstance(error, (ConnectionResetError, BrokenPipeError)):
+                        continue
+                    with lock:
+                        errors[0] += 1
+                    break
+        connection.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return latency_stats(latencies, errors[0], elapsed)
+
+
+def run_sessions(session, requests=2000, concurrency=8):
+    """Выполняет session() в нескольких потоках и возвращает задержки в том же виде, что и run_load."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+
+    def worker():
+        local = []
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                session()
+                local.append(time.perf_counter() - started)
+            except (OSError, RuntimeError):
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return latency_stats(latencies, errors[0], elapsed)
+
+
+def pg_read_until_ready(connection):
+    buffer = b""
+    while True:
+        while len(buffer) >= 5:
+            length = int.from_bytes(buffer[1:5], "big") + 1
+            if len(buffer) < length:
+                break
+            kind, buffer = buffer[:1], buffer[length:]
+            if kind == b"E":
+                raise RuntimeError("PostgreSQL вернул ошибку")
+            if kind == b"Z":
+                return
+        chunk = connection.recv(65536)
+        if not chunk:
+            raise ConnectionError("PostgreSQL закрыл соединение")
+        buffer += chunk
+
+
+def pg_short_session(port, query="SELECT 1", user="postgres", database="postgres"):
+    """Подключается, выполняет один запрос и отключается, как PHP-скрипт за время одного HTTP-запроса."""
+    parameters = f"user\0{user}\0database\0{database}\0\0".encode()
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as connection:
+        connection.sendall((8 + len(parameters)).to_bytes(4, "big") + PG_PROTOCOL_VERSION.to_bytes(4, "big") +
+                           parameters)
+        pg_read_until_ready(connection)
+        connection.sendall(pg_message(b"Q", query.encode() + b"\0"))
+        pg_read_until_ready(connection)
+        connection.sendall(pg_message(b"X"))
+
+
+def print_results(title, results):
+    print(title)
+    print(f"{'вариант':<24}{'req/s':>10}{'mean, ms':>10}{'p50, ms':>10}{'p95, ms':>10}{'ошибки':>8}")
+    for name, stats in results.items():
+        print(f"{name:<24}{stats['rps']:>10.1f}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['errors']:>8}")
+
+
+def create_bench_site(project_path, files):
+    site_path = os.path.join(project_path, "sites", BENCH_SITE)
+    os.makedirs(site_path, exist_ok=True)
+    for name, content in files.items():
+        with open(os.path.join(site_path, name), "w", encoding="utf-8") as bench_file:
+            bench_file.write(content)
+    return site_path
+
+
+def nginx_php(args, tuning_overrides=None, nginx_options=None, php_options=None):
+    nginx_path = os.path.join(args.project, "bin", "nginx", args.nginx, f"nginx-{args.nginx}")
+    php_path = os.path.join(args.project, "bin", "php", args.php)
+    return NginxPHP(nginx_path, php_path, args.project, php_options={"workers": args.workers, **(php_options or {})},
+                    tuning_overrides=tuning_overrides, nginx_options=nginx_options)
+
+
+def measure_nginx(args, name, path, tuning_overrides=None, nginx_options=None, php_options=None, **load_options):
+    server = nginx_php(args, tuning_overrides, nginx_options, php_options)
+    server.run()
+    try:
+        if not wait_for_port("127.0.0.1", 80):
+            raise RuntimeError("nginx не начал принимать соединения")
+        for address in server.pool.addresses:
+            wait_for_address(address)
+        run_load("127.0.0.1", 80, path, requests=args.warmup, concurrency=args.concurrency, **load_options)
+        return run_load("127.0.0.1", 80, path, requests=args.requests, concurrency=args.concurrency,
+                        **load_options)
+    finally:
+        server.stop()
+        time.sleep(1)
+        print(f"{name}: готово")
+
+
+def measure_apache(args, handler, path):
+    apache_path = os.path.join(args.project, "bin", "apache", args.apache, "Apache24")
+    php_path = os.path.join(args.project, "bin", "php", args.php)
+    server = ApachePHP(apache_path, php_path, args.project, php_options={"workers": args.workers, "handler": handler})
+    server.run()
+    try:
+        if not wait_for_port("127.0.0.1", 80):
+            raise RuntimeError("Apache не начал принимать соединения")
+        if server.uses_pools() and not server.pool.wait_ready():
+            raise RuntimeError("пул php-cgi не ответил на проверку FastCGI")
+        run_load("127.0.0.1", 80, path, requests=args.warmup, concurrency=args.concurrency)
+        return run_load("127.0.0.1", 80, path, requests=args.requests, concurrency=args.concurrency)
+    finally:
+        server.stop()
+        time.sleep(1)
+        print(f"{handler}: готово")
+
+
+def run_load_during(args, path, action, delay=1.0):
+    """Нагружает сервер и через delay секунд выполняет action, например перезапуск."""
+    results = {}
+    load = threading.Thread(target=lambda: results.update(
+        run_load("127.0.0.1", 80, path, requests=args.requests, concurrency=args.concurrency)))
+    load.start()
+    time.sleep(delay)
+    action()
+    load.join()
+    return results
+
+
+def bench_reload(args):
+    # запрос длиннее пары миллисекунд, чтобы перезапуск попадал на незавершённые запросы
+    site_path = create_bench_site(args.project, {"slow.php": "<?php usleep(20000); echo 'ok';"})
+    path = f"/{BENCH_SITE}/slow.php"
+    server = nginx_php(args)
+    server.run()
+    try:
+        if not wait_for_port("127.0.0.1", 80):
+            raise RuntimeError("nginx не начал принимать соединения")
+        run_load("127.0.0.1", 80, path, requests=args.warmup, concurrency=args.concurrency)
+        results = {
+            "stop + run": run_load_during(args, path, lambda: (server.stop(), server.run())),
+            "nginx -s reload": run_load_during(args, path, server.reload_nginx),
+            "замена php-cgi": run_load_during(args, path, server.reload_php),
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(site_path, ignore_errors=True)
+    print_results("Потерянные запросы при перезапуске под нагрузкой", results)
+
+
+def bench_fastcgi_keepalive(args):
+    site_path = create_bench_site(args.project, {"hello.php": "<?php echo 'ok';"})
+    path = f"/{BENCH_SITE}/hello.php"
+    try:
+        results = {
+            "fastcgi_keep_conn off": measure_nginx(args, "off", path, {"nginx": {"fastcgi_keep_conn": "off"}}),
+            "fastcgi_keep_conn on": measure_nginx(args, "on", path, {"nginx": {"fastcgi_keep_conn": "on"}}),
+        }
+    finally:
+        shutil.rmtree(site_path, ignore_errors=True)
+    print_results("Задержка маленьких PHP-ответов через nginx", results)
+
+
+def bench_microcache(args):
+    # страница с небольшой нагрузкой на PHP, одинаковая для всех посетителей
+    site_path = create_bench_site(args.project, {
+        "page.php": "<?php usleep(5000); echo str_repeat('<p>Пересвет</p>', 200);"
+    })
+    path = f"/{BENCH_SITE}/page.php"
+    try:
+        results = {
+            "без микрокэша": measure_nginx(args, "off", path, nginx_options={"microcache": False}),
+            "микрокэш 1s": measure_nginx(args, "on", path, nginx_options={"microcache": True,
+                                                                          "microcache_ttl": "1s"}),
+        }
+        purge_fastcgi_cache(os.path.join(args.project, "userdata", "nginx_cache"))
+    finally:
+        shutil.rmtree(site_path, ignore_errors=True)
+    print_results("Пропускная способность PHP-страницы с микрокэшем и без", results)
+
+
+def bench_apache_php(args):
+    site_path = create_bench_site(args.project, {"hello.php": "<?php echo 'ok';"})
+    path = f"/{BENCH_SITE}/hello.php"
+    try:
+        results = {
+            "mod_php": measure_apache(args, "module", path),
+            "mod_proxy_fcgi + пул": measure_apache(args, "fastcgi", path),
+        }
+    finally:
+        shutil.rmtree(site_path, ignore_errors=True)
+    print_results("PHP внутри Apache и через пул php-cgi", results)
+
+
+def bench_pgpool(args):
+    postgresql_path = os.path.join(args.project, "bin", "postgresql", args.postgresql, "pgsql")
+    server = Postgresql(postgresql_path, args.project,
+                        postgresql_options={"pooler": True, "pool_size": args.pool_size})
+    server.run()
+    try:
+        # первый запуск может включать initdb
+        if not server.wait_ready(300) or not server.pooler.wait_ready(10):
+            raise RuntimeError("PostgreSQL или пул соединений не начали принимать подключения")
+        results = {}
+        for name, port in ((f"напрямую :{server.port}", server.port), (f"через пул :{PGPOOL_PORT}", PGPOOL_PORT)):
+            run_sessions(lambda: pg_short_session(port), requests=args.warmup, concurrency=args.concurrency)
+            results[name] = run_sessions(lambda: pg_short_session(port), requests=args.requests,
+                                         concurrency=args.concurrency)
+            print(f"{name}: готово")
+    finally:
+        server.stop()
+    print_results("Короткие подключения к PostgreSQL (подключение, SELECT 1, отключение)", results)
+
+
+def bench_sessions(args):
+    # все запросы идут с одной сессией, как AJAX-запросы открытой страницы
+    site_path = create_bench_site(args.project, {
+        "session.php": "<?php session_start(); $_SESSION['hits'] = ($_SESSION['hits'] ?? 0) + 1; "
+                       "usleep(5000); echo $_SESSION['hits'];"
+    })
+    path = f"/{BENCH_SITE}/session.php"
+    headers = {"Cookie": "PHPSESSID=peresvetbench"}
+    redis = Redis(os.path.join(args.project, "bin", "redis", args.redis), args.project)
+    redis.run()
+    try:
+        if not redis.wait_ready(30):
+            raise RuntimeError("Redis не начал принимать подключения")
+        results = {
+            "Redis": measure_nginx(args, "redis", path, php_options={"redis_session": redis.session_save_path()},
+                                   headers=headers),
+            # последним, чтобы php.ini остался с файловыми сессиями, как до замера
+            "файлы": measure_nginx(args, "files", path, headers=headers),
+        }
+    finally:
+        redis.stop()
+        shutil.rmtree(site_path, ignore_errors=True)
+    print_results("PHP-сессии в файлах и в Redis под параллельными запросами одного пользователя", results)
+
+
+SCENARIOS = {
+    "apache-php": bench_apache_php,
+    "fastcgi-keepalive": bench_fastcgi_keepalive,
+    "microcache": bench_microcache,
+    "pgpool": bench_pgpool,
+    "reload": bench_reload,
+    "sessions": bench_sessions,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности стека Пересвет")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--project", default=PERESVET_PATH)
+    parser.add_argument("--nginx", help="версия nginx из bin/nginx")
+    parser.add_argument("--apache", help="версия Apache из bin/apache")
+    parser.add_argument("--php", help="версия PHP из bin/php")
+    parser.add_argument("--postgresql", help="версия PostgreSQL из bin/postgresql")
+    parser.add_argument("--redis", help="версия Redis из bin/redis")
+    parser.add_argument("--pool-size", type=int, default=20, help="соединений пула PostgreSQL с сервером")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    arguments = parser.parse_args()
+    SCENARIOS[arguments.scenario](arguments)
@@ -141,6 +141,30 @@ class Ui_Peresvet(object):
         self.icon1.setGeometry(QtCore.QRect(590, 370, 91, 91))
         self.icon1.setText("")
         self.icon1.setObjectName("icon1")
+        self.label_26 = QtWidgets.QLabel(self.tab)
+        self.label_26.setGeometry(QtCore.QRect(240, 20, 161, 41))
+        font = QtGui.QFont()
+        font.setFamily("Molodo-font")
+        font.setPointSize(14)
+        self.label_26.setFont(font)
+        self.label_26.setStyleSheet("border-radius: 10px;")
+        self.label_26.setObjectName("label_26")
+        self.snapshot_service_list = QtWidgets.QComboBox(self.tab)
+        self.snapshot_service_list.setGeometry(QtCore.QRect(250, 70, 151, 25))
+        self.snapshot_service_list.setObjectName("snapshot_service_list")
+        self.snapshot_list = QtWidgets.QComboBox(self.tab)
+        self.snapshot_list.setGeometry(QtCore.QRect(410, 70, 161, 25))
+        self.snapshot_list.setEditable(True)
+        self.snapshot_list.setObjectName("snapshot_list")
+        self.snapshot_create = QtWidgets.QPushButton(self.tab)
+        self.snapshot_create.setGeometry(QtCore.QRect(250, 105, 101, 31))
+        self.snapshot_create.setObjectName("snapshot_create")
+        self.snapshot_restore = QtWidgets.QPushButton(self.tab)
+        self.snapshot_restore.setGeometry(QtCore.QRect(360, 105, 101, 31))
+        self.snapshot_restore.setObjectName("snapshot_restore")
+        self.snapshot_delete = QtWidgets.QPushButton(self.tab)
+        self.snapshot_delete.setGeometry(QtCore.QRect(470, 105, 101, 31))
+        self.snapshot_delete.setObjectName("snapshot_delete")
         self.tabWidget.addTab(self.tab, "")
         self.tab_2 = QtWidgets.QWidget()
         self.tab_2.setObjectName("tab_2")
@@ -293,7 +317,194 @@ class Ui_Peresvet(object):
         self.server_type_6.setGeometry(QtCore.QRect(30, 350, 201, 21))
         self.server_type_6.setStyleSheet("border-radius: 3px;")
         self.server_type_6.setObjectName("server_type_6")
+        self.mongodb_list = QtWidgets.QComboBox(self.tab_2)
+        self.mongodb_list.setGeometry(QtCore.QRect(30, 420, 201, 25))
+        self.mongodb_list.setObjectName("mongodb_list")
+        self.mongodb_checkbox = QtWidgets.QCheckBox(self.tab_2)
+        self.mongodb_checkbox.setGeometry(QtCore.QRect(240, 420, 121, 25))
+        self.mongodb_checkbox.setStyleSheet("QCheckBox::indicator {\n"
+"    width:  25px;\n"
+"    height: 25px;\n"
+"}\n"
+"QCheckBox::indicator:checked {\n"
+"    image: url(images/checkbox_active.png);\n"
+"}\n"
+"QCheckBox::indicator:unchecked  {\n"
+"    image: url(images/checkbox_deactive.png);\n"
+"}\n"
+"QCheckBox::indicator:disabled  {\n"
+"    image: url(images/checkbox_disabled.png);\n"
+"}")
+        self.mongodb_checkbox.setText("")
+        self.mongodb_checkbox.setObjectName("mongodb_checkbox")
+        self.server_type_7 = QtWidgets.QLabel(self.tab_2)
+        self.server_type_7.setGeometry(QtCore.QRect(30, 400, 201, 21))
+        self.server_type_7.setStyleSheet("border-radius: 3px;")
+        self.server_type_7.setObjectName("server_type_7")
+        self.label_27 = QtWidgets.QLabel(self.tab_2)
+        self.label_27.setGeometry(QtCore.QRect(370, 245, 211, 21))
+        self.label_27.setStyleSheet("border-radius: 3px;")
+        self.label_27.setObjectName("label_27")
+        self.postgresql_ephemeral = QtWidgets.QCheckBox(self.tab_2)
+        self.postgresql_ephemeral.setGeometry(QtCore.QRect(370, 270, 101, 25))
+        self.postgresql_ephemeral.setObjectName("postgresql_ephemeral")
+        self.postgresql_seed = QtWidgets.QComboBox(self.tab_2)
+        self.postgresql_seed.setGeometry(QtCore.QRect(480, 270, 101, 25))
+        self.postgresql_seed.setObjectName("postgresql_seed")
+        self.mysql_ephemeral = QtWidgets.QCheckBox(self.tab_2)
+        self.mysql_ephemeral.setGeometry(QtCore.QRect(370, 320, 101, 25))
+        self.mysql_ephemeral.setObjectName("mysql_ephemeral")
+        self.mysql_seed = QtWidgets.QComboBox(self.tab_2)
+        self.mysql_seed.setGeometry(QtCore.QRect(480, 320, 101, 25))
+        self.mysql_seed.setObjectName("mysql_seed")
+        self.redis_ephemeral = QtWidgets.QCheckBox(self.tab_2)
+        self.redis_ephemeral.setGeometry(QtCore.QRect(370, 370, 101, 25))
+        self.redis_ephemeral.setObjectName("redis_ephemeral")
+        self.redis_seed = QtWidgets.QComboBox(self.tab_2)
+        self.redis_seed.setGeometry(QtCore.QRect(480, 370, 101, 25))
+        self.redis_seed.setObjectName("redis_seed")
         self.tabWidget.addTab(self.tab_2, "")
+        self.tab_3 = QtWidgets.QWidget()
+        self.tab_3.setObjectName("tab_3")
+        self.label_11 = QtWidgets.QLabel(self.tab_3)
+        self.label_11.setGeometry(QtCore.QRect(20, 20, 201, 21))
+        font = QtGui.QFont()
+        font.setPointSize(10)
+        self.label_11.setFont(font)
+        self.label_11.setStyleSheet("border-radius: 3px;")
+        self.label_11.setObjectName("label_11")
+        self.label_12 = QtWidgets.QLabel(self.tab_3)
+        self.label_12.setGeometry(QtCore.QRect(30, 50, 201, 21))
+        self.label_12.setStyleSheet("border-radius: 3px;")
+        self.label_12.setObjectName("label_12")
+        self.php_workers = QtWidgets.QSpinBox(self.tab_3)
+        self.php_workers.setGeometry(QtCore.QRect(240, 50, 101, 25))
+        self.php_workers.setMaximum(64)
+        self.php_workers.setObjectName("php_workers")
+        self.label_13 = QtWidgets.QLabel(self.tab_3)
+        self.label_13.setGeometry(QtCore.QRect(30, 80, 201, 21))
+        self.label_13.setStyleSheet("border-radius: 3px;")
+        self.label_13.setObjectName("label_13")
+        self.php_max_requests = QtWidgets.QSpinBox(self.tab_3)
+        self.php_max_requests.setGeometry(QtCore.QRect(240, 80, 101, 25))
+        self.php_max_requests.setMaximum(100000)
+        self.php_max_requests.setSingleStep(100)
+        self.php_max_requests.setObjectName("php_max_requests")
+        self.label_14 = QtWidgets.QLabel(self.tab_3)
+        self.label_14.setGeometry(QtCore.QRect(30, 110, 201, 21))
+        self.label_14.setStyleSheet("border-radius: 3px;")
+        self.label_14.setObjectName("label_14")
+        self.php_max_memory = QtWidgets.QSpinBox(self.tab_3)
+        self.php_max_memory.setGeometry(QtCore.QRect(240, 110, 101, 25))
+        self.php_max_memory.setMaximum(8192)
+        self.php_max_memory.setSingleStep(64)
+        self.php_max_memory.setObjectName("php_max_memory")
+        self.label_15 = QtWidgets.QLabel(self.tab_3)
+        self.label_15.setGeometry(QtCore.QRect(20, 150, 201, 21))
+        font = QtGui.QFont()
+        font.setPointSize(10)
+        self.label_15.setFont(font)
+        self.label_15.setStyleSheet("border-radius: 3px;")
+        self.label_15.setObjectName("label_15")
+        self.site_list = QtWidgets.QComboBox(self.tab_3)
+        self.site_list.setGeometry(QtCore.QRect(30, 180, 201, 25))
+        self.site_list.setObjectName("site_list")
+        self.site_php_list = QtWidgets.QComboBox(self.tab_3)
+        self.site_php_list.setGeometry(QtCore.QRect(240, 180, 101, 25))
+        self.site_php_list.setObjectName("site_php_list")
+        self.label_16 = QtWidgets.QLabel(self.tab_3)
+        self.label_16.setGeometry(QtCore.QRect(370, 50, 151, 21))
+        self.label_16.setStyleSheet("border-radius: 3px;")
+        self.label_16.setObjectName("label_16")
+        self.ini_profile_list = QtWidgets.QComboBox(self.tab_3)
+        self.ini_profile_list.setGeometry(QtCore.QRect(530, 50, 131, 25))
+        self.ini_profile_list.setObjectName("ini_profile_list")
+        self.label_17 = QtWidgets.QLabel(self.tab_3)
+        self.label_17.setGeometry(QtCore.QRect(370, 90, 291, 21))
+        self.label_17.setStyleSheet("border-radius: 3px;")
+        self.label_17.setObjectName("label_17")
+        self.nginx_directive_list = QtWidgets.QComboBox(self.tab_3)
+        self.nginx_directive_list.setGeometry(QtCore.QRect(370, 115, 151, 25))
+        self.nginx_directive_list.setObjectName("nginx_directive_list")
+        self.nginx_directive_value = QtWidgets.QLineEdit(self.tab_3)
+        self.nginx_directive_value.setGeometry(QtCore.QRect(530, 115, 131, 25))
+        self.nginx_directive_value.setObjectName("nginx_directive_value")
+        self.label_18 = QtWidgets.QLabel(self.tab_3)
+        self.label_18.setGeometry(QtCore.QRect(20, 230, 201, 21))
+        font = QtGui.QFont()
+        font.setPointSize(10)
+        self.label_18.setFont(font)
+        self.label_18.setStyleSheet("border-radius: 3px;")
+        self.label_18.setObjectName("label_18")
+        self.microcache_checkbox = QtWidgets.QCheckBox(self.tab_3)
+        self.microcache_checkbox.setGeometry(QtCore.QRect(30, 260, 201, 25))
+        self.microcache_checkbox.setObjectName("microcache_checkbox")
+        self.purge_prefix = QtWidgets.QLineEdit(self.tab_3)
+        self.purge_prefix.setGeometry(QtCore.QRect(30, 290, 201, 25))
+        self.purge_prefix.setObjectName("purge_prefix")
+        self.purge_cache = QtWidgets.QPushButton(self.tab_3)
+        self.purge_cache.setGeometry(QtCore.QRect(240, 290, 101, 25))
+        self.purge_cache.setObjectName("purge_cache")
+        self.label_19 = QtWidgets.QLabel(self.tab_3)
+        self.label_19.setGeometry(QtCore.QRect(370, 150, 291, 21))
+        self.label_19.setStyleSheet("border-radius: 3px;")
+        self.label_19.setObjectName("label_19")
+        self.apache_directive_list = QtWidgets.QComboBox(self.tab_3)
+        self.apache_directive_list.setGeometry(QtCore.QRect(370, 175, 151, 25))
+        self.apache_directive_list.setObjectName("apache_directive_list")
+        self.apache_directive_value = QtWidgets.QLineEdit(self.tab_3)
+        self.apache_directive_value.setGeometry(QtCore.QRect(530, 175, 131, 25))
+        self.apache_directive_value.setObjectName("apache_directive_value")
+        self.label_20 = QtWidgets.QLabel(self.tab_3)
+        self.label_20.setGeometry(QtCore.QRect(370, 210, 151, 21))
+        self.label_20.setStyleSheet("border-radius: 3px;")
+        self.label_20.setObjectName("label_20")
+        self.php_handler_list = QtWidgets.QComboBox(self.tab_3)
+        self.php_handler_list.setGeometry(QtCore.QRect(530, 210, 131, 25))
+        self.php_handler_list.setObjectName("php_handler_list")
+        self.label_22 = QtWidgets.QLabel(self.tab_3)
+        self.label_22.setGeometry(QtCore.QRect(370, 270, 151, 21))
+        self.label_22.setStyleSheet("border-radius: 3px;")
+        self.label_22.setObjectName("label_22")
+        self.mysql_profile_list = QtWidgets.QComboBox(self.tab_3)
+        self.mysql_profile_list.setGeometry(QtCore.QRect(530, 270, 131, 25))
+        self.mysql_profile_list.setObjectName("mysql_profile_list")
+        self.label_23 = QtWidgets.QLabel(self.tab_3)
+        self.label_23.setGeometry(QtCore.QRect(370, 300, 151, 21))
+        self.label_23.setStyleSheet("border-radius: 3px;")
+        self.label_23.setObjectName("label_23")
+        self.postgresql_profile_list = QtWidgets.QComboBox(self.tab_3)
+        self.postgresql_profile_list.setGeometry(QtCore.QRect(530, 300, 131, 25))
+        self.postgresql_profile_list.setObjectName("postgresql_profile_list")
+        self.services_status = QtWidgets.QLabel(self.tab_3)
+        self.services_status.setGeometry(QtCore.QRect(370, 395, 291, 70))
+        self.services_status.setStyleSheet("border-radius: 3px;")
+        self.services_status.setText("")
+        self.services_status.setAlignment(QtCore.Qt.AlignLeading|QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
+        self.services_status.setObjectName("services_status")
+        self.pgpool_checkbox = QtWidgets.QCheckBox(self.tab_3)
+        self.pgpool_checkbox.setGeometry(QtCore.QRect(370, 360, 151, 25))
+        self.pgpool_checkbox.setObjectName("pgpool_checkbox")
+        self.pgpool_size = QtWidgets.QSpinBox(self.tab_3)
+        self.pgpool_size.setGeometry(QtCore.QRect(530, 360, 131, 25))
+        self.pgpool_size.setMinimum(1)
+        self.pgpool_size.setMaximum(500)
+        self.pgpool_size.setObjectName("pgpool_size")
+        self.label_24 = QtWidgets.QLabel(self.tab_3)
+        self.label_24.setGeometry(QtCore.QRect(370, 330, 151, 21))
+        self.label_24.setStyleSheet("border-radius: 3px;")
+        self.label_24.setObjectName("label_24")
+        self.redis_profile_list = QtWidgets.QComboBox(self.tab_3)
+        self.redis_profile_list.setGeometry(QtCore.QRect(530, 330, 131, 25))
+        self.redis_profile_list.setObjectName("redis_profile_list")
+        self.label_25 = QtWidgets.QLabel(self.tab_3)
+        self.label_25.setGeometry(QtCore.QRect(30, 330, 201, 21))
+        self.label_25.setStyleSheet("border-radius: 3px;")
+        self.label_25.setObjectName("label_25")
+        self.mongodb_profile_list = QtWidgets.QComboBox(self.tab_3)
+        self.mongodb_profile_list.setGeometry(QtCore.QRect(240, 330, 101, 25))
+        self.mongodb_profile_list.setObjectName("mongodb_profile_list")
+        self.tabWidget.addTab(self.tab_3, "")
 
         self.retranslateUi(Peresvet)
         self.tabWidget.setCurrentIndex(0)
@@ -312,6 +523,10 @@ class Ui_Peresvet(object):
         self.label.setText(_translate("Peresvet", "phpMyAdmin"))
         self.open_phpmyadmin.setText(_translate("Peresvet", "Открыть"))
         self.label_9.setText(_translate("Peresvet", "Проекты"))
+        self.label_26.setText(_translate("Peresvet", "Снимки БД"))
+        self.snapshot_create.setText(_translate("Peresvet", "Снять"))
+        self.snapshot_restore.setText(_translate("Peresvet", "Восстановить"))
+        self.snapshot_delete.setText(_translate("Peresvet", "Удалить"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab), _translate("Peresvet", "Главная"))
         self.label_3.setText(_translate("Peresvet", "Веб-серверы"))
         self.server_type.setText(_translate("Peresvet", "Выключено"))
@@ -322,7 +537,37 @@ class Ui_Peresvet(object):
         self.server_type_4.setText(_translate("Peresvet", "postgresql"))
         self.server_type_5.setText(_translate("Peresvet", "mysql"))
         self.server_type_6.setText(_translate("Peresvet", "redis"))
+        self.server_type_7.setText(_translate("Peresvet", "mongodb"))
+        self.label_27.setText(_translate("Peresvet", "В памяти | снимок при запуске"))
+        self.postgresql_ephemeral.setToolTip(_translate("Peresvet", "Данные хранятся в памяти без сброса на диск и удаляются при остановке"))
+        self.postgresql_ephemeral.setText(_translate("Peresvet", "в памяти"))
+        self.postgresql_seed.setToolTip(_translate("Peresvet", "Снимок, из которого заполняются данные в памяти при запуске"))
+        self.mysql_ephemeral.setToolTip(_translate("Peresvet", "Данные хранятся в памяти без сброса на диск и удаляются при остановке"))
+        self.mysql_ephemeral.setText(_translate("Peresvet", "в памяти"))
+        self.mysql_seed.setToolTip(_translate("Peresvet", "Снимок, из которого заполняются данные в памяти при запуске"))
+        self.redis_ephemeral.setToolTip(_translate("Peresvet", "Данные хранятся в памяти без сброса на диск и удаляются при остановке"))
+        self.redis_ephemeral.setText(_translate("Peresvet", "в памяти"))
+        self.redis_seed.setToolTip(_translate("Peresvet", "Снимок, из которого заполняются данные в памяти при запуске"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_2), _translate("Peresvet", "Настройки модулей"))
+        self.label_11.setText(_translate("Peresvet", "Пул PHP"))
+        self.label_12.setText(_translate("Peresvet", "Процессов (0 - по числу ядер)"))
+        self.label_13.setText(_translate("Peresvet", "Запросов до перезапуска"))
+        self.label_14.setText(_translate("Peresvet", "Лимит памяти, МБ"))
+        self.label_15.setText(_translate("Peresvet", "PHP для сайтов"))
+        self.label_16.setText(_translate("Peresvet", "Профиль php.ini"))
+        self.label_17.setText(_translate("Peresvet", "Директивы nginx (пусто - авто)"))
+        self.label_18.setText(_translate("Peresvet", "Микрокэш nginx"))
+        self.label_19.setText(_translate("Peresvet", "Директивы Apache (пусто - авто)"))
+        self.label_20.setText(_translate("Peresvet", "PHP в Apache"))
+        self.label_22.setText(_translate("Peresvet", "Профиль MySQL"))
+        self.label_23.setText(_translate("Peresvet", "Профиль PostgreSQL"))
+        self.label_24.setText(_translate("Peresvet", "Профиль Redis"))
+        self.label_25.setText(_translate("Peresvet", "Профиль MongoDB"))
+        self.pgpool_checkbox.setText(_translate("Peresvet", "Пул соединений PG"))
+        self.microcache_checkbox.setText(_translate("Peresvet", "Кэшировать PHP-ответы"))
+        self.purge_prefix.setPlaceholderText(_translate("Peresvet", "/blog или site1/blog"))
+        self.purge_cache.setText(_translate("Peresvet", "Очистить"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_3), _translate("Peresvet", "Производительность"))
 
 
 if __name__ == "__main__":
@@ -1,15 +1,1155 @@
+import asyncio
+import ctypes
+import functools
+import hashlib
+import json
 import shutil
 import subprocess
 import os
 import re
 import logging
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
 import traceback
 
+PHP_POOL_HOST = "127.0.0.1"
+PHP_POOL_BASE_PORT = 9000
+PHP_POOL_PORT_STRIDE = 100
+FCGI_GET_VALUES = 9
+FCGI_GET_VALUES_RESULT = 10
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def version_key(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version))
+
+
+def list_php_versions(php_root):
+    if not os.path.isdir(php_root):
+        return []
+    versions = [item for item in os.listdir(php_root)
+                if os.path.isdir(os.path.join(php_root, item)) and re.search(r"\d+\.\d+\.\d+", item)]
+    return sorted(versions, key=version_key)
+
+
+def php_upstream_name(version):
+    return "php_" + re.sub(r"\W", "_", version)
+
+
+def discover_sites(sites_path):
+    if not os.path.isdir(sites_path):
+        return []
+    return sorted(item for item in os.listdir(sites_path)
+                  if not item.startswith(".") and os.path.isdir(os.path.join(sites_path, item)))
+
+
+SITE_MANIFEST = "peresvet.json"
+
+
+def load_site(sites_path, name):
+    """Описание сайта из папки sites/<name> и необязательного манифеста peresvet.json."""
+    site_path = os.path.join(sites_path, name)
+    manifest = {}
+    manifest_path = os.path.join(site_path, SITE_MANIFEST)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except ValueError:
+            logging.error(f"Некорректный манифест {manifest_path}, используются значения по умолчанию")
+    server_names = manifest.get("server_name") or [name]
+    if isinstance(server_names, str):
+        server_names = server_names.split()
+    return {
+        "name": name,
+        "server_names": server_names,
+        "root": os.path.normpath(os.path.join(site_path, manifest.get("root", "."))),
+        "php": manifest.get("php"),
+    }
+
+
+def load_sites(sites_path):
+    return [load_site(sites_path, name) for name in discover_sites(sites_path)]
+
+
+class ConfigTemplate:
+    """Шаблон конфигурации с подстановками {{ имя }}.
+
+    Текст разбирается один раз при загрузке. Многострочное значение получает отступ строки,
+    в которой стоит подстановка, а строка с пустой подстановкой удаляется целиком.
+    """
+
+    def __init__(self, text):
+        self.parts = []
+        position = 0
+        for match in TEMPLATE_PLACEHOLDER.finditer(text):
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            prefix = text[line_start:match.start()]
+            indent = prefix if prefix.isspace() else ""
+            own_line = (line_start >= position and indent == prefix
+                        and (match.end() == len(text) or text.startswith("\n", match.end())))
+            literal_end = match.start() - len(indent) if own_line else match.start()
+            self.parts.append((text[position:literal_end], match.group(1), indent, own_line))
+            position = match.end()
+        self.tail = text[position:]
+        self.names = {name for _, name, _, _ in self.parts}
+
+    def render(self, context):
+        missing = self.names - context.keys()
+        if missing:
+            raise KeyError(f"Не заданы значения для шаблона: {', '.join(sorted(missing))}")
+        chunks = []
+        skip_newline = False
+        for literal, name, indent, own_line in self.parts:
+            chunks.append(literal[1:] if skip_newline and literal.startswith("\n") else literal)
+            value = str(context[name])
+            skip_newline = own_line and not value
+            if value:
+                lines = value.split("\n")
+                chunks.append((indent if own_line else "") + lines[0])
+                chunks.extend(f"\n{indent}{line}" if line else "\n" for line in lines[1:])
+        chunks.append(self.tail[1:] if skip_newline and self.tail.startswith("\n") else self.tail)
+        return "".join(chunks)
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(name):
+    with open(os.path.join(TEMPLATES_DIR, name), "r", encoding="utf-8") as template_file:
+        return ConfigTemplate(template_file.read().rstrip("\n"))
+
+
+@functools.lru_cache(maxsize=512)
+def _render_cached(name, items):
+    return load_template(name).render(dict(items))
+
+
+def render_template(template, /, **context):
+    """Заполняет шаблон из panel/templates. Одинаковые подстановки берутся из кэша без повторной сборки."""
+    return _render_cached(template, tuple(sorted(context.items())))
+
+
+_written_configs = {}
+
+
+def _file_digest(path):
+    """Хэш файла на диске. Пока размер и время изменения те же, хэш берётся из кэша, а не пересчитывается."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    known = _written_configs.get(path)
+    if known and known[0] == (stat.st_mtime_ns, stat.st_size):
+        return known[1]
+    with open(path, "rb") as config_file:
+        digest = hashlib.sha256(config_file.read()).hexdigest()
+    _written_configs[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+    return digest
+
+
+def write_config(path, content):
+    """Записывает файл, только если изменился хэш содержимого. Возвращает True, если файл перезаписан
+    и серверу нужно перечитать конфигурацию."""
+    data = content.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    if _file_digest(path) == digest:
+        return False
+    # двоичный режим: в Windows текстовый режим заменил бы \n на \r\n и хэш файла не совпал бы с хэшем текста
+    with open(path, "wb") as config_file:
+        config_file.write(data)
+    stat = os.stat(path)
+    _written_configs[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+    return True
+
+
+def sync_fragments(fragment_dir, fragments):
+    """Приводит папку с фрагментами <имя>.conf к переданному набору. Возвращает имена изменённых фрагментов."""
+    os.makedirs(fragment_dir, exist_ok=True)
+    changed = {name for name, content in fragments.items()
+               if write_config(os.path.join(fragment_dir, f"{name}.conf"), content)}
+    for file_name in os.listdir(fragment_dir):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".conf" and name not in fragments:
+            os.remove(os.path.join(fragment_dir, file_name))
+            changed.add(name)
+    return changed
+
+
+def render_apache_vhost(server_names, document_root, port, php_handler=""):
+    aliases = f"ServerAlias {' '.join(server_names[1:])}" if len(server_names) > 1 else ""
+    return render_template("apache_vhost.conf", port=port, server_name=server_names[0], aliases=aliases,
+                           document_root=document_root, php_handler=php_handler)
+
+
+def unix_sockets_supported():
+    # php-cgi для Windows умеет слушать только TCP
+    return os.name != "nt" and hasattr(socket, "AF_UNIX")
+
+
+def open_connection(address, timeout):
+    """Открывает соединение с адресом вида host:port или unix:/путь/к/сокету."""
+    if not address.startswith("unix:"):
+        host, port = address.rsplit(":", 1)
+        return socket.create_connection((host, int(port)), timeout=timeout)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(address[len("unix:"):])
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def wait_for_address(address, timeout=15.0, stop_event=None):
+    """Ждёт, пока адрес начнёт принимать соединения. Установленный stop_event прерывает ожидание."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open_connection(address, timeout=0.5):
+                return True
+        except OSError:
+            if stop_event is not None:
+                if stop_event.wait(0.1):
+                    return False
+            else:
+                time.sleep(0.1)
+    return False
+
+
+def wait_for_port(host, port, timeout=15.0):
+    return wait_for_address(f"{host}:{port}", timeout)
+
+
+def wait_for_address_closed(address, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open_connection(address, timeout=0.2):
+                time.sleep(0.1)
+        except OSError:
+            return True
+    return False
+
+
+def wait_for_port_closed(host, port, timeout=15.0):
+    return wait_for_address_closed(f"{host}:{port}", timeout)
+
+
+def fastcgi_probe(address, timeout=2.0):
+    """Проверяет, что по адресу отвечает FastCGI-сервер: отправляет FCGI_GET_VALUES и ждёт FCGI_GET_VALUES_RESULT.
+    php-cgi не считает такой запрос в PHP_FCGI_MAX_REQUESTS."""
+    name = b"FCGI_MPXS_CONNS"
+    body = bytes([len(name), 0]) + name
+    record = struct.pack("!BBHHBx", 1, FCGI_GET_VALUES, 0, len(body), 0) + body
+    try:
+        with open_connection(address, timeout) as connection:
+            connection.sendall(record)
+            header = connection.recv(8)
+    except OSError:
+        return False
+    return len(header) >= 2 and header[0] == 1 and header[1] == FCGI_GET_VALUES_RESULT
+
+
+def http_probe(host, port, path="/", server_name="localhost", timeout=2.0):
+    """Возвращает HTTP-статус ответа или None, если сервер не ответил."""
+    request = f"HEAD {path} HTTP/1.0\r\nHost: {server_name}\r\n\r\n".encode("ascii")
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as connection:
+            connection.sendall(request)
+            status_line = connection.recv(64).split(b"\r\n", 1)[0].split()
+    except OSError:
+        return None
+    if len(status_line) >= 2 and status_line[1].isdigit():
+        return int(status_line[1])
+    return None
+
+
+def postgresql_probe(address, timeout=1.0, user="postgres"):
+    """Проверяет готовность PostgreSQL так же, как pg_isready: отправляет StartupMessage и смотрит на ответ.
+    Пока идёт восстановление или остановка, сервер отвечает ошибкой 57P03, а не приглашением к аутентификации."""
+    parameters = b"user\0" + user.encode() + b"\0database\0postgres\0\0"
+    startup = struct.pack("!ii", 8 + len(parameters), 196608) + parameters
+    try:
+        with open_connection(address, timeout) as connection:
+            connection.sendall(startup)
+            header = connection.recv(5)
+            if len(header) < 5:
+                return False
+            if header[:1] == b"R":
+                connection.sendall(b"X" + struct.pack("!i", 4))
+                return True
+            if header[:1] != b"E":
+                return False
+            body = b""
+            length = struct.unpack("!i", header[1:5])[0] - 4
+            while len(body) < length:
+                chunk = connection.recv(length - len(body))
+                if not chunk:
+                    break
+                body += chunk
+    except OSError:
+        return False
+    # остальные ошибки (нет роли, базы, неверный пароль) означают, что сервер уже принимает подключения
+    return b"C57P03\0" not in body
+
+
+def mysql_probe(address, timeout=1.0):
+    """Проверяет, что MySQL прислал приветственный пакет протокола 10. Пока InnoDB восстанавливается,
+    mysqld не слушает порт, а отказ в подключении приходит пакетом ошибки 0xFF."""
+    try:
+        with open_connection(address, timeout) as connection:
+            packet = connection.recv(5)
+    except OSError:
+        return False
+    return len(packet) == 5 and packet[4] == 10
+
+
+def redis_probe(address, timeout=1.0):
+    """Отправляет PING. Пока Redis загружает данные с диска, он отвечает -LOADING."""
+    try:
+        with open_connection(address, timeout) as connection:
+            connection.sendall(b"PING\r\n")
+            reply = connection.recv(64)
+    except OSError:
+        return False
+    # с requirepass сервер уже работает, но без AUTH на PING не отвечает
+    return reply.startswith(b"+PONG") or reply.startswith(b"-NOAUTH")
+
+
+def wait_for_service(probe, address, timeout=60.0, process=None, interval=0.05):
+    """Часто опрашивает сервис, пока probe не подтвердит готовность. Если запускающий процесс завершился
+    с ошибкой, ждать дальше бессмысленно и ожидание прерывается сразу."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if probe(address, timeout=min(1.0, max(0.1, deadline - time.monotonic()))):
+            return True
+        if process is not None and process.poll() not in (None, 0):
+            logging.error(f"Процесс запуска {address} завершился с кодом {process.returncode}")
+            return False
+        time.sleep(interval)
+    return False
+
+
+def get_cpu_count():
+    return os.cpu_count() or 1
+
+
+def get_total_memory_mb():
+    try:
+        if os.name == "nt":
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+            return status.ullTotalPhys // (1024 * 1024)
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except Exception:
+        logging.error(f"Не удалось определить объём памяти: {traceback.format_exc()}")
+        return 4096
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def get_process_memory_mb(pid):
+    try:
+        if os.name == "nt":
+            command = f'tasklist /FI "PID eq {pid}" /FO CSV /NH'
+            output = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    text=True).stdout
+            match = re.search(r'"([\d\s,.\xa0]+) K"', output)
+            if match:
+                return int(re.sub(r"\D", "", match.group(1))) // 1024
+        else:
+            with open(f"/proc/{pid}/status", "r") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) // 1024
+    except Exception:
+        logging.error(f"Не удалось получить память процесса {pid}: {traceback.format_exc()}")
+    return None
+
+
+def process_alive(pid):
+    if os.name == "nt":
+        # os.kill в Windows завершает процесс, поэтому проверяется код завершения; 259 - STILL_ACTIVE
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        try:
+            return bool(ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))) and \
+                exit_code.value == 259
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class PHPPool:
+    """Пул процессов php-cgi на последовательных портах с перезапуском по числу запросов и памяти."""
+
+    def __init__(self, php_path, log_file, workers=None, base_port=PHP_POOL_BASE_PORT,
+                 max_requests=500, max_memory_mb=256, check_interval=1.0, reload_front=None, recycle_grace=2.0):
+        self.php_path = php_path
+        self.log_file = log_file
+        self.workers = int(workers) if workers else get_cpu_count()
+        self.base_port = base_port
+        self.max_requests = int(max_requests or 0)
+        self.max_memory_mb = int(max_memory_mb or 0)
+        self.check_interval = check_interval
+        # без reload_front фронтовой сервер не узнает о замене, и процесс сверх лимита памяти завершается сразу
+        self.reload_front = reload_front
+        self.recycle_grace = recycle_grace
+
+        self.processes = {}
+        # индексы процессов, выведенных из upstream на время замены
+        self.down = set()
+        # число дополнительных процессов после workers, которые принимают запросы на время замены
+        self.surge = 0
+        self._lock = threading.Lock()
+        # замену процессов ведёт либо rolling_restart, либо сторож пула, но не оба сразу
+        self._replacing = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watchdog = None
+
+    @property
+    def addresses(self):
+        return [f"{PHP_POOL_HOST}:{self.base_port + index}" for index in range(self.workers + self.surge)]
+
+    def nginx_upstream(self, name="php_pool", keepalive_timeout="2s", nginx_workers=1):
+        # php-cgi обслуживает одно соединение за раз и ждёт на простаивающем keep-alive соединении,
+        # поэтому least_conn отправляет запрос свободному процессу, а короткий таймаут ограничивает
+        # простой при перегрузке, когда на один процесс открыто второе соединение. Пулу из одного процесса
+        # NginxPHP._keep_conn отключает fastcgi_keep_conn.
+        # keepalive - кэш каждого рабочего процесса nginx: в сумме он не должен превышать число php-cgi,
+        # иначе простаивающие соединения займут все процессы пула и новые запросы получат 502
+        return render_template("nginx_upstream.conf", name=name,
+                               servers="\n".join(f"server {address}{' down' if index in self.down else ''};"
+                                                  for index, address in enumerate(self.addresses)),
+                               keepalive=max(1, self.workers // max(1, nginx_workers)),
+                               keepalive_timeout=keepalive_timeout)
+
+    def apache_balancer(self, name="php_pool", ttl=2):
+        # как и в nginx, соединение с php-cgi занимает процесс целиком: max=1 оставляет не больше одного
+        # соединения на процесс, ttl закрывает простаивающее. Повторно использовать соединения можно только
+        # при одном дочернем процессе Apache (mpm_winnt), у prefork каждый процесс держал бы свои.
+        reuse = f" enablereuse=on max=1 ttl={ttl}" if os.name == "nt" else ""
+        # retry=1: процесс, завершившийся по max_requests, сторож пула поднимает за секунду
+        members = []
+        for index, address in enumerate(self.addresses):
+            members.append(f'BalancerMember "fcgi://{address}"{reuse} retry=1{" status=+D" if index in self.down else ""}')
+        return render_template("apache_php_balancer.conf", name=name, members="\n".join(members))
+
+    def start(self):
+        if self.is_running():
+            logging.info("Пул PHP уже запущен.")
+            return
+        self._stop_event.clear()
+        with self._lock:
+            for index in range(self.workers):
+                self._spawn(index)
+        self._watchdog = threading.Thread(target=self._watch, name="php-pool-watchdog", daemon=True)
+        self._watchdog.start()
+        logging.info(f"Пул PHP запущен: {self.workers} процессов, адреса {self.addresses[0]}..{self.addresses[-1]}")
+
+    def stop(self):
+        self._stop_event.set()
+        # сторож может быть в середине замены процесса: пока он не вышел, новый start() поделил бы с ним порты
+        if self._watchdog and self._watchdog is not threading.current_thread():
+            self._watchdog.join()
+        self._watchdog = None
+        with self._lock:
+            for index in list(self.processes):
+                self._terminate(index)
+        logging.info("Пул PHP остановлен.")
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def rolling_restart(self, reload_front, drain_seconds=2.0):
+        """Заменяет процессы пула без потери запросов.
+
+        Половина процессов помечается в upstream как down, фронтовой сервер перечитывает конфигурацию
+        и за drain_seconds дообслуживает начатые на них запросы, после чего процессы заменяются.
+        Затем то же самое делается со второй половиной. reload_front возвращает True при успехе.
+        """
+        if not self.is_running():
+            self.start()
+            return reload_front()
+        with self._replacing:
+            return self._rolling_restart(reload_front, drain_seconds)
+
+    def _rolling_restart(self, reload_front, drain_seconds):
+        surge = self.workers == 1
+        if surge:
+            # единственному процессу не на кого переложить запросы: на время замены поднимается второй
+            with self._lock:
+                self.workers = 2
+                self._spawn(1)
+            groups = [[0], [1]]
+        else:
+            half = self.workers // 2
+            groups = [list(range(half)), list(range(half, self.workers))]
+
+        completed = False
+        try:
+            if surge:
+                wait_for_address(self.addresses[1])
+            for group in groups:
+                self.down = set(group)
+                if not reload_front():
+                    logging.error("Фронтовой сервер не перечитал конфигурацию, замена процессов PHP прервана.")
+                    return False
+                time.sleep(drain_seconds)
+                with self._lock:
+                    for index in group:
+                        self._terminate(index)
+                        if not (surge and index == 1):
+                            self._spawn(index)
+                    if surge and group == [1]:
+                        self.workers = 1
+                for index in group:
+                    if index < self.workers:
+                        wait_for_address(self.addresses[index])
+            completed = True
+        finally:
+            self.down = set()
+            # замена прервана до вывода дополнительного процесса: пул возвращается к одному процессу
+            surge_left = surge and self.workers == 2
+            if surge_left:
+                with self._lock:
+                    self.workers = 1
+            if not completed:
+                # фронтовой сервер мог остаться с процессами, помеченными down, или с дополнительным процессом
+                reload_front()
+            if surge_left:
+                with self._lock:
+                    self._terminate(1)
+        logging.info(f"Процессы пула PHP на {self.addresses[0]}..{self.addresses[-1]} заменены без остановки.")
+        return reload_front()
+
+    def is_running(self):
+        return self._watchdog is not None and self._watchdog.is_alive()
+
+    def wait_ready(self, timeout=15.0):
+        """Ждёт, пока каждый процесс пула начнёт отвечать по протоколу FastCGI."""
+        deadline = time.monotonic() + timeout
+        for address in self.addresses:
+            while not fastcgi_probe(address):
+                if time.monotonic() >= deadline:
+                    logging.error(f"php-cgi на {address} не ответил на проверку FastCGI.")
+                    return False
+                time.sleep(0.1)
+        return True
+
+    def _spawn(self, index):
+        address = self.addresses[index]
+        command = [os.path.join(self.php_path, "php-cgi.exe"), "-b", address]
+        env = dict(os.environ, PHP_FCGI_MAX_REQUESTS=str(self.max_requests), PHP_FCGI_CHILDREN="0")
+        try:
+            with open(self.log_file, "a") as log_output:
+                self.processes[index] = subprocess.Popen(command, cwd=self.php_path, env=env,
+                                                         stdout=log_output, stderr=log_output)
+        except Exception:
+            logging.error(f"Ошибка запуска php-cgi на {address}: {traceback.format_exc()}")
+
+    def _terminate(self, index):
+        process = self.processes.pop(index, None)
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.check_interval):
+            over_limit = []
+            with self._lock:
+                if self._stop_event.is_set():
+                    return
+                for index in range(self.workers):
+                    process = self.processes.get(index)
+                    if process is None or process.poll() is not None:
+                        # php-cgi сам завершается после PHP_FCGI_MAX_REQUESTS запросов
+                        logging.info(f"php-cgi на {self.addresses[index]} завершился, перезапуск.")
+                        self._spawn(index)
+                        continue
+                    if self.max_memory_mb:
+                        memory = get_process_memory_mb(process.pid)
+                        if memory is not None and memory > self.max_memory_mb:
+                            logging.info(f"php-cgi на {self.addresses[index]} занял {memory} МБ, перезапуск.")
+                            over_limit.append(index)
+            # замена ждёт фронтовой сервер и дообслуживание запросов, поэтому идёт без блокировки пула
+            for index in over_limit:
+                if self._stop_event.is_set():
+                    return
+                self._recycle(index)
+
+    def _recycle(self, index):
+        """Заменяет процесс, превысивший лимит памяти, не теряя начатые на нём запросы.
+
+        Сначала поднимается дополнительный процесс, старый помечается в upstream как down и завершается
+        после recycle_grace секунд. Новый процесс занимает его адрес, а дополнительный так же выводится.
+        Каждое ожидание прерывается остановкой пула.
+        """
+        if not self._replacing.acquire(blocking=False):
+            # процессы пула и так заменяет rolling_restart
+            return
+        spare = None
+        # фронтовой сервер перечитал конфигурацию с дополнительным процессом и её нужно вернуть
+        front_changed = False
+        try:
+            with self._lock:
+                if self._stop_event.is_set():
+                    return
+                if self.reload_front is None:
+                    self._terminate(index)
+                    self._spawn(index)
+                    return
+                spare = self.workers
+                self.surge = 1
+                self._spawn(spare)
+            if not wait_for_address(self.addresses[spare], stop_event=self._stop_event):
+                if not self._stop_event.is_set():
+                    logging.error(f"Дополнительный php-cgi на {self.addresses[spare]} не поднялся, замена отложена.")
+                return
+            self.down = {index}
+            front_changed = True
+            if not self.reload_front():
+                logging.error("Фронтовой сервер не перечитал конфигурацию, php-cgi завершается без ожидания.")
+            elif self._stop_event.wait(self.recycle_grace):
+                return
+            with self._lock:
+                if self._stop_event.is_set():
+                    return
+                self._terminate(index)
+                self._spawn(index)
+            if not wait_for_address(self.addresses[index], stop_event=self._stop_event):
+                return
+            # после перечитывания конфигурации фронтовой сервер дообслуживает запросы на дополнительном процессе
+            self.down = set()
+            self.surge = 0
+            front_changed = False
+            self.reload_front()
+            self._stop_event.wait(self.recycle_grace)
+        finally:
+            self.down = set()
+            self.surge = 0
+            if front_changed and not self._stop_event.is_set():
+                self.reload_front()
+            if spare is not None:
+                with self._lock:
+                    self._terminate(spare)
+            self._replacing.release()
+
+NGINX_MAIN_DIRECTIVES = ("worker_processes", "worker_rlimit_nofile")
+NGINX_EVENTS_DIRECTIVES = ("worker_connections", "multi_accept")
+COMPRESSIBLE_TYPES = ("text/plain text/css text/xml text/javascript application/javascript application/json "
+                      "application/xml application/rss+xml image/svg+xml")
+
+
+def tune_nginx(mode, overrides=None):
+    """Подбирает директивы nginx под число ядер, объём памяти и режим ("nginx" или "hybrid")."""
+    cpu_count = get_cpu_count()
+    memory_mb = get_total_memory_mb()
+    if os.name == "nt":
+        # nginx для Windows обслуживает соединения одним рабочим процессом через select() с лимитом 1024
+        worker_processes = 1
+        worker_connections = 1024
+        worker_rlimit_nofile = None
+    else:
+        worker_processes = cpu_count
+        worker_connections = clamp(memory_mb // 1024 * 512, 1024, 8192)
+        worker_rlimit_nofile = worker_connections * 2
+
+    values = {
+        "worker_processes": worker_processes,
+        "worker_rlimit_nofile": worker_rlimit_nofile,
+        "worker_connections": worker_connections,
+        "multi_accept": "on",
+        "sendfile": "on",
+        "tcp_nopush": "on",
+        "tcp_nodelay": "on",
+        "keepalive_timeout": 65,
+        "keepalive_requests": 1000,
+        "gzip": "on",
+        "gzip_comp_level": 4 if cpu_count >= 4 else 2,
+        "gzip_min_length": 1024,
+        "gzip_vary": "on",
+        "gzip_proxied": "any",
+        "gzip_types": COMPRESSIBLE_TYPES,
+        "open_file_cache": f"max={clamp(memory_mb // 1024 * 1000, 1000, 10000)} inactive=20s",
+        "open_file_cache_valid": "30s",
+        "open_file_cache_min_uses": 2,
+        "open_file_cache_errors": "on",
+    }
+    if mode == "hybrid":
+        values.update({
+            "proxy_buffer_size": "16k",
+            "proxy_buffers": "16 16k" if memory_mb >= 4096 else "8 16k",
+            "proxy_busy_buffers_size": "32k",
+        })
+    else:
+        values.update({
+            "fastcgi_keep_conn": "on",
+            "fastcgi_buffer_size": "32k",
+            "fastcgi_buffers": "16 16k" if memory_mb >= 4096 else "8 16k",
+            "fastcgi_busy_buffers_size": "32k",
+        })
+
+    for directive, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        values[directive] = value
+    return values
+
+
+def render_nginx_directives(values, names=None):
+    if names is None:
+        names = [name for name in values if name not in NGINX_MAIN_DIRECTIVES + NGINX_EVENTS_DIRECTIVES]
+    return "\n".join(f"{name} {values[name]};" for name in names if values.get(name) is not None)
+
+
+def render_nginx_config(tuning, log_dir, http_blocks, default_server, vhost_dir):
+    return render_template(
+        "nginx.conf",
+        main_directives=render_nginx_directives(tuning, NGINX_MAIN_DIRECTIVES),
+        events_directives=render_nginx_directives(tuning, NGINX_EVENTS_DIRECTIVES),
+        http_directives=render_nginx_directives(tuning),
+        log_dir=log_dir,
+        http_blocks=http_blocks,
+        default_server=default_server,
+        vhost_dir=vhost_dir,
+    ) + "\n"
+
+
+APACHE_MPM_DIRECTIVES = ("ThreadsPerChild", "StartServers", "MinSpareServers", "MaxSpareServers", "ServerLimit",
+                         "MaxRequestWorkers", "MaxConnectionsPerChild")
+# грубая оценка памяти на одновременный запрос с mod_php
+APACHE_MB_PER_WORKER = 32
+
+
+def tune_apache(mode, overrides=None):
+    """Подбирает MPM, keep-alive и таймауты Apache под число ядер, объём памяти и режим ("apache" или "hybrid")."""
+    cpu_count = get_cpu_count()
+    memory_mb = get_total_memory_mb()
+    memory_workers = max(memory_mb // 2 // APACHE_MB_PER_WORKER, 16)
+    if mode == "hybrid":
+        # медленных клиентов и keep-alive берёт на себя nginx, до Apache доходят только динамические запросы;
+        # минимум покрывает 32 простаивающих соединения апстрима apache_backend и запас для активных
+        workers = clamp(min(cpu_count * 8, memory_workers), 48, 256)
+    else:
+        workers = clamp(min(cpu_count * 25, memory_workers), 64, 1024)
+
+    if os.name == "nt":
+        # mpm_winnt: один дочерний процесс с пулом потоков
+        values = {"ThreadsPerChild": workers}
+    else:
+        # mod_php без ZTS требует prefork
+        start_servers = clamp(cpu_count, 2, 8)
+        values = {
+            "StartServers": start_servers,
+            "MinSpareServers": start_servers,
+            "MaxSpareServers": start_servers * 2,
+            "ServerLimit": workers,
+            "MaxRequestWorkers": workers,
+        }
+    values.update({
+        # периодическая замена дочернего процесса ограничивает рост памяти расширений PHP
+        "MaxConnectionsPerChild": 10000,
+        "Timeout": 60,
+        "KeepAlive": "On",
+        "MaxKeepAliveRequests": 1000 if mode == "hybrid" else 500,
+        # в гибридном режиме больше keepalive_timeout апстрима nginx (4 с), иначе короткий таймаут
+        # не даёт простаивающим браузерным соединениям занимать потоки
+        "KeepAliveTimeout": 5 if mode == "hybrid" else 3,
+        "EnableSendfile": "On",
+        "EnableMMAP": "On",
+        "HostnameLookups": "Off",
+    })
+
+    for directive, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        values[directive] = value
+    return values
+
+
+def render_apache_directives(values):
+    mpm = "mpm_winnt_module" if os.name == "nt" else "mpm_prefork_module"
+    mpm_lines = [f"    {name} {value}" for name, value in values.items() if name in APACHE_MPM_DIRECTIVES]
+    lines = [f"{name} {value}" for name, value in values.items() if name not in APACHE_MPM_DIRECTIVES]
+    if mpm_lines:
+        lines += [f"<IfModule {mpm}>", *mpm_lines, "</IfModule>"]
+    return "\n".join(lines)
+
+
+# модуль -> модули, без которых он не загрузится
+APACHE_MODULES = {
+    "authz_core": (),
+    "authz_host": ("authz_core",),
+    "mime": (),
+    "dir": (),
+    "log_config": (),
+    "rewrite": (),
+    "filter": (),
+    "deflate": ("filter",),
+    "expires": (),
+    "headers": (),
+    "cache": (),
+    "cache_disk": ("cache",),
+    "proxy": (),
+    "proxy_fcgi": ("proxy",),
+    "slotmem_shm": (),
+    "proxy_balancer": ("proxy", "slotmem_shm"),
+    "lbmethod_bybusyness": ("proxy_balancer",),
+}
+# rewrite, headers и expires часто встречаются в .htaccess сайтов, без модуля такой сайт отвечает 500
+APACHE_BASE_MODULES = ("authz_core", "authz_host", "mime", "dir", "log_config", "rewrite", "headers", "expires")
+APACHE_MODULE_PROFILES = {
+    "apache": APACHE_BASE_MODULES + ("deflate", "cache", "cache_disk"),
+    # сжатие и кэширование в гибридном режиме выполняет nginx перед Apache
+    "hybrid": APACHE_BASE_MODULES,
+}
+# PHP через пул php-cgi: balancer на каждую версию PHP
+APACHE_FASTCGI_MODULES = ("proxy", "proxy_fcgi", "slotmem_shm", "proxy_balancer", "lbmethod_bybusyness")
+# module - mod_php внутри Apache, fastcgi - пул php-cgi через mod_proxy_fcgi
+PHP_HANDLERS = ("module", "fastcgi")
+
+
+def resolve_apache_modules(apache_path, names):
+    """Оставляет модули, чьи .so есть в modules/ выбранной версии Apache, вместе с их зависимостями."""
+    modules_dir = os.path.join(apache_path, "modules")
+    enabled = []
+    skipped = set()
+
+    def enable(name):
+        if name in enabled:
+            return True
+        if name in skipped:
+            return False
+        missing = [dependency for dependency in APACHE_MODULES[name] if not enable(dependency)]
+        if missing:
+            logging.warning(f"Модуль Apache {name} пропущен: не загружены {', '.join(missing)}")
+        elif not os.path.exists(os.path.join(modules_dir, f"mod_{name}.so")):
+            logging.warning(f"Модуль Apache {name} пропущен: нет {modules_dir}/mod_{name}.so")
+        else:
+            enabled.append(name)
+            return True
+        skipped.add(name)
+        return False
+
+    for module in names:
+        enable(module)
+    return enabled
+
+
+def render_apache_modules(apache_path, modules, **context):
+    """Возвращает строки LoadModule и директивы модулей из шаблонов apache_mod_<модуль>.conf."""
+    load_modules = "\n".join(
+        f'LoadModule {name}_module "{os.path.join(apache_path, "modules", f"mod_{name}.so")}"' for name in modules
+    )
+    directives = "\n\n".join(
+        render_template(f"apache_mod_{name}.conf", **context) for name in modules
+        if os.path.exists(os.path.join(TEMPLATES_DIR, f"apache_mod_{name}.conf"))
+    )
+    return load_modules, directives
+
+
+def record_tuning(project_path, section, values):
+    """Сохраняет выбранные значения в userdata/tuning.json, чтобы замеры можно было повторить.
+    Файл перезаписывается, только если значения изменились; возвращает True в этом случае."""
+    tuning_path = os.path.join(project_path, "userdata", "tuning.json")
+    tuning = {}
+    if os.path.exists(tuning_path):
+        try:
+            with open(tuning_path, "r", encoding="utf-8") as tuning_file:
+                tuning = json.load(tuning_file)
+        except ValueError:
+            logging.error(f"Повреждён {tuning_path}, файл будет перезаписан")
+    # круговой проход через JSON приводит кортежи к спискам, иначе сравнение с прочитанным всегда ложно
+    entry = json.loads(json.dumps({"cpu_count": get_cpu_count(), "memory_mb": get_total_memory_mb(),
+                                   "values": values}))
+    if tuning.get(section) == entry:
+        return False
+    tuning[section] = entry
+    return write_config(tuning_path, json.dumps(tuning, indent=4, ensure_ascii=False))
+
+
+MICROCACHE_ZONE = "microcache"
+MICROCACHE_KEY = "$scheme|$request_method|$host|$request_uri"
+MICROCACHE_BYPASS_COOKIES = "PHPSESSID|session|logged_in|auth|token"
+
+
+def render_microcache_http(cache_dir):
+    return render_template("nginx_microcache_http.conf", cache_dir=cache_dir, zone=MICROCACHE_ZONE,
+                           key=MICROCACHE_KEY, bypass_cookies=MICROCACHE_BYPASS_COOKIES)
+
+
+def render_microcache_location(ttl):
+    return render_template("nginx_microcache_location.conf", zone=MICROCACHE_ZONE, ttl=ttl)
+
+
+def _split_url_prefix(prefix):
+    prefix = prefix.strip()
+    if "://" in prefix:
+        prefix = prefix.split("://", 1)[1]
+    if prefix.startswith("/"):
+        return None, prefix
+    host, _, path = prefix.partition("/")
+    return host.lower(), "/" + path
+
+
+def purge_fastcgi_cache(cache_dir, prefix=None):
+    """Удаляет файлы микрокэша: все или только для адресов с заданным префиксом. Возвращает число удалённых."""
+    if not os.path.isdir(cache_dir):
+        return 0
+    host_prefix, path_prefix = _split_url_prefix(prefix) if prefix else (None, None)
+    removed = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            file_path = os.path.join(root, name)
+            try:
+                if prefix:
+                    with open(file_path, "rb") as cache_file:
+                        header = cache_file.read(4096)
+                    match = re.search(rb"\nKEY: ([^\n]*)\n", header)
+                    if not match:
+                        continue
+                    parts = match.group(1).decode("utf-8", "replace").split("|", 3)
+                    if len(parts) != 4:
+                        continue
+                    _, _, host, uri = parts
+                    if host_prefix is not None and host.lower() != host_prefix:
+                        continue
+                    if not uri.startswith(path_prefix):
+                        continue
+                os.remove(file_path)
+                removed += 1
+            except OSError:
+                logging.error(f"Не удалось удалить файл кэша {file_path}: {traceback.format_exc()}")
+    logging.info(f"Очищен микрокэш ({prefix or 'целиком'}): удалено {removed} файлов")
+    return removed
+
+
+APACHE_BACKEND_PORT = 8080
+# при смене версии Apache за nginx новый экземпляр поднимается на втором порту
+APACHE_BACKEND_PORTS = (APACHE_BACKEND_PORT, APACHE_BACKEND_PORT + 1)
+STATIC_EXTENSIONS = ("css|js|mjs|map|png|jpe?g|gif|webp|avif|svg|ico|bmp|woff2?|ttf|otf|eot|"
+                     "txt|xml|pdf|zip|gz|mp3|mp4|webm|ogg|wav")
+HTACCESS_STATIC_SAFE = re.compile(r"^\s*(#|$|Rewrite|Options|DirectoryIndex|ErrorDocument|php_|AddDefaultCharset|"
+                                  r"<IfModule|</IfModule)", re.I)
+HTACCESS_SKIP_DIRS = {".git", ".svn", ".hg", "node_modules", "bower_components", "vendor", "__pycache__"}
+# site_root -> (отметки времени каталога и найденных .htaccess, результат find_htaccess_prefixes)
+_htaccess_cache = {}
+
+
+def _htaccess_signature(site_root, prefixes):
+    # новый .htaccess в корне меняет время каталога, правка существующих - время самих файлов
+    paths = [site_root, os.path.join(site_root, ".htaccess")]
+    paths += [os.path.join(site_root, *prefix.strip("/").split("/"), ".htaccess") for prefix in prefixes]
+    try:
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths)
+    except OSError:
+        return None
+
+
+def find_htaccess_prefixes(site_root):
+    """Ищет .htaccess в сайте. Возвращает (можно ли отдавать статику корня напрямую, префиксы для Apache).
+
+    Результат кэшируется: каталоги зависимостей не обходятся, а повторный обход идёт, только если изменились
+    корень сайта или найденные .htaccess либо панель сообщила об изменении через forget_htaccess_prefixes.
+    """
+    site_root = os.path.normpath(site_root)
+    cached = _htaccess_cache.get(site_root)
+    if cached is not None and cached[0] is not None and cached[0] == _htaccess_signature(site_root, cached[1][1]):
+        return cached[1]
+    root_static_safe = True
+    prefixes = []
+    for root, dirs, files in os.walk(site_root):
+        dirs[:] = [name for name in dirs if name not in HTACCESS_SKIP_DIRS]
+        if ".htaccess" not in files:
+            continue
+        if os.path.normpath(root) == site_root:
+            # правила перезаписи с проверкой !-f не мешают отдавать существующие файлы из nginx,
+            # а доступ, заголовки и авторизация должны остаться за Apache
+            with open(os.path.join(root, ".htaccess"), "r", encoding="utf-8", errors="replace") as htaccess:
+                root_static_safe = all(HTACCESS_STATIC_SAFE.match(line) for line in htaccess)
+        else:
+            relative = os.path.relpath(root, site_root).replace(os.sep, "/")
+            prefixes.append(f"/{relative}/")
+    result = root_static_safe, sorted(prefixes)
+    _htaccess_cache[site_root] = (_htaccess_signature(site_root, result[1]), result)
+    return result
+
+
+def forget_htaccess_prefixes(path):
+    """Сбрасывает кэш find_htaccess_prefixes для сайтов, внутри которых находится path
+    (и для папки sites, которую обходит сервер по умолчанию)."""
+    path = os.path.normpath(path)
+    for site_root in list(_htaccess_cache):
+        if path == site_root or path.startswith(site_root.rstrip(os.sep) + os.sep):
+            _htaccess_cache.pop(site_root, None)
+
+
+PHP_INI_PROFILES = ("development", "production", "benchmark")
+PHP_INI_BLOCK_BEGIN = "; >>> Peresvet: управляемый блок, не редактируйте вручную"
+PHP_INI_BLOCK_END = "; <<< Peresvet"
+
+
+def build_php_ini_profile(profile, php_path, total_memory_mb, log_dir, redis_session=None):
+    """Возвращает директивы php.ini для профиля с учётом версии PHP и объёма памяти.
+    redis_session - session.save_path для хранения сессий в Redis, если есть расширение phpredis."""
+    if profile not in PHP_INI_PROFILES:
+        raise ValueError(f"Неизвестный профиль php.ini: {profile}")
+    major, minor = (version_key(os.path.basename(os.path.normpath(php_path))) + (0, 0))[:2]
+    development = profile == "development"
+    benchmark = profile == "benchmark"
+
+    directives = {"extension_dir": f'"{os.path.join(php_path, "ext")}"'}
+    opcache_dll = os.path.join(php_path, "ext", "php_opcache.dll")
+    if os.path.exists(opcache_dll):
+        directives["zend_extension"] = f'"{opcache_dll}"'
+
+    if development:
+        opcache_memory = clamp(total_memory_mb // 64, 64, 256)
+    else:
+        opcache_memory = clamp(total_memory_mb // 32, 128, 512)
+    directives.update({
+        "opcache.enable": "1",
+        "opcache.enable_cli": "0",
+        "opcache.memory_consumption": str(opcache_memory),
+        "opcache.interned_strings_buffer": "8" if development else "16",
+        "opcache.max_accelerated_files": "10000" if development else "32531" if not benchmark else "65407",
+        "opcache.validate_timestamps": "0" if benchmark else "1",
+        "opcache.revalidate_freq": "0" if development else "2",
+        "realpath_cache_size": "8192K" if total_memory_mb >= 8192 else "4096K",
+        "realpath_cache_ttl": "120" if development else "600" if not benchmark else "3600",
+    })
+    if major >= 8:
+        if development:
+            # JIT мешает пошаговой отладке, в разработке он выключен
+            directives["opcache.jit"] = "disable" if (major, minor) >= (8, 4) else "off"
+        else:
+            directives["opcache.jit"] = "tracing"
+            directives["opcache.jit_buffer_size"] = f"{clamp(total_memory_mb // 128, 32, 256)}M"
+
+    if development:
+        error_reporting = "E_ALL"
+    elif (major, minor) >= (8, 4):
+        error_reporting = "E_ALL & ~E_DEPRECATED"
+    else:
+        error_reporting = "E_ALL & ~E_DEPRECATED & ~E_STRICT"
+    directives.update({
+        "display_errors": "On" if development else "Off",
+        "display_startup_errors": "On" if development else "Off",
+        "error_reporting": error_reporting,
+        "log_errors": "On",
+        "error_log": f'"{os.path.join(log_dir, "php_errors.log")}"',
+        "zend.assertions": "1" if development else "-1",
+    })
+
+    # файловые сессии блокируют параллельные запросы одного пользователя и засоряют временную папку
+    if redis_session:
+        if os.path.exists(os.path.join(php_path, "ext", "php_redis.dll")):
+            directives.update({
+                "extension": "redis",
+                "session.save_handler": "redis",
+                "session.save_path": f'"{redis_session}"',
+            })
+        else:
+            logging.info(f"В {php_path} нет php_redis.dll, сессии PHP остаются в файлах.")
+    return directives
+
+
+def _read_ini_directives(lines):
+    directives = {}
+    for line in lines:
+        match = re.match(r"^\s*([A-Za-z0-9_.]+)\s*=\s*(.*?)\s*$", line)
+        if match:
+            key, value = match.group(1), match.group(2).strip('"')
+            if key == "zend_extension" and "opcache" not in value.lower():
+                continue
+            directives[key] = value
+    return directives
+
+
+def apply_php_ini_profile(php_path, profile, log_dir, redis_session=None):
+    """Дописывает в php.ini управляемый блок профиля, не трогая правки пользователя. Возвращает True при изменении."""
+    php_ini_path = os.path.join(php_path, "php.ini")
+    vendor_ini_path = os.path.join(php_path, "php.ini-development")
+    if not os.path.exists(vendor_ini_path):
+        vendor_ini_path = os.path.join(php_path, "php.ini-production")
+
+    with open(php_ini_path, "r", encoding="utf-8", errors="replace") as ini_file:
+        content = ini_file.read()
+    block = re.compile(rf"\n?{re.escape(PHP_INI_BLOCK_BEGIN)}.*?{re.escape(PHP_INI_BLOCK_END)}\n?", re.S)
+    user_content = block.sub("\n", content).rstrip("\n") + "\n"
+
+    vendor = {}
+    if os.path.exists(vendor_ini_path):
+        with open(vendor_ini_path, "r", encoding="utf-8", errors="replace") as vendor_file:
+            vendor = _read_ini_directives(vendor_file.read().splitlines())
+    current = _read_ini_directives(user_content.splitlines())
+    user_edits = {key for key, value in current.items() if vendor.get(key) != value}
+
+    directives = build_php_ini_profile(profile, php_path, get_total_memory_mb(), log_dir, redis_session)
+    lines = [PHP_INI_BLOCK_BEGIN, f"; профиль: {profile}"]
+    for key, value in directives.items():
+        if key == "extension":
+            # строк extension в php.ini много, повторное подключение расширения PHP считает ошибкой
+            loaded = re.compile(rf'^\s*extension\s*=\s*"?(php_)?{value}(\.dll)?"?\s*$', re.M | re.I)
+            if loaded.search(user_content):
+                lines.append(f"; расширение {value} подключено выше")
+            else:
+                lines.append(f"{key} = {value}")
+        elif key in user_edits:
+            lines.append(f"; {key} задан вручную выше и не переопределяется")
+        else:
+            lines.append(f"{key} = {value}")
+    lines.append(PHP_INI_BLOCK_END)
+    new_content = user_content + "\n" + "\n".join(lines) + "\n"
+
+    if not write_config(php_ini_path, new_content):
+        return False
+    logging.info(f"php.ini в {php_path} приведён к профилю {profile}")
+    return True
+
 
 class PHP:
-    def __init__(self, php_path, project_path):
+    def __init__(self, php_path, project_path, php_options=None, site_php=None):
         self.php_path = php_path
         self.project_path = project_path
+        self.php_options = php_options or {}
+        self.site_php_overrides = site_php or {}
+        self.sites_path = os.path.join(project_path, "sites")
         self.php_version_major = self._extract_php_major_version()
 
         self.log_dir = os.path.join(project_path, "userdata", "logs")
@@ -23,6 +1163,97 @@ class PHP:
             format="%(asctime)s - %(levelname)s - %(message)s"
         )
         self.setup_php_ini()
+        self.php_root = os.path.dirname(os.path.normpath(php_path))
+        self.php_version = os.path.basename(os.path.normpath(php_path))
+        self.reload_sites()
+        self.pools = {}
+        self._sync_pools()
+        self.pool = self.pools[self.php_version]
+
+    def reload_sites(self):
+        self.sites = load_sites(self.sites_path)
+        # версия из панели важнее версии из манифеста сайта
+        self.site_php = {site["name"]: site["php"] for site in self.sites if site["php"]}
+        self.site_php.update({site: version for site, version in self.site_php_overrides.items() if version})
+
+    def _sync_pools(self, start=False, keep=()):
+        installed = list_php_versions(self.php_root)
+        if self.php_version not in installed:
+            installed.append(self.php_version)
+        used = {self.php_version}
+        for site, version in self.site_php.items():
+            if version in installed:
+                used.add(version)
+            else:
+                logging.error(f"PHP {version} для сайта {site} не установлен, используется {self.php_version}")
+
+        for version in list(self.pools):
+            if version not in used and version not in keep:
+                self.pools.pop(version).stop()
+                logging.info(f"Пул PHP {version} больше не используется и остановлен.")
+
+        taken_ports = {pool.base_port for pool in self.pools.values()}
+        for index, version in enumerate(installed):
+            if version not in used:
+                continue
+            if version in self.pools:
+                if start and not self.pools[version].is_running():
+                    self.pools[version].start()
+                continue
+            base_port = PHP_POOL_BASE_PORT + index * PHP_POOL_PORT_STRIDE
+            while base_port in taken_ports:
+                base_port += PHP_POOL_PORT_STRIDE
+            taken_ports.add(base_port)
+            version_path = os.path.join(self.php_root, version)
+            if version != self.php_version:
+                self.setup_php_ini(version_path)
+            self.pools[version] = PHPPool(
+                version_path,
+                self.php_log,
+                workers=self.php_options.get("workers"),
+                base_port=base_port,
+                max_requests=self.php_options.get("max_requests", 500),
+                max_memory_mb=self.php_options.get("max_memory_mb", 256),
+                reload_front=self.reload_front
+            )
+            if start:
+                self.pools[version].start()
+
+    def site_upstream(self, site):
+        version = self.site_php.get(site)
+        return php_upstream_name(version if version in self.pools else self.php_version)
+
+    def nginx_upstreams(self, nginx_workers=1):
+        return "\n\n".join(pool.nginx_upstream(php_upstream_name(version), nginx_workers=nginx_workers)
+                       for version, pool in self.pools.items())
+
+    def uses_pools(self):
+        """True, если PHP работает пулами php-cgi, а не внутри веб-сервера."""
+        return True
+
+    def apache_modules(self, apache_path, profile):
+        """Возвращает модули Apache для профиля и True, если PHP подключается к пулам через mod_proxy_fcgi."""
+        fastcgi = self.uses_pools()
+        modules = resolve_apache_modules(apache_path, APACHE_MODULE_PROFILES[profile] +
+                                         (APACHE_FASTCGI_MODULES if fastcgi else ()))
+        missing = [name for name in APACHE_FASTCGI_MODULES if name not in modules]
+        if fastcgi and missing:
+            logging.error(f"Нет модулей Apache {', '.join(missing)}, PHP подключается через mod_php.")
+            fastcgi = False
+        return modules, fastcgi
+
+    def apache_php(self, fastcgi):
+        if fastcgi:
+            return "\n\n".join(pool.apache_balancer(php_upstream_name(version))
+                               for version, pool in self.pools.items())
+        return render_template("apache_php_module.conf",
+                               php_suffix="" if self.php_version_major == "8" else "7",
+                               php_module=os.path.join(self.php_path, f"php{self.php_version_major}apache2_4.dll"),
+                               php_path=self.php_path)
+
+    def apache_php_handler(self, site, fastcgi):
+        # mod_php обрабатывает .php сам, а balancer выбирается по версии PHP сайта
+        return render_template("apache_php_handler.conf", upstream=self.site_upstream(site)) if fastcgi else ""
 
     def _extract_php_major_version(self):
         match = re.search(r'(\d+)\.\d+\.\d+', os.path.basename(self.php_path))
@@ -30,11 +1261,12 @@ class PHP:
             return match.group(1)
         raise ValueError(f"Не удалось определить версию PHP из пути: {self.php_path}")
 
-    def setup_php_ini(self):
-        php_ini_path = os.path.join(self.php_path, "php.ini")
+    def setup_php_ini(self, php_path=None):
+        php_path = php_path or self.php_path
+        php_ini_path = os.path.join(php_path, "php.ini")
         if not os.path.exists(php_ini_path):
-            dev_ini = os.path.join(self.php_path, "php.ini-development")
-            prod_ini = os.path.join(self.php_path, "php.ini-production")
+            dev_ini = os.path.join(php_path, "php.ini-development")
+            prod_ini = os.path.join(php_path, "php.ini-production")
             if os.path.exists(dev_ini):
                 shutil.copy(dev_ini, php_ini_path)
                 logging.info(f"Скопирован php.ini-development в {php_ini_path}")
@@ -44,11 +1276,17 @@ class PHP:
             else:
                 logging.error("Не найден php.ini, php.ini-development или php.ini-production")
                 raise FileNotFoundError("Не найден php.ini, php.ini-development или php.ini-production")
+        return apply_php_ini_profile(php_path, self.php_options.get("ini_profile", "development"), self.log_dir,
+                                     self.php_options.get("redis_session"))
 
     def run_php(self):
-        command = rf'"{self.php_path}\php-cgi.exe" -b 127.0.0.1:9000'
-        print(command)
-        self._execute_command(command, f"PHP {self.php_version_major} запущен.", log_file=self.php_log, wait=False)
+        for version, pool in self.pools.items():
+            pool.start()
+            logging.info(f"PHP {version} запущен.")
+
+    def stop_pools(self):
+        for pool in self.pools.values():
+            pool.stop()
 
     @staticmethod
     def stop_php():
@@ -60,10 +1298,74 @@ class PHP:
             logging.error(f"Ошибка при остановке PHP: {e}")
 
     def restart_php(self):
-        self.stop_php()
-        self.run_php()
+        self.reload_php()
         logging.info(f"PHP {self.php_version_major} перезапущен.")
 
+    def reload_front(self):
+        """Перечитывает конфигурацию сервера перед пулами PHP. Возвращает True при успехе."""
+        return True
+
+    def reload_php(self):
+        return all([pool.rolling_restart(self.reload_front) for pool in self.pools.values()])
+
+    def update_options(self, php_options=None, site_php=None):
+        """Применяет новые настройки PHP и сайтов к работающему стеку.
+        Возвращает True, если процессы PHP нужно заменить."""
+        if php_options is not None:
+            self.php_options = php_options
+        if site_php is not None:
+            self.site_php_overrides = site_php
+        self.reload_sites()
+        self._sync_pools(start=self.uses_pools())
+        php_changed = False
+        for version, pool in self.pools.items():
+            php_changed |= bool(self.setup_php_ini(os.path.join(self.php_root, version)))
+            max_requests = int(self.php_options.get("max_requests", 500) or 0)
+            if pool.max_requests != max_requests:
+                pool.max_requests = max_requests
+                php_changed = True
+            # лимит памяти проверяет сторож пула, процессы заменять не нужно
+            pool.max_memory_mb = int(self.php_options.get("max_memory_mb", 256) or 0)
+        if int(self.php_options.get("workers") or get_cpu_count()) != self.pool.workers:
+            logging.info("Новое число процессов PHP применится после перезапуска сервера.")
+        return php_changed
+
+    def _set_php_version(self, php_path):
+        self.php_path = php_path
+        self.php_version = os.path.basename(os.path.normpath(php_path))
+        self.php_version_major = self._extract_php_major_version()
+
+    def switch_php(self, php_path, drain_seconds=2.0):
+        """Переключает версию PHP по умолчанию без остановки сайтов.
+
+        Пул новой версии запускается на своих портах и должен ответить на проверку FastCGI. Только после
+        этого фронтовой сервер переводится на него, а старый пул дообслуживает начатые запросы и
+        останавливается. Если новая версия не поднялась, всё остаётся как было.
+        """
+        old_php_path, old_version = self.php_path, self.php_version
+        self._set_php_version(php_path)
+        if self.php_version == old_version:
+            return True
+        self.setup_php_ini()
+        self._sync_pools(start=True, keep={old_version})
+        if not self.pools[self.php_version].wait_ready():
+            logging.error(f"PHP {self.php_version} не прошёл проверку, остаётся PHP {old_version}.")
+            self._set_php_version(old_php_path)
+            self._sync_pools()
+            return False
+        self.pool = self.pools[self.php_version]
+        if not self.reload_front():
+            logging.error(f"Фронтовой сервер не переключился на PHP {self.php_version}, остаётся PHP {old_version}.")
+            self._set_php_version(old_php_path)
+            self.pool = self.pools[old_version]
+            self._sync_pools()
+            return False
+        time.sleep(drain_seconds)
+        self._sync_pools()
+        self.reload_front()
+        logging.info(f"Версия PHP переключена: {old_version} -> {self.php_version}.")
+        return True
+
     def _execute_command(self, command, success_message, log_file, wait=True):
         try:
             with open(log_file, "a") as log_output:
@@ -85,11 +1387,15 @@ class PHP:
 
 
 class ApachePHP(PHP):
-    def __init__(self, apache_path, php_path, project_path):
-        super().__init__(php_path, project_path)
+    def __init__(self, apache_path, php_path, project_path, php_options=None, site_php=None, tuning_overrides=None):
+        super().__init__(php_path, project_path, php_options, site_php)
+        self.tuning_overrides = tuning_overrides or {}
         self.apache_path = apache_path
         self.php_path = php_path
         self.project_path = project_path
+        self.conf_path = os.path.join(self.apache_path, "conf", "httpd.conf")
+        self.vhost_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "vhosts", "apache"))
+        self.cache_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "apache_cache"))
 
         self.php_version_major = self._extract_php_major_version()
 
@@ -108,41 +1414,135 @@ class ApachePHP(PHP):
         self.setup_php_ini()
 
     def configure_apache(self):
-        conf_path = os.path.join(self.apache_path, "conf", "httpd.conf")
-        php_e = "" if self.php_version_major == "8" else "7"
-        apache_dll_path = os.path.join(self.php_path, f"php{self.php_version_major}apache2_4.dll")
-        authz_core_module = os.path.join(self.apache_path, "modules", "mod_authz_core.so")
-        mod_authz_host = os.path.join(self.apache_path, "modules", "mod_authz_host.so")
-        mod_mime = os.path.join(self.apache_path, "modules", "mod_mime.so")
-        config = f"""
-        ServerRoot "{self.apache_path}"
-        Listen 80
-        DocumentRoot "{self.project_path}/sites"
-        <Directory "{self.project_path}/sites">
-            Options Indexes FollowSymLinks
-            AllowOverride All
-            Require all granted
-        </Directory>
-        
-        ErrorLog "{self.module_log_dir}/apache_error.log"
-        CustomLog "{self.module_log_dir}/apache_access.log" common
-
-        LoadModule authz_core_module {authz_core_module}
-        LoadModule authz_host_module {mod_authz_host}
-        LoadModule mime_module {mod_mime}
-        LoadModule php{php_e}_module "{apache_dll_path}"
-        AddHandler application/x-httpd-php .php
-        PHPIniDir "{self.php_path}"
-        """
-        with open(conf_path, "w", encoding="utf-8") as conf_file:
-            conf_file.write(config)
-
-        logging.info(f"Apache сконфигурирован с PHP {self.php_version_major} из {self.php_path}")
+        tuning = tune_apache("apache", self.tuning_overrides.get("apache"))
+        record_tuning(self.project_path, "apache", tuning)
+        modules, fastcgi = self.apache_modules(self.apache_path, "apache")
+        changed = sync_fragments(self.vhost_dir, {
+            site["name"]: render_apache_vhost(site["server_names"], site["root"], 80,
+                                              self.apache_php_handler(site["name"], fastcgi))
+            for site in self.sites
+        })
+        if "cache_disk" in modules:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        load_modules, module_directives = render_apache_modules(
+            self.apache_path, modules,
+            cache_dir=self.cache_dir,
+            compress_types=COMPRESSIBLE_TYPES,
+            compression_level=4 if get_cpu_count() >= 4 else 2,
+        )
+        config = render_template(
+            "httpd.conf",
+            apache_path=self.apache_path,
+            pid_file="logs/httpd.pid",
+            listen="80",
+            load_modules=load_modules,
+            sites_path=self.sites_path,
+            log_dir=self.module_log_dir,
+            access_log=f'CustomLog "{self.module_log_dir}/apache_access.log" common' if "log_config" in modules else "",
+            tuning=render_apache_directives(tuning),
+            module_directives=module_directives,
+            php=self.apache_php(fastcgi),
+            default_vhost=render_apache_vhost(["localhost"], self.sites_path, 80,
+                                              self.apache_php_handler(None, fastcgi)),
+            vhost_dir=self.vhost_dir,
+        ) + "\n"
+        if write_config(self.conf_path, config):
+            changed.add("httpd.conf")
+
+        logging.info(f"Apache сконфигурирован с PHP {self.php_version_major} из {self.php_path} "
+                     f"({'пул php-cgi' if fastcgi else 'mod_php'})")
+        return changed
+
+    def test_apache(self):
+        command = rf'"{self.apache_path}\bin\httpd.exe" -t -f "{self.conf_path}"'
+        return self._execute_command(command, "Конфигурация Apache прошла проверку.", log_file=self.apache_log)
+
+    def reload_apache(self):
+        if not self.test_apache():
+            logging.error("Конфигурация Apache не прошла проверку (httpd -t), перезагрузка отменена.")
+            return False
+        # в Windows -k restart перечитывает конфигурацию, не закрывая консольный процесс;
+        # в обоих случаях начатые запросы дообслуживаются старыми процессами
+        signal = "restart" if os.name == "nt" else "graceful"
+        command = rf'"{self.apache_path}\bin\httpd.exe" -k {signal} -f "{self.conf_path}"'
+        return self._execute_command(command, "Apache перечитал конфигурацию.", log_file=self.apache_log)
+
+    def uses_pools(self):
+        return self.php_options.get("handler", "module") == "fastcgi"
+
+    def reload_front(self):
+        changed = self.configure_apache()
+        return not changed or self.reload_apache()
+
+    def reload_php(self):
+        if self.uses_pools():
+            return super().reload_php()
+        # mod_php перечитывает php.ini при мягком перезапуске Apache
+        return self.reload_apache()
+
+    def _shutdown_apache(self, apache_path, conf_path):
+        # в отличие от taskkill останавливает только экземпляр с этим конфигом и даёт ему дообслужить запросы
+        signal = "shutdown" if os.name == "nt" else "graceful-stop"
+        command = rf'"{apache_path}\bin\httpd.exe" -k {signal} -f "{conf_path}"'
+        return self._execute_command(command, "Apache остановлен.", log_file=self.apache_log)
+
+    def switch_php(self, php_path, drain_seconds=2.0):
+        if self.uses_pools():
+            return super().switch_php(php_path, drain_seconds)
+        # mod_php: новую версию загружает новый дочерний процесс Apache при мягком перезапуске
+        if os.path.normpath(php_path) == os.path.normpath(self.php_path):
+            return True
+        old_php_path = self.php_path
+        self._set_php_version(php_path)
+        self.setup_php_ini()
+        self.configure_apache()
+        if not self.reload_apache():
+            logging.error(f"Apache не принял PHP {self.php_version}, версия не переключена.")
+            self._set_php_version(old_php_path)
+            self.configure_apache()
+            return False
+        self._sync_pools()
+        self.pool = self.pools[self.php_version]
+        return True
+
+    def switch_apache(self, apache_path):
+        """Переключает версию Apache. Конфигурация новой версии проверяется (httpd -t) до того, как старая
+        перестанет принимать соединения. Порт 80 не может слушать два процесса сразу, поэтому между
+        остановкой старой версии и запуском новой остаётся короткий промежуток."""
+        if os.path.normpath(apache_path) == os.path.normpath(self.apache_path):
+            return True
+        old_path, old_conf = self.apache_path, self.conf_path
+        self.apache_path = apache_path
+        self.conf_path = os.path.join(self.apache_path, "conf", "httpd.conf")
+        self.configure_apache()
+        if not self.test_apache():
+            logging.error(f"Конфигурация Apache из {apache_path} не прошла проверку, версия не переключена.")
+            self.apache_path, self.conf_path = old_path, old_conf
+            return False
+        self._shutdown_apache(old_path, old_conf)
+        wait_for_port_closed("127.0.0.1", 80)
+        self.run_apache()
+        return wait_for_port("127.0.0.1", 80)
+
+    def reload(self, php_options=None, site_php=None, tuning_overrides=None):
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        php_changed = self.update_options(php_options, site_php)
+        if php_changed and self.uses_pools():
+            # замена процессов сама перечитывает Apache, в том числе с новыми настройками
+            return self.reload_php()
+        changed = self.configure_apache()
+        if changed:
+            logging.info(f"Изменены конфигурации: {', '.join(sorted(changed))}")
+        success = self.reload_apache() if changed or php_changed else True
+        if not self.uses_pools():
+            # Apache уже не обращается к пулам, например после переключения на mod_php
+            self.stop_pools()
+        return success
 
     def run_apache(self):
-
         self.configure_apache()
-        command = rf'"{self.apache_path}\bin\httpd.exe"'
+        command = rf'"{self.apache_path}\bin\httpd.exe" -f "{self.conf_path}"'
         self._execute_command(command, "Apache запущен.", log_file=self.apache_log, wait=False)
 
     def stop_apache(self):
@@ -152,27 +1552,43 @@ class ApachePHP(PHP):
         except:
             pass
 
-    def restart_apache(self):
+    def restart_apache(self, force=False):
+        if not self.configure_apache() and not force:
+            logging.info("Конфигурация Apache не изменилась, перезапуск не нужен.")
+            return False
+        if self.reload_apache():
+            return True
+        # мягкий перезапуск не удался (например, Apache не запущен)
         self.stop_apache()
         self.run_apache()
         logging.info("Apache перезапущен.")
+        return True
 
     def run(self):
-        self.run_php()
+        if self.uses_pools():
+            self.run_php()
         self.run_apache()
 
     def stop(self):
         self.stop_apache()
+        self.stop_pools()
         self.stop_php()
 
     def restart(self):
-        self.stop()
-        self.run()
+        self.setup_php_ini()
+        # restart_php заменяет процессы пула или мягко перезапускает Apache, чтобы mod_php перечитал php.ini
+        self.restart_php()
+        self.restart_apache()
 
 
 class NginxPHP(PHP):
-    def __init__(self, nginx_path, php_path, project_path):
-        super().__init__(php_path, project_path)
+    def __init__(self, nginx_path, php_path, project_path, php_options=None, site_php=None, tuning_overrides=None,
+                 nginx_options=None):
+        super().__init__(php_path, project_path, php_options, site_php)
+        self.tuning_overrides = tuning_overrides or {}
+        self.nginx_options = nginx_options or {}
+        self.microcache = bool(self.nginx_options.get("microcache"))
+        self.cache_dir = os.path.normpath(os.path.join(project_path, "userdata", "nginx_cache"))
         self.nginx_path = os.path.normpath(nginx_path)
         self.php_path = php_path
         self.project_path = project_path
@@ -180,6 +1596,7 @@ class NginxPHP(PHP):
         self.conf_path = os.path.normpath(os.path.join(self.nginx_path, "conf", "nginx.conf"))
         self.module_log_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "modules_logs"))
         self.sites_path = os.path.join(self.project_path, "sites")
+        self.vhost_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "vhosts", "nginx"))
 
         self.log_dir = os.path.join(self.project_path, "userdata", "logs")
         os.makedirs(self.log_dir, exist_ok=True)
@@ -193,64 +1610,105 @@ class NginxPHP(PHP):
         )
         self.setup_php_ini()
 
-    def configure_nginx(self):
-        config = f"""
-        worker_processes  1;
-        events {{
-            worker_connections  1024;
-        }}
-        http {{
-            include       mime.types;
-            default_type  application/octet-stream;
-            sendfile        on;
-            keepalive_timeout  65;
-            
-            error_log  {self.module_log_dir}/nginx_error.log;
-            access_log {self.module_log_dir}/nginx_access.log;
-                
-            server {{
-                listen 80;
-                server_name localhost;
-                root {self.sites_path};
-                index index.php index.html;
-                
-                error_log  {self.module_log_dir}/nginx_error.log;
-                access_log {self.module_log_dir}/nginx_access.log;
-            
-                location / {{
-                    try_files $uri $uri/ =404;
-                }}
-
-                location ~ \\.php$ {{
-                    include fastcgi_params;
-                    fastcgi_pass 127.0.0.1:9000;
-                    fastcgi_index index.php;
-                    fastcgi_param SCRIPT_FILENAME $document_root$fastcgi_script_name;
-                    fastcgi_param PATH_TRANSLATED $document_root$fastcgi_script_name;
-                    fastcgi_param QUERY_STRING $query_string;
-                    fastcgi_param REQUEST_METHOD $request_method;
-                    fastcgi_param CONTENT_TYPE $content_type;
-                    fastcgi_param CONTENT_LENGTH $content_length;
-                    fastcgi_param SCRIPT_NAME $fastcgi_script_name;
-                    fastcgi_param REQUEST_URI $request_uri;
-                    fastcgi_param DOCUMENT_URI $document_uri;
-                    fastcgi_param DOCUMENT_ROOT $document_root;
-                    fastcgi_param SERVER_PROTOCOL $server_protocol;
-                    fastcgi_param REMOTE_ADDR $remote_addr;
-                    fastcgi_param REMOTE_PORT $remote_port;
-                    fastcgi_param SERVER_ADDR $server_addr;
-                    fastcgi_param SERVER_PORT $server_port;
-                    fastcgi_param SERVER_NAME $server_name;
-                    
-                }}
-            }}
-        }}
-        """
+    def _php_location(self, upstream):
+        microcache = render_microcache_location(self.nginx_options.get("microcache_ttl", "1s")) \
+            if self.microcache else ""
+        return render_template("nginx_php_location.conf", upstream=upstream, microcache=microcache,
+                               keep_conn=self._keep_conn(upstream))
+
+    def _keep_conn(self, upstream):
+        # с одним php-cgi least_conn не из чего выбирать: процесс ждёт на простаивающем keep-alive соединении,
+        # а второй одновременный запрос стоит в его очереди, пока nginx не закроет соединение, вплоть до
+        # fastcgi_read_timeout и 504. Явное значение fastcgi_keep_conn из tuning.nginx не перекрывается
+        if (self.tuning_overrides.get("nginx") or {}).get("fastcgi_keep_conn") not in (None, ""):
+            return ""
+        pool = next((pool for version, pool in self.pools.items() if php_upstream_name(version) == upstream), None)
+        return "fastcgi_keep_conn off;" if pool is not None and pool.workers == 1 else ""
+
+    def _site_server(self, server_names, root, upstream, listen="80"):
+        return render_template("nginx_site.conf", listen=listen, server_names=" ".join(server_names), root=root,
+                               php_location=self._php_location(upstream)) + "\n"
 
-        with open(self.conf_path, "w", encoding="utf-8") as conf_file:
-            conf_file.write(config)
+    def configure_nginx(self):
+        tuning = tune_nginx("nginx", self.tuning_overrides.get("nginx"))
+        record_tuning(self.project_path, "nginx", tuning)
+        changed = sync_fragments(self.vhost_dir, {
+            site["name"]: self._site_server(site["server_names"], site["root"], self.site_upstream(site["name"]))
+            for site in self.sites
+        })
+        # worker_processes auto из tuning.nginx означает процесс на ядро
+        nginx_workers = tuning["worker_processes"]
+        http_blocks = [self.nginx_upstreams(nginx_workers if isinstance(nginx_workers, int) else get_cpu_count())]
+        if self.microcache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            http_blocks.insert(0, render_microcache_http(self.cache_dir))
+        config = render_nginx_config(
+            tuning,
+            self.module_log_dir,
+            "\n\n".join(http_blocks),
+            self._site_server(["localhost"], self.sites_path, php_upstream_name(self.php_version),
+                              listen="80 default_server").rstrip("\n"),
+            self.vhost_dir,
+        )
+        if write_config(self.conf_path, config):
+            changed.add("nginx.conf")
 
         logging.info(f"Nginx сконфигурирован для папки сайтов: {self.sites_path}")
+        return changed
+
+    def test_nginx(self):
+        command = rf'"{self.nginx_path}\nginx.exe" -t -c "{self.conf_path.replace("\\", "/")}" -p "{self.nginx_path.replace("\\", "/")}"'
+        return self._execute_command(command, "Конфигурация nginx прошла проверку.", log_file=self.nginx_log)
+
+    def reload_nginx(self):
+        if not self.test_nginx():
+            logging.error("Конфигурация nginx не прошла проверку (nginx -t), перезагрузка отменена.")
+            return False
+        # старые рабочие процессы дообслуживают начатые запросы и завершаются сами
+        command = rf'"{self.nginx_path}\nginx.exe" -s reload -c "{self.conf_path.replace("\\", "/")}" -p "{self.nginx_path.replace("\\", "/")}"'
+        return self._execute_command(command, "Nginx перечитал конфигурацию.", log_file=self.nginx_log)
+
+    def reload_front(self):
+        changed = self.configure_nginx()
+        return not changed or self.reload_nginx()
+
+    def switch_nginx(self, nginx_path):
+        """Переключает версию nginx. Конфигурация новой версии проверяется (nginx -t) до того, как старая
+        перестанет принимать соединения; старая завершается через -s quit и дообслуживает начатые запросы.
+        Порт 80 не может слушать два процесса сразу, поэтому между ними остаётся короткий промежуток."""
+        if os.path.normpath(nginx_path) == self.nginx_path:
+            return True
+        old_path, old_conf = self.nginx_path, self.conf_path
+        self.nginx_path = os.path.normpath(nginx_path)
+        self.conf_path = os.path.normpath(os.path.join(self.nginx_path, "conf", "nginx.conf"))
+        self.configure_nginx()
+        if not self.test_nginx():
+            logging.error(f"Конфигурация nginx из {nginx_path} не прошла проверку, версия не переключена.")
+            self.nginx_path, self.conf_path = old_path, old_conf
+            return False
+        command = rf'"{old_path}\nginx.exe" -s quit -c "{old_conf.replace("\\", "/")}" -p "{old_path.replace("\\", "/")}"'
+        self._execute_command(command, "Nginx предыдущей версии остановлен.", log_file=self.nginx_log)
+        wait_for_port_closed("127.0.0.1", 80)
+        self.run_nginx()
+        return wait_for_port("127.0.0.1", 80)
+
+    def reload(self, php_options=None, site_php=None, tuning_overrides=None, nginx_options=None):
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        if nginx_options is not None:
+            self.nginx_options = nginx_options
+            self.microcache = bool(self.nginx_options.get("microcache"))
+        if self.update_options(php_options, site_php):
+            # замена процессов сама перечитывает nginx, в том числе с новыми настройками
+            return self.reload_php()
+        changed = self.configure_nginx()
+        if changed:
+            logging.info(f"Изменены конфигурации: {', '.join(sorted(changed))}")
+            return self.reload_nginx()
+        return True
+
+    def purge_cache(self, prefix=None):
+        return purge_fastcgi_cache(self.cache_dir, prefix)
 
     def run_nginx(self):
         self.configure_nginx()
@@ -261,10 +1719,17 @@ class NginxPHP(PHP):
         command = rf'"{self.nginx_path}\nginx.exe" -s stop -c "{self.conf_path.replace("\\", "/")}" -p "{self.nginx_path.replace("\\", "/")}"'
         self._execute_command(command, "Nginx остановлен.", log_file=self.nginx_log)
 
-    def restart_nginx(self):
+    def restart_nginx(self, force=False):
+        if not self.configure_nginx() and not force:
+            logging.info("Конфигурация nginx не изменилась, перезапуск не нужен.")
+            return False
+        if self.reload_nginx():
+            return True
+        # мягкий перезапуск не удался (например, nginx не запущен)
         self.stop_nginx()
         self.run_nginx()
         logging.info("Nginx перезапущен.")
+        return True
 
     def run(self):
         self.run_php()
@@ -272,16 +1737,20 @@ class NginxPHP(PHP):
 
     def stop(self):
         self.stop_nginx()
+        self.stop_pools()
         self.stop_php()
 
     def restart(self):
-        self.stop()
-        self.run()
+        self.setup_php_ini()
+        self.restart_php()
+        self.restart_nginx()
 
 
 class HybridServer(PHP):
-    def __init__(self, apache_path, nginx_path, php_path, project_path):
-        super().__init__(php_path, project_path)
+    def __init__(self, apache_path, nginx_path, php_path, project_path, php_options=None, site_php=None,
+                 tuning_overrides=None):
+        super().__init__(php_path, project_path, php_options, site_php)
+        self.tuning_overrides = tuning_overrides or {}
 
         self.module_log_dir = self.module_log_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "modules_logs"))
         self.apache_path = apache_path
@@ -290,6 +1759,9 @@ class HybridServer(PHP):
         self.project_path = project_path
         self.sites_path = os.path.join(self.project_path, "sites")
         self.conf_nginx_path = os.path.normpath(os.path.join(self.nginx_path, "conf", "nginx.conf"))
+        self.apache_port = APACHE_BACKEND_PORT
+        self.nginx_vhost_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "vhosts", "hybrid_nginx"))
+        self.apache_vhost_dir = os.path.normpath(os.path.join(self.project_path, "userdata", "vhosts", "hybrid_apache"))
 
 
 
@@ -308,103 +1780,83 @@ class HybridServer(PHP):
 
         self.setup_php_ini()
 
-    def configure_apache(self):
-        conf_path = os.path.join(self.apache_path, "conf", "httpd.conf")
-
-        sites_path = os.path.join(self.project_path, "sites")
-        php_e = "" if self.php_version_major == "8" else "7"
-        apache_dll_path = os.path.join(self.php_path, f"php{self.php_version_major}apache2_4.dll")
-        authz_core_module = os.path.join(self.apache_path, "modules", "mod_authz_core.so")
-        mod_authz_host = os.path.join(self.apache_path, "modules", "mod_authz_host.so")
-        mod_mime = os.path.join(self.apache_path, "modules", "mod_mime.so")
-
-        config = f"""
-        Listen 8080
-        <VirtualHost *:8080>
-            ServerName site1.su
-            DocumentRoot "{sites_path}/site1"
-            <Directory "{sites_path}/site1">
-                AllowOverride All
-                Require all granted
-            </Directory>
-        </VirtualHost>
-        
-        <VirtualHost *:8080>
-            ServerName localhost
-            DocumentRoot "{sites_path}/site2"
-            <Directory "{sites_path}/site2">
-                AllowOverride All
-                Require all granted
-            </Directory>
-        </VirtualHost>
-        
-        ErrorLog "{self.module_log_dir}/apache_error.log"
-
-        LoadModule authz_core_module {authz_core_module}
-        LoadModule authz_host_module {mod_authz_host}
-        LoadModule mime_module {mod_mime}
-        LoadModule php{php_e}_module "{apache_dll_path}"
-        AddHandler application/x-httpd-php .php
-        PHPIniDir "{self.php_path}"
-        """
+    @property
+    def conf_apache_path(self):
+        # у каждого порта свой конфиг и свой PidFile, чтобы два экземпляра Apache не мешали друг другу
+        return os.path.join(self.apache_path, "conf", f"httpd_{self.apache_port}.conf")
 
-        with open(conf_path, "w", encoding="utf-8") as conf_file:
-            conf_file.write(config)
+    def configure_apache(self):
+        tuning = tune_apache("hybrid", self.tuning_overrides.get("apache"))
+        record_tuning(self.project_path, "apache", tuning)
+        modules, fastcgi = self.apache_modules(self.apache_path, "hybrid")
+        changed = sync_fragments(self.apache_vhost_dir, {
+            # фрагменты не привязаны к порту: их читают оба экземпляра Apache при смене версии
+            site["name"]: render_apache_vhost(site["server_names"], site["root"], "*",
+                                              self.apache_php_handler(site["name"], fastcgi))
+            for site in self.sites
+        })
+        load_modules, module_directives = render_apache_modules(self.apache_path, modules)
+        config = render_template(
+            "httpd.conf",
+            apache_path=self.apache_path,
+            pid_file=f"logs/httpd_{self.apache_port}.pid",
+            listen=f"127.0.0.1:{self.apache_port}",
+            load_modules=load_modules,
+            sites_path=self.sites_path,
+            log_dir=self.module_log_dir,
+            # журнал доступа ведёт nginx
+            access_log="",
+            tuning=render_apache_directives(tuning),
+            module_directives=module_directives,
+            php=self.apache_php(fastcgi),
+            default_vhost=render_apache_vhost(["localhost"], self.sites_path, "*",
+                                              self.apache_php_handler(None, fastcgi)),
+            vhost_dir=self.apache_vhost_dir,
+        ) + "\n"
+        if write_config(self.conf_apache_path, config):
+            changed.add("httpd.conf")
+
+        logging.info(f"Apache сконфигурирован для работы на порту {self.apache_port} с PHP из {self.php_path}")
+        return changed
 
-        logging.info(f"Apache сконфигурирован для работы на порту 8080 с PHP из {self.php_path}")
+    @staticmethod
+    def _hybrid_server(server_names, document_root, default=False):
+        root_static_safe, apache_prefixes = find_htaccess_prefixes(document_root)
+        listen = "80 default_server" if default else "80"
+        proxy = render_template("nginx_apache_proxy.conf")
+        if not root_static_safe:
+            # корневой .htaccess управляет доступом или заголовками: весь сайт обслуживает Apache
+            return render_template("nginx_hybrid_proxy_site.conf", listen=listen,
+                                   server_names=" ".join(server_names), proxy=proxy)
+
+        htaccess_locations = "\n\n".join(render_template("nginx_apache_location.conf", prefix=prefix, proxy=proxy)
+                                          for prefix in apache_prefixes)
+        return render_template("nginx_hybrid_site.conf", listen=listen, server_names=" ".join(server_names),
+                               root=document_root, htaccess_locations=htaccess_locations,
+                               static_extensions=STATIC_EXTENSIONS, proxy=proxy)
 
     def configure_nginx(self):
-        conf_path = os.path.join(self.nginx_path, "conf", "nginx.conf")
-
-        config = f"""
-        worker_processes  1;
-        events {{
-            worker_connections  1024;
-        }}
-        http {{
-            include       mime.types;
-            default_type  application/octet-stream;
-            sendfile        on;
-            keepalive_timeout  65;
-            
-            error_log  {self.module_log_dir}/nginx_error.log;
-            access_log {self.module_log_dir}/nginx_access.log;
-                server {{
-                    listen 80;
-                    server_name site1.su;
-                
-                    # Либо отдаём статику прямо, а PHP/другое проксируем.
-                    location / {{
-                        proxy_pass http://127.0.0.1:8080;
-                        proxy_set_header Host $host;
-                        proxy_set_header X-Real-IP $remote_addr;
-                        # и другие нужные заголовки
-                    }}
-                }}
-                
-                # Для site2.ru
-                server {{
-                    listen 80;
-                    server_name site2.ru;
-                
-                    location / {{
-                        proxy_pass http://127.0.0.1:8080;
-                        proxy_set_header Host $host;
-                        proxy_set_header X-Real-IP $remote_addr;
-                    }}
-                }}
-        }}
-        """
-
-        with open(conf_path, "w", encoding="utf-8") as conf_file:
-            conf_file.write(config)
+        tuning = tune_nginx("hybrid", self.tuning_overrides.get("nginx"))
+        record_tuning(self.project_path, "nginx", tuning)
+        changed = sync_fragments(self.nginx_vhost_dir, {
+            site["name"]: self._hybrid_server(site["server_names"], site["root"]) + "\n" for site in self.sites
+        })
+        config = render_nginx_config(
+            tuning,
+            self.module_log_dir,
+            render_template("nginx_hybrid_upstream.conf", port=self.apache_port),
+            self._hybrid_server(["localhost"], self.sites_path, default=True),
+            self.nginx_vhost_dir,
+        )
+        if write_config(self.conf_nginx_path, config):
+            changed.add("nginx.conf")
 
-        logging.info(f"Nginx сконфигурирован как реверс-прокси для Apache (порт 8080)")
+        logging.info(f"Nginx отдаёт статику напрямую и проксирует динамику в Apache (порт {self.apache_port})")
+        return changed
 
     def run_apache(self):
-
         self.configure_apache()
-        command = rf'"{self.apache_path}\bin\httpd.exe"'
+        command = rf'"{self.apache_path}\bin\httpd.exe" -f "{self.conf_apache_path}"'
         self._execute_command(command, "Apache запущен.", log_file=self.apache_log, wait=False)
 
     def stop_apache(self):
@@ -414,10 +1866,17 @@ class HybridServer(PHP):
         except:
             pass
 
-    def restart_apache(self):
+    def restart_apache(self, force=False):
+        if not self.configure_apache() and not force:
+            logging.info("Конфигурация Apache не изменилась, перезапуск не нужен.")
+            return False
+        if self.reload_apache():
+            return True
+        # мягкий перезапуск не удался (например, Apache не запущен)
         self.stop_apache()
         self.run_apache()
         logging.info("Apache перезапущен.")
+        return True
 
     def run_nginx(self):
         self.configure_nginx()
@@ -428,70 +1887,751 @@ class HybridServer(PHP):
         command = rf'"{self.nginx_path}\nginx.exe" -s stop -c "{self.conf_nginx_path.replace("\\", "/")}" -p "{self.nginx_path.replace("\\", "/")}"'
         self._execute_command(command, "Nginx остановлен.", log_file=self.nginx_log)
 
-    def restart_nginx(self):
+    def restart_nginx(self, force=False):
+        if not self.configure_nginx() and not force:
+            logging.info("Конфигурация nginx не изменилась, перезапуск не нужен.")
+            return False
+        if self.reload_nginx():
+            return True
+        # мягкий перезапуск не удался (например, nginx не запущен)
         self.stop_nginx()
         self.run_nginx()
         logging.info("Nginx перезапущен.")
+        return True
+
+    def test_apache(self):
+        command = rf'"{self.apache_path}\bin\httpd.exe" -t -f "{self.conf_apache_path}"'
+        return self._execute_command(command, "Конфигурация Apache прошла проверку.", log_file=self.apache_log)
+
+    def reload_apache(self):
+        if not self.test_apache():
+            logging.error("Конфигурация Apache не прошла проверку (httpd -t), перезагрузка отменена.")
+            return False
+        signal = "restart" if os.name == "nt" else "graceful"
+        command = rf'"{self.apache_path}\bin\httpd.exe" -k {signal} -f "{self.conf_apache_path}"'
+        return self._execute_command(command, "Apache перечитал конфигурацию.", log_file=self.apache_log)
+
+    def test_nginx(self):
+        command = rf'"{self.nginx_path}\nginx.exe" -t -c "{self.conf_nginx_path.replace("\\", "/")}" -p "{self.nginx_path.replace("\\", "/")}"'
+        return self._execute_command(command, "Конфигурация nginx прошла проверку.", log_file=self.nginx_log)
+
+    def reload_nginx(self):
+        if not self.test_nginx():
+            logging.error("Конфигурация nginx не прошла проверку (nginx -t), перезагрузка отменена.")
+            return False
+        command = rf'"{self.nginx_path}\nginx.exe" -s reload -c "{self.conf_nginx_path.replace("\\", "/")}" -p "{self.nginx_path.replace("\\", "/")}"'
+        return self._execute_command(command, "Nginx перечитал конфигурацию.", log_file=self.nginx_log)
+
+    def uses_pools(self):
+        return self.php_options.get("handler", "module") == "fastcgi"
+
+    def reload_front(self):
+        # пулы PHP в гибридном режиме подключены к Apache, nginx о них не знает
+        changed = self.configure_apache()
+        return not changed or self.reload_apache()
+
+    def reload_php(self):
+        if self.uses_pools():
+            return super().reload_php()
+        # mod_php перечитывает php.ini при мягком перезапуске Apache
+        return self.reload_apache()
+
+    def _shutdown_apache(self, apache_path, conf_path):
+        signal = "shutdown" if os.name == "nt" else "graceful-stop"
+        command = rf'"{apache_path}\bin\httpd.exe" -k {signal} -f "{conf_path}"'
+        return self._execute_command(command, "Apache остановлен.", log_file=self.apache_log)
+
+    def _switch_backend(self, apache_path, php_path, drain_seconds=2.0):
+        """Сине-зелёная замена Apache за nginx.
+
+        Новый экземпляр запускается на свободном порту из APACHE_BACKEND_PORTS и должен ответить на
+        HTTP-запрос. Только после этого nginx переводит на него upstream, а старый экземпляр дообслуживает
+        начатые запросы и останавливается. Если новый экземпляр не поднялся, всё остаётся как было.
+        """
+        blue_apache_path, blue_php_path, blue_port = self.apache_path, self.php_path, self.apache_port
+        blue_conf = self.conf_apache_path
+        self.apache_path = apache_path
+        self._set_php_version(php_path)
+        self.setup_php_ini()
+        self.apache_port = next(port for port in APACHE_BACKEND_PORTS if port != blue_port)
+        self.configure_apache()
+
+        green_ready = self.test_apache()
+        if green_ready:
+            self.run_apache()
+            status = http_probe("127.0.0.1", self.apache_port) \
+                if wait_for_port("127.0.0.1", self.apache_port) else None
+            green_ready = status is not None and status < 500
+            if green_ready:
+                self.configure_nginx()
+                green_ready = self.reload_nginx()
+            if not green_ready:
+                self._shutdown_apache(self.apache_path, self.conf_apache_path)
+        if not green_ready:
+            logging.error(f"Apache из {apache_path} с PHP {self.php_version} не прошёл проверку, "
+                          f"трафик остаётся на порту {blue_port}.")
+            self.apache_path, self.apache_port = blue_apache_path, blue_port
+            self._set_php_version(blue_php_path)
+            self.configure_apache()
+            self.configure_nginx()
+            return False
+
+        time.sleep(drain_seconds)
+        self._shutdown_apache(blue_apache_path, blue_conf)
+        self._sync_pools(start=self.uses_pools())
+        self.pool = self.pools[self.php_version]
+        logging.info(f"Apache переключён на порт {self.apache_port} ({apache_path}, PHP {self.php_version}).")
+        return True
+
+    def switch_php(self, php_path, drain_seconds=2.0):
+        if self.uses_pools():
+            # пул новой версии поднимается рядом со старым, Apache переключается мягким перезапуском
+            return super().switch_php(php_path, drain_seconds)
+        if os.path.normpath(php_path) == os.path.normpath(self.php_path):
+            return True
+        return self._switch_backend(self.apache_path, php_path, drain_seconds)
+
+    def switch_apache(self, apache_path, drain_seconds=2.0):
+        if os.path.normpath(apache_path) == os.path.normpath(self.apache_path):
+            return True
+        return self._switch_backend(apache_path, self.php_path, drain_seconds)
+
+    def switch_nginx(self, nginx_path):
+        """Переключает версию nginx; см. NginxPHP.switch_nginx."""
+        if os.path.normpath(nginx_path) == os.path.normpath(self.nginx_path):
+            return True
+        old_path, old_conf = self.nginx_path, self.conf_nginx_path
+        self.nginx_path = nginx_path
+        self.conf_nginx_path = os.path.normpath(os.path.join(self.nginx_path, "conf", "nginx.conf"))
+        self.configure_nginx()
+        if not self.test_nginx():
+            logging.error(f"Конфигурация nginx из {nginx_path} не прошла проверку, версия не переключена.")
+            self.nginx_path, self.conf_nginx_path = old_path, old_conf
+            return False
+        command = rf'"{old_path}\nginx.exe" -s quit -c "{old_conf.replace("\\", "/")}" -p "{old_path.replace("\\", "/")}"'
+        self._execute_command(command, "Nginx предыдущей версии остановлен.", log_file=self.nginx_log)
+        wait_for_port_closed("127.0.0.1", 80)
+        self.run_nginx()
+        return wait_for_port("127.0.0.1", 80)
+
+    def reload(self, php_options=None, site_php=None, tuning_overrides=None):
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        php_changed = self.update_options(php_options, site_php)
+        success = True
+        if php_changed and self.uses_pools():
+            # замена процессов сама перечитывает Apache
+            success = self.reload_php()
+            php_changed = False
+        # Apache перечитывается первым: nginx не должен проксировать на ещё не объявленный vhost
+        apache_changed = self.configure_apache()
+        if apache_changed or php_changed:
+            success = self.reload_apache() and success
+        if not self.uses_pools():
+            self.stop_pools()
+        nginx_changed = self.configure_nginx()
+        if nginx_changed:
+            success = self.reload_nginx() and success
+        changed = apache_changed | nginx_changed
+        if changed:
+            logging.info(f"Изменены конфигурации: {', '.join(sorted(changed))}")
+        return success
 
     def run(self):
-        self.run_php()
+        if self.uses_pools():
+            self.run_php()
         self.run_apache()
         self.run_nginx()
 
     def stop(self):
         self.stop_nginx()
         self.stop_apache()
+        self.stop_pools()
         self.stop_php()
 
     def restart(self):
-        self.stop()
-        self.run()
-
-
-class Postgresql:
-    def __init__(self, postgresql_path, project_path):
-        self.is_running = False
-        self.path = postgresql_path
-
-        self.log_dir = os.path.join(project_path, "userdata", "logs")
-        os.makedirs(self.log_dir, exist_ok=True)
-
-        self.log_file = os.path.join(self.log_dir, "postgresql.log")
-        logging.basicConfig(
-            filename=self.log_file,
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s"
-        )
-        logging.info("Postgresql initialized")
+        self.setup_php_ini()
+        self.restart_php()
+        self.restart_apache()
+        self.restart_nginx()
+
+
+DATABASE_PROFILES = ("dev-fast", "durable", "benchmark")
+SERVICE_STATES = ("stopped", "initializing", "starting", "running", "failed")
+# данные эфемерного сервера удаляются при остановке, поэтому сбрасывать их на диск незачем
+EPHEMERAL_TUNING = {
+    "mysql": {"innodb_flush_log_at_trx_commit": 0, "innodb_doublewrite": "OFF", "sync_binlog": 0},
+    "postgresql": {"fsync": "off", "synchronous_commit": "off", "full_page_writes": "off"},
+    "redis": {"save": "", "appendonly": False},
+}
+MYSQL_PORT = 3306
+
+
+def mysql_version(mysql_path):
+    match = re.search(r"(\d+)\.(\d+)\.(\d+)", os.path.basename(os.path.normpath(mysql_path)))
+    if match:
+        return tuple(int(part) for part in match.groups())
+    raise ValueError(f"Не удалось определить версию MySQL из пути: {mysql_path}")
+
+
+def tune_mysql(version, profile, overrides=None):
+    """Подбирает буферы InnoDB, журнал, число соединений и временные таблицы под объём памяти,
+    профиль (dev-fast, durable, benchmark) и версию MySQL (5.7, 8.0, 8.4, 9.x)."""
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"Неизвестный профиль MySQL: {profile}")
+    memory_mb = get_total_memory_mb()
+    durable = profile == "durable"
+    benchmark = profile == "benchmark"
+
+    # на машине разработчика MySQL делит память с веб-сервером, PHP и браузером
+    if benchmark:
+        buffer_pool_mb = clamp(memory_mb // 2, 512, 16384)
+    elif durable:
+        buffer_pool_mb = clamp(memory_mb // 4, 256, 8192)
+    else:
+        buffer_pool_mb = clamp(memory_mb // 8, 128, 2048)
+    # размер пула InnoDB всё равно округляет до innodb_buffer_pool_chunk_size (128 МБ)
+    buffer_pool_mb = max(buffer_pool_mb // 128, 1) * 128
+    redo_log_mb = clamp(buffer_pool_mb // 4, 96, 2048)
+    tmp_table_mb = clamp(memory_mb // 128, 16, 256)
+
+    values = {
+        "innodb_buffer_pool_size": f"{buffer_pool_mb}M",
+        # 2 сбрасывает журнал на диск раз в секунду: при сбое ОС теряется не больше секунды транзакций
+        "innodb_flush_log_at_trx_commit": 1 if durable else 2,
+        "max_connections": clamp(memory_mb // 32, 200, 2000) if benchmark else
+        clamp(memory_mb // 64, 151, 500) if durable else 100,
+        "tmp_table_size": f"{tmp_table_mb}M",
+        "max_heap_table_size": f"{tmp_table_mb}M",
+        "skip-name-resolve": True,
+        "performance_schema": "ON" if durable else "OFF",
+    }
+    if version >= (8, 0, 30):
+        # innodb_log_file_size и innodb_log_files_in_group заменены одной ёмкостью журнала
+        values["innodb_redo_log_capacity"] = f"{redo_log_mb}M"
+    else:
+        values["innodb_log_file_size"] = f"{redo_log_mb // 2}M"
+        values["innodb_log_files_in_group"] = 2
+    if version >= (8, 0):
+        # внутренние временные таблицы 8.0+ живут в TempTable, а не в MEMORY
+        values["temptable_max_ram"] = f"{clamp(memory_mb // 16, 64, 1024)}M"
+        if durable:
+            values["sync_binlog"] = 1
+        else:
+            # двоичный журнал включён по умолчанию с 8.0 и без репликации только пишет лишнее
+            values["skip-log-bin"] = True
+    else:
+        values.update({
+            # в 5.7 по умолчанию latin1 и сброс соседних страниц, рассчитанный на HDD
+            "character-set-server": "utf8mb4",
+            "collation-server": "utf8mb4_unicode_ci",
+            "innodb_flush_neighbors": 0,
+            "query_cache_type": 0,
+            "query_cache_size": 0,
+        })
+        if durable:
+            values["sync_binlog"] = 1
+
+    for directive, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        values[directive] = value
+    return values
+
+
+_datadir_init_threads = {}
+_datadir_init_lock = threading.Lock()
+
+
+def initialize_datadir(datadir, build_command, log_file):
+    """Создаёт каталог данных СУБД командой build_command(каталог), если его ещё нет.
+
+    Инициализация идёт во временный каталог, который переименовывается в datadir только после успешного
+    завершения, поэтому существующий каталог данных всегда целый, а остатки прерванной попытки удаляются.
+    Возвращает True, если каталог данных готов.
+    """
+    if os.path.isdir(datadir):
+        return True
+    staging = datadir + ".init"
+    shutil.rmtree(staging, ignore_errors=True)
+    command = build_command(staging)
+    started = time.monotonic()
+    try:
+        with open(log_file, "a") as log_output:
+            returncode = subprocess.run(command, stdout=log_output, stderr=log_output).returncode
+    except OSError:
+        logging.error(f"Ошибка инициализации {datadir}: {traceback.format_exc()}")
+        return False
+    if returncode != 0:
+        logging.error(f"{os.path.basename(command[0])} для {datadir} завершился с кодом {returncode}, смотри {log_file}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    os.replace(staging, datadir)
+    logging.info(f"Каталог данных {datadir} создан за {time.monotonic() - started:.1f} с")
+    return True
+
+
+def prepare_datadir(datadir, build_command, log_file):
+    """Запускает инициализацию каталога данных в фоне. Повторный вызов для того же каталога
+    возвращает уже идущий поток; None - каталог уже готов."""
+    datadir = os.path.normpath(datadir)
+    with _datadir_init_lock:
+        if os.path.isdir(datadir):
+            return None
+        thread = _datadir_init_threads.get(datadir)
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=initialize_datadir, args=(datadir, build_command, log_file),
+                                      name=f"datadir-init-{os.path.basename(os.path.dirname(datadir))}", daemon=True)
+            _datadir_init_threads[datadir] = thread
+            thread.start()
+        return thread
+
+
+def wait_datadir(datadir, build_command, log_file, timeout=300.0):
+    """Дожидается фоновой инициализации (или запускает её) и возвращает True, если каталог данных готов."""
+    thread = prepare_datadir(datadir, build_command, log_file)
+    if thread is not None:
+        logging.info(f"Ожидание инициализации каталога данных {datadir}")
+        thread.join(timeout)
+    return os.path.isdir(datadir)
+
+
+SNAPSHOT_METHODS = ("auto", "reflink", "hardlink", "archive")
+SNAPSHOT_MANIFEST = "snapshot.json"
+SNAPSHOT_NAME = re.compile(r"^[\w.-]+$")
+# ioctl FICLONE из linux/fs.h: файл-приёмник получает общие с источником блоки
+FICLONE = 0x40049409
+FILE_SUPPORTS_BLOCK_REFCOUNTING = 0x08000000
+
+
+def clone_file(source, target):
+    """Копирует файл без копирования данных: копии делят блоки, пока одну из них не изменят (reflink).
+    Возвращает False, если файловая система так не умеет."""
+    if os.name == "nt":
+        # shutil.copy2 с Python 3.12 вызывает CopyFile2, а он на ReFS и Dev Drive клонирует блоки сам
+        shutil.copy2(source, target)
+        return True
+    if sys.platform == "darwin":
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.clonefile(os.fsencode(source), os.fsencode(target), 0) == 0
+    import fcntl
+    try:
+        with open(source, "rb") as source_file, open(target, "wb") as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+    shutil.copystat(source, target)
+    return True
+
+
+def reflink_supported(path):
+    """Проверяет, умеет ли файловая система каталога path клонировать файлы (Btrfs, XFS, APFS, ReFS, Dev Drive)."""
+    if os.name == "nt":
+        flags = ctypes.c_ulong()
+        root = os.path.splitdrive(os.path.abspath(path))[0] + "\\"
+        if not ctypes.windll.kernel32.GetVolumeInformationW(root, None, 0, None, None, ctypes.byref(flags), None, 0):
+            return False
+        return bool(flags.value & FILE_SUPPORTS_BLOCK_REFCOUNTING)
+    probe = os.path.join(path, ".reflink-probe")
+    try:
+        with open(probe, "wb") as probe_file:
+            probe_file.write(b"\0")
+        return clone_file(probe, probe + ".clone")
+    except OSError:
+        return False
+    finally:
+        for leftover in (probe, probe + ".clone"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def same_file_state(first, second):
+    # копии создаются с сохранением времени изменения, поэтому совпадение размера и mtime означает,
+    # что файл не менялся с момента копирования
+    return first.st_size == second.st_size and first.st_mtime_ns == second.st_mtime_ns
+
+
+def tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def copy_tree(source, target, method, previous=None):
+    """Копирует каталог source в новый каталог target. reflink клонирует файлы, hardlink копирует их,
+    а файлы, не изменившиеся с предыдущего снимка previous, делает жёсткими ссылками на него.
+    Жёсткие ссылки допустимы только между снимками: СУБД меняют файлы данных на месте."""
+    for root, _, files in os.walk(source):
+        relative_root = os.path.relpath(root, source)
+        os.makedirs(os.path.join(target, relative_root), exist_ok=True)
+        shutil.copymode(root, os.path.join(target, relative_root))
+        for name in files:
+            relative = os.path.join(relative_root, name)
+            source_file, target_file = os.path.join(source, relative), os.path.join(target, relative)
+            if method == "reflink" and clone_file(source_file, target_file):
+                continue
+            if previous:
+                previous_file = os.path.join(previous, relative)
+                if os.path.isfile(previous_file) and same_file_state(os.stat(source_file), os.stat(previous_file)):
+                    os.link(previous_file, target_file)
+                    continue
+            shutil.copy2(source_file, target_file)
+
+
+def sync_tree(source, target, reflink=False):
+    """Приводит каталог target к содержимому source, перезаписывая только изменившиеся файлы.
+    После сброса среды обычно изменена малая часть файлов, поэтому восстановление идёт быстрее полного копирования."""
+    expected = set()
+    for root, _, files in os.walk(source):
+        relative_root = os.path.normpath(os.path.relpath(root, source))
+        os.makedirs(os.path.join(target, relative_root), exist_ok=True)
+        # PostgreSQL не запускается, если каталог данных доступен не только владельцу
+        shutil.copymode(root, os.path.join(target, relative_root))
+        expected.add(relative_root)
+        for name in files:
+            relative = os.path.normpath(os.path.join(relative_root, name))
+            expected.add(relative)
+            source_file, target_file = os.path.join(source, relative), os.path.join(target, relative)
+            if os.path.isfile(target_file) and same_file_state(os.stat(source_file), os.stat(target_file)):
+                continue
+            if os.path.exists(target_file):
+                # жёсткую ссылку или файл только для чтения нельзя перезаписывать на месте
+                os.remove(target_file)
+            if not (reflink and clone_file(source_file, target_file)):
+                shutil.copy2(source_file, target_file)
+    for root, directories, files in os.walk(target, topdown=False):
+        relative_root = os.path.normpath(os.path.relpath(root, target))
+        for name in files:
+            if os.path.normpath(os.path.join(relative_root, name)) not in expected:
+                os.remove(os.path.join(root, name))
+        for name in directories:
+            if os.path.normpath(os.path.join(relative_root, name)) not in expected:
+                os.rmdir(os.path.join(root, name))
+
+
+def list_snapshots(snapshots_dir):
+    """Снимки каталога snapshots_dir от старых к новым."""
+    snapshots = []
+    for name in os.listdir(snapshots_dir) if os.path.isdir(snapshots_dir) else []:
+        manifest_path = os.path.join(snapshots_dir, name, SNAPSHOT_MANIFEST)
+        if not os.path.isfile(manifest_path):
+            continue
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            snapshots.append({"name": name, **json.load(manifest_file)})
+    return sorted(snapshots, key=lambda snapshot: snapshot["created"])
+
+
+def snapshot_path(snapshots_dir, name, existing=True):
+    """Проверяет имя снимка и возвращает его каталог внутри snapshots_dir.
+    С existing=True имя должно принадлежать одному из снимков list_snapshots."""
+    # имя приходит из редактируемого списка панели: "..", "." и пути не должны выводить за snapshots_dir
+    if not SNAPSHOT_NAME.match(name) or name.strip(".") == "":
+        raise ValueError(f"Имя снимка может содержать только буквы, цифры, точку, дефис и подчёркивание: {name}")
+    root = os.path.realpath(snapshots_dir)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"Снимок {name} вне каталога {snapshots_dir}")
+    if existing and name not in [snapshot["name"] for snapshot in list_snapshots(snapshots_dir)]:
+        raise FileNotFoundError(f"Нет снимка {name} в {snapshots_dir}")
+    return path
+
+
+def create_snapshot(datadir, snapshots_dir, name, method="auto"):
+    """Сохраняет каталог данных остановленной СУБД как снимок name и возвращает его описание.
+
+    auto выбирает reflink, если файловая система умеет клонировать файлы, иначе копию каталога с жёсткими
+    ссылками на предыдущий снимок, а если под неё не хватает места на диске - сжатый архив.
+    """
+    target = snapshot_path(snapshots_dir, name, existing=False)
+    if method not in SNAPSHOT_METHODS:
+        raise ValueError(f"Неизвестный способ снимка: {method}")
+    if not os.path.isdir(datadir):
+        raise FileNotFoundError(f"Нет каталога данных {datadir}")
+    os.makedirs(snapshots_dir, exist_ok=True)
+    size = tree_size(datadir)
+    if method == "auto":
+        if reflink_supported(snapshots_dir):
+            method = "reflink"
+        elif shutil.disk_usage(snapshots_dir).free > size * 1.2:
+            method = "hardlink"
+        else:
+            method = "archive"
+    previous = [snapshot for snapshot in list_snapshots(snapshots_dir)
+                if snapshot["method"] == "hardlink" and snapshot["name"] != name]
+
+    started = time.monotonic()
+    # снимок собирается рядом и заменяет одноимённый только целиком
+    staging = target + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    if method == "archive":
+        shutil.make_archive(os.path.join(staging, "data"), "gztar", root_dir=datadir)
+    else:
+        copy_tree(datadir, os.path.join(staging, "data"), method,
+                  os.path.join(snapshots_dir, previous[-1]["name"], "data") if previous else None)
+    manifest = {"method": method, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "size": size}
+    with open(os.path.join(staging, SNAPSHOT_MANIFEST), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, ensure_ascii=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    logging.info(f"Снимок {name} каталога {datadir} ({method}, {size / 1048576:.0f} МБ) "
+                 f"создан за {time.monotonic() - started:.1f} с")
+    return {"name": name, **manifest}
+
+
+def restore_snapshot(datadir, snapshots_dir, name):
+    """Возвращает каталог данных остановленной СУБД к снимку name."""
+    path = snapshot_path(snapshots_dir, name)
+    with open(os.path.join(path, SNAPSHOT_MANIFEST), "r", encoding="utf-8") as manifest_file:
+        method = json.load(manifest_file)["method"]
+    started = time.monotonic()
+    if method == "archive":
+        staging = datadir + ".restore"
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.unpack_archive(os.path.join(path, "data.tar.gz"), staging)
+        shutil.rmtree(datadir, ignore_errors=True)
+        os.replace(staging, datadir)
+    else:
+        sync_tree(os.path.join(path, "data"), datadir, reflink=method == "reflink")
+    logging.info(f"Каталог {datadir} восстановлен из снимка {name} за {time.monotonic() - started:.1f} с")
+
+
+def ram_disk_dir():
+    """Каталог для эфемерных данных: PERESVET_RAMDISK (например, RAM-диск ImDisk в Windows), tmpfs /dev/shm
+    в Linux, иначе временный каталог. В последнем случае данные лежат на диске, но без fsync это почти не заметно."""
+    root = os.environ.get("PERESVET_RAMDISK")
+    if not root:
+        root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, "peresvet")
+
+
+def delete_snapshot(snapshots_dir, name):
+    # файлы, на которые ссылаются другие снимки, остаются у них: удаляется только эта ссылка
+    shutil.rmtree(snapshot_path(snapshots_dir, name))
+
+
+class DatabaseServer:
+    """Общая часть MySQL, PostgreSQL и Redis: состояние определяется проверкой по протоколу сервера,
+    а не фактом запуска процесса.
+
+    run() не блокирует: создание каталога данных, запуск и ожидание готовности идут в фоновом потоке,
+    а wait_ready() позволяет дождаться их тем, кому сервер нужен сразу. Тот же поток затем раз в
+    health_interval проверяет работающий сервер, поэтому status() только читает состояние.
+    """
+    title = ""
+    service_probe = None
+    start_timeout = 60.0
+    stop_timeout = 30.0
+    health_interval = 2.0
+
+    def __init__(self):
+        self.state = "stopped"
+        # datadir создаётся инициализацией перед первым запуском, data_path сервер создаёт сам
+        self.datadir = None
+        self.data_path = None
+        self.ephemeral = False
+        self.seed_snapshot = None
+        self._process = None
+        self._settled = threading.Event()
+        self._settled.set()
+        self._start_cancelled = threading.Event()
+
+    @property
+    def is_running(self):
+        return self.state in ("initializing", "starting", "running")
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.port}"
+
+    @property
+    def port(self):
+        raise NotImplementedError
+
+    @property
+    def data_directory(self):
+        return self.datadir or self.data_path
+
+    @property
+    def version_label(self):
+        return ".".join(map(str, self.version)) if isinstance(self.version, tuple) else str(self.version)
+
+    def storage_path(self, options, persistent_path):
+        """Каталог данных по настройкам сервера: persistent_path или, с ephemeral, каталог в памяти,
+        который удаляется при остановке. seed_snapshot - снимок, которым он заполняется при запуске."""
+        self.ephemeral = bool(options.get("ephemeral"))
+        self.seed_snapshot = options.get("seed_snapshot") or None
+        if not self.ephemeral:
+            return persistent_path
+        return os.path.join(ram_disk_dir(), f"{self.title.lower()}-{self.version_label}")
+
+    def check_storage(self, options):
+        # каталог данных работающего сервера не переносится, новый режим применится при следующем запуске
+        if bool(options.get("ephemeral")) != self.ephemeral:
+            logging.info(f"Размещение данных {self.title} в памяти изменится после остановки и запуска сервера.")
+
+    def ephemeral_tuning(self, section, tuning):
+        # перекрывает и значения из tuning.<section>: надёжность хранения эфемерным данным не нужна
+        return {**tuning, **EPHEMERAL_TUNING[section]} if self.ephemeral else tuning
+
+    def probe(self, timeout=1.0):
+        return self.service_probe(self.address, timeout)
+
+    def _init_command(self):
+        return None
+
+    def _start(self):
+        """Запускает сервер и возвращает запускающий процесс."""
+        raise NotImplementedError
+
+    def _shutdown(self):
+        raise NotImplementedError
+
+    def status(self):
+        """Состояние из SERVICE_STATES. Не ждёт сети: работающий сервер перепроверяет фоновый поток запуска."""
+        return self.state
+
+    def wait_ready(self, timeout=None):
+        """Ждёт завершения запуска и возвращает True, если сервер отвечает."""
+        self._settled.wait(timeout)
+        return self.state == "running"
 
     def run(self):
         if self.is_running:
-            logging.info("PostgreSQL уже запущен.")
+            logging.info(f"{self.title} уже запущен.")
+            return
+        # у каждого запуска свои события, чтобы поток прерванного запуска не стартовал сервер повторно
+        self._start_cancelled = cancelled = threading.Event()
+        self._settled = settled = threading.Event()
+        initializing = self.datadir is not None and not os.path.isdir(self.datadir)
+        self.state = "initializing" if initializing else "starting"
+        threading.Thread(target=self._start_when_ready, args=(cancelled, settled),
+                         name=f"{self.title.lower()}-start", daemon=True).start()
+
+    def _start_when_ready(self, cancelled, settled):
+        try:
+            if self.ephemeral and not os.path.isdir(self.data_directory):
+                os.makedirs(os.path.dirname(self.data_directory), exist_ok=True)
+                if self.seed_snapshot:
+                    restore_snapshot(self.data_directory, self.snapshots_dir, self.seed_snapshot)
+            if self.datadir is not None and not wait_datadir(self.datadir, self._init_command(), self.log_file):
+                logging.error(f"Каталог данных {self.title} в {self.datadir} не создан, запуск отменён.")
+                if not cancelled.is_set():
+                    self.state = "failed"
+                return
+            if cancelled.is_set():
+                return
+            self.state = "starting"
+            process = self._start()
+            self._process = process or None
+            started = time.monotonic()
+            if process and wait_for_service(self.service_probe, self.address, self.start_timeout, process):
+                self.state = "running"
+                logging.info(f"{self.title} принимает подключения на {self.address} "
+                             f"через {time.monotonic() - started:.1f} с")
+            else:
+                self.state = "failed"
+                logging.error(f"{self.title} не начал принимать подключения на {self.address}, смотри {self.log_file}")
+        except Exception:
+            self.state = "failed"
+            logging.error(f"Ошибка запуска {self.title}: {traceback.format_exc()}")
+        finally:
+            settled.set()
+        self._watch_health(cancelled)
+
+    def _watch_health(self, cancelled):
+        # сервер могли остановить в обход панели; остановка через панель прерывает проверки через cancelled
+        while self.state == "running" and not cancelled.wait(self.health_interval):
+            if not self.probe(timeout=0.5) and not cancelled.is_set():
+                logging.error(f"{self.title} на {self.address} перестал отвечать.")
+                self.state = "failed"
+
+    def stop(self, discard=True):
+        """Останавливает сервер. Данные эфемерного сервера удаляются, если не передан discard=False
+        (перезапуск, снимок)."""
+        self._stop_server()
+        if not (discard and self.ephemeral and os.path.isdir(self.data_directory)):
             return
-        command = rf'"{self.path}\bin\pg_ctl.exe" start -D "{self.path}\data" -l "{self.log_file}"'
-        self._execute_command(command, "PostgreSQL запущен.", wait=False)
-        self.is_running = True
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+        # state мог разойтись с действительностью, а сервер - остаться с прошлого сеанса панели
+        if self.state != "stopped" or self.data_directory_in_use():
+            logging.error(f"Данные {self.title} в памяти не удалены: каталогом {self.data_directory} "
+                          f"ещё пользуется сервер.")
+            return
+        shutil.rmtree(self.data_directory, ignore_errors=True)
+        logging.info(f"Данные {self.title} в памяти ({self.data_directory}) удалены.")
+
+    def data_directory_in_use(self):
+        """Проверяет, что каталогом данных пользуется сервер: отвечает порт, жив запущенный панелью процесс
+        или процесс из pid-файла в каталоге (postmaster.pid, <хост>.pid у mysqld, mongod.lock)."""
+        if self.probe(timeout=0.5):
+            return True
+        if self._process is not None and self._process.poll() is None:
+            return True
+        for name in os.listdir(self.data_directory):
+            if name not in ("postmaster.pid", "mongod.lock") and not name.endswith(".pid"):
+                continue
+            try:
+                with open(os.path.join(self.data_directory, name), "r") as pid_file:
+                    first_line = pid_file.readline().strip()
+            except OSError:
+                continue
+            if first_line.isdigit() and process_alive(int(first_line)):
+                return True
+        return False
 
-    def stop(self):
-        if not self.is_running:
-            logging.info("PostgreSQL уже остановлен.")
+    def _stop_server(self):
+        if self.state == "stopped":
+            logging.info(f"{self.title} уже остановлен.")
+            return
+        self._start_cancelled.set()
+        if self.state == "starting":
+            # процесс уже запущен: останавливать его можно, только когда он начнёт принимать команды
+            self._settled.wait(self.start_timeout)
+        if not self.probe():
+            # сервер не поднялся, упал или ещё создаётся каталог данных
+            self.state = "stopped"
             return
-        command = rf'"{self.path}\bin\pg_ctl.exe" stop -D "{self.path}\data"'
-        success = self._execute_command(command, "PostgreSQL остановлен.")
-        if success:
-            self.is_running = False
+        if self._shutdown() and wait_for_address_closed(self.address, self.stop_timeout):
+            self.state = "stopped"
+        else:
+            logging.error(f"{self.title} на {self.address} не остановился за {self.stop_timeout:.0f} с.")
 
     def restart(self):
-        command = rf'"{self.path}\bin\pg_ctl.exe" restart -D "{self.path}\data" -l "{self.log_file}"'
-        success = self._execute_command(command, "PostgreSQL перезапущен.")
-        if success:
-            self.is_running = True
+        self.stop(discard=False)
+        self.run()
+        logging.info(f"{self.title} перезапущен.")
 
-    def run_pgadmin(self):
-        command = rf'"{self.path}\pgAdmin 4\bin\pgAdmin4.exe"'
-        self._execute_command(command, "pgAdmin 4 запущен.", wait=False)
+    @property
+    def snapshots_dir(self):
+        # файлы данных разных версий несовместимы, поэтому снимки хранятся отдельно для каждой
+        return os.path.join(self.project_path, "userdata", "snapshots", f"{self.title.lower()}-{self.version_label}")
+
+    def snapshots(self):
+        return list_snapshots(self.snapshots_dir)
+
+    def snapshot(self, name, method="auto"):
+        """Сохраняет каталог данных как снимок name. Сервер должен быть остановлен:
+        файлы работающей СУБД не согласованы между собой."""
+        # сервер мог остаться запущенным с прошлого сеанса панели
+        if self.is_running or self.probe(timeout=0.5):
+            raise RuntimeError(f"{self.title} нужно остановить перед созданием снимка")
+        return create_snapshot(self.data_directory, self.snapshots_dir, name, method)
+
+    def restore(self, name):
+        if self.is_running or self.probe(timeout=0.5):
+            raise RuntimeError(f"{self.title} нужно остановить перед восстановлением снимка")
+        restore_snapshot(self.data_directory, self.snapshots_dir, name)
+
+    def delete_snapshot(self, name):
+        delete_snapshot(self.snapshots_dir, name)
 
     def _execute_command(self, command, success_message, wait=True):
+        """С wait=False возвращает запущенный процесс."""
         try:
             log_output = open(self.log_file, "a")
             if wait:
@@ -502,85 +2642,775 @@ class Postgresql:
                     print(success_message)
                     return True
                 else:
-                    logging.error(f"Ошибка выполнения: {self.log_file}")
+                    logging.error(f"Ошибка выполнения: смотри {self.log_file}")
                     return False
             else:
-                subprocess.Popen(command, shell=True, stdout=log_output, stderr=log_output)
+                process = subprocess.Popen(command, shell=True, stdout=log_output, stderr=log_output)
                 log_output.close()
                 logging.info(success_message)
-                return True
+                return process
         except Exception as e:
             logging.error(f"Ошибка: {e}")
             print(f"Ошибка: {e}")
             return False
 
 
-class MySQL:
-    def __init__(self, mysql_path, project_path):
-        self.is_running = False
-        self.path = mysql_path
+def mysql_init_command(mysql_path):
+    # без my.ini: параметры, которые нельзя поменять после инициализации, остаются по умолчанию
+    return lambda datadir: [os.path.join(mysql_path, "bin", "mysqld.exe"), "--no-defaults", "--initialize-insecure",
+                            f"--basedir={mysql_path}", f"--datadir={datadir}", "--console"]
+
+
+def prepare_mysql_datadir(mysql_path, log_file):
+    return prepare_datadir(os.path.join(mysql_path, "data"), mysql_init_command(mysql_path), log_file)
+
+
+def render_mysql_config(mysql_path, datadir, log_error, tuning, port=MYSQL_PORT):
+    # в файлах параметров MySQL обратная косая черта начинает escape-последовательность
+    return render_template(
+        "my.ini",
+        basedir=mysql_path.replace("\\", "/"),
+        datadir=datadir.replace("\\", "/"),
+        port=port,
+        log_error=log_error.replace("\\", "/"),
+        # True - параметр-флаг без значения
+        tuning="\n".join(name if value is True else f"{name}={value}" for name, value in tuning.items()),
+    ) + "\n"
+
+
+POSTGRESQL_PORT = 5432
+POSTGRESQL_CONF = "postgresql.peresvet.conf"
+POSTGRESQL_INCLUDE = f"include_if_exists = '{POSTGRESQL_CONF}'"
+# применяются только при запуске сервера, остальные параметры перечитывает pg_ctl reload
+POSTGRESQL_RESTART_SETTINGS = {"listen_addresses", "port", "max_connections", "shared_buffers", "wal_level",
+                               "max_wal_senders"}
+PGPOOL_PORT = 6432
+PGPOOL_DEFAULT_SIZE = 20
+PGPOOL_WAIT_TIMEOUT = 30.0
+# параметры StartupMessage, которые пул передаёт серверу. Клиенты с разными значениями получают разные
+# соединения и свои ParameterStatus; остальные параметры отклоняются, а не теряются молча
+PGPOOL_STARTUP_PARAMETERS = (b"client_encoding", b"application_name", b"options", b"datestyle", b"timezone",
+                             b"extra_float_digits")
+PG_PROTOCOL_VERSION = 196608
+PG_CANCEL_REQUEST = 80877102
+PG_ENCRYPTION_REQUESTS = (80877103, 80877104)
+
+
+def postgresql_version(postgresql_path):
+    # bin/postgresql/<major>/pgsql
+    match = re.search(r"(?:^|[\\/])(\d+)(?:\.\d+)*[\\/]pgsql[\\/]?$", postgresql_path)
+    if match:
+        return int(match.group(1))
+    raise ValueError(f"Не удалось определить версию PostgreSQL из пути: {postgresql_path}")
+
+
+def tune_postgresql(version, profile, overrides=None):
+    """Подбирает память, WAL и надёжность фиксации под объём памяти, профиль (dev-fast, durable, benchmark)
+    и основную версию PostgreSQL (10-17)."""
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"Неизвестный профиль PostgreSQL: {profile}")
+    memory_mb = get_total_memory_mb()
+    durable = profile == "durable"
+    benchmark = profile == "benchmark"
+
+    if durable or benchmark:
+        shared_buffers_mb = clamp(memory_mb // 4, 256, 8192 if durable else 16384)
+        effective_cache_mb = memory_mb // 2
+        maintenance_mb = clamp(memory_mb // 16, 64, 1024)
+        max_connections = 200 if benchmark else 100
+    else:
+        # на машине разработчика PostgreSQL делит память с остальным стеком
+        shared_buffers_mb = clamp(memory_mb // 16, 128, 1024)
+        effective_cache_mb = memory_mb // 4
+        maintenance_mb = clamp(memory_mb // 32, 64, 256)
+        max_connections = 100
+    # сортировка может занять несколько work_mem на запрос, поэтому делитель с запасом
+    work_mem_mb = clamp((memory_mb - shared_buffers_mb) // (max_connections * 4), 4, 64)
+
+    values = {
+        "listen_addresses": "localhost",
+        "port": POSTGRESQL_PORT,
+        "max_connections": max_connections,
+        "shared_buffers": f"{shared_buffers_mb}MB",
+        "effective_cache_size": f"{effective_cache_mb}MB",
+        "work_mem": f"{work_mem_mb}MB",
+        "maintenance_work_mem": f"{maintenance_mb}MB",
+        "max_wal_size": "4GB" if benchmark else "2GB" if durable else "1GB",
+        "min_wal_size": "1GB" if benchmark else "256MB",
+        # off теряет последние транзакции при сбое ОС, но не портит данные
+        "synchronous_commit": "on" if durable else "off",
+        "wal_compression": "on",
+        "random_page_cost": 1.1,
+    }
+    if not durable:
+        # без реплик WAL нужен только для восстановления после сбоя
+        values["wal_level"] = "minimal"
+        values["max_wal_senders"] = 0
+    if version < 14:
+        # значение по умолчанию с 14, раньше 0.5 давало пилообразную нагрузку на диск
+        values["checkpoint_completion_target"] = 0.9
+    if version >= 11 and not benchmark:
+        # JIT (включён по умолчанию с 12) только замедляет короткие запросы приложений
+        values["jit"] = "off"
+    if os.name != "nt":
+        # в Windows нет posix_fadvise, и любое значение кроме 0 не даёт серверу запуститься
+        values["effective_io_concurrency"] = 200
+
+    for directive, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        values[directive] = value
+    return values
+
+
+def render_postgresql_config(values):
+    lines = ["# создаётся Пересветом при каждом запуске, свои значения задавайте в настройках tuning.postgresql"]
+    for name, value in values.items():
+        lines.append(f"{name} = {value}" if isinstance(value, (int, float)) else f"{name} = '{value}'")
+    return "\n".join(lines) + "\n"
+
+
+def postgresql_init_command(postgresql_path):
+    # локальный сервер разработки: пользователь postgres без пароля, как root у MySQL
+    return lambda datadir: [os.path.join(postgresql_path, "bin", "initdb.exe"), "-D", datadir, "-U", "postgres",
+                            "-A", "trust", "-E", "UTF8", "--locale=C"]
+
+
+def prepare_postgresql_datadir(postgresql_path, log_file):
+    return prepare_datadir(os.path.join(postgresql_path, "data"), postgresql_init_command(postgresql_path), log_file)
+
+
+def pg_message(kind, payload=b""):
+    return kind + struct.pack("!i", len(payload) + 4) + payload
+
+
+def pg_error(code, message):
+    return pg_message(b"E", b"SFATAL\0VFATAL\0C" + code.encode() + b"\0M" + message.encode() + b"\0\0")
+
+
+async def read_pg_message(reader):
+    header = await reader.readexactly(5)
+    return header[:1], await reader.readexactly(struct.unpack("!i", header[1:])[0] - 4)
+
+
+def set_postgresql_environment(port):
+    """Подсказывает libpq (pgsql, pdo_pgsql) адрес PostgreSQL по умолчанию. Процессы PHP и веб-сервера
+    наследуют окружение панели, поэтому вызывать нужно до их запуска."""
+    os.environ.update(PGHOST="127.0.0.1", PGPORT=str(port))
+
+
+class PgBackendError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class PgBackend:
+    """Соединение пула с сервером PostgreSQL."""
+
+    def __init__(self, reader, writer, parameters, key):
+        self.reader = reader
+        self.writer = writer
+        self.parameters = parameters
+        self.key = key
+
+    def close(self):
+        self.writer.close()
+
+
+class PgBackendPool:
+    def __init__(self, startup):
+        # пары имя-значение StartupMessage, с которыми открываются соединения этого пула
+        self.startup = startup
+        self.idle = []
+        self.active = 0
+        self.parameters = None
+        self.changed = asyncio.Condition()
+
+
+class PgSession:
+    def __init__(self, pool):
+        self.pool = pool
+        self.backend = None
+        self.pending = 0
+        self.pinned = False
+
+
+class PostgresqlPooler:
+    """Пул соединений с PostgreSQL на уровне транзакций, как pool_mode = transaction у PgBouncer.
+
+    PHP открывает новое соединение на каждый запрос, и запуск серверного процесса PostgreSQL на каждое
+    из них дороже коротких запросов. Клиент получает соединение с сервером только на время транзакции:
+    как только сервер сообщает ReadyForQuery вне транзакции, соединение возвращается в пул. Сессия,
+    подготовившая именованный запрос (PDO делает так по умолчанию), закрепляет соединение до отключения,
+    потому что на других соединениях этого запроса нет. Пароли не проксируются: пул подключается к
+    серверу как сам клиент, что работает с методом trust, который задаёт initdb в Пересвете.
+    """
+    title = "Пул PostgreSQL"
+
+    def __init__(self, log_file, server_port=POSTGRESQL_PORT, port=PGPOOL_PORT, pool_size=PGPOOL_DEFAULT_SIZE):
+        self.log_file = log_file
+        self.server_port = server_port
+        self.port = port
+        self.pool_size = pool_size
+        self.state = "stopped"
+        self._pools = {}
+        self._sessions = {}
+        self._next_pid = 1
+        self._loop = None
+        self._thread = None
+        self._settled = threading.Event()
+        self._settled.set()
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.port}"
+
+    @property
+    def is_running(self):
+        return self.state in ("starting", "running")
+
+    def status(self):
+        if self.state == "running" and not self._thread.is_alive():
+            self.state = "failed"
+        return self.state
+
+    def wait_ready(self, timeout=None):
+        self._settled.wait(timeout)
+        return self.state == "running"
+
+    def run(self):
+        if self.is_running:
+            logging.info("Пул PostgreSQL уже запущен.")
+            return
+        self.state = "starting"
+        self._settled = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="pgpool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+        self.state = "stopped"
+
+    def resize(self, pool_size):
+        """Меняет число соединений с сервером на каждый набор параметров подключения без перезапуска пула."""
+        self.pool_size = pool_size
+        if self._loop is not None and self.state == "running":
+            asyncio.run_coroutine_threadsafe(self._notify_pools(), self._loop)
+
+    async def _notify_pools(self):
+        for pool in self._pools.values():
+            async with pool.changed:
+                pool.changed.notify_all()
+
+    def _serve(self):
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            server = loop.run_until_complete(asyncio.start_server(self._serve_client, "127.0.0.1", self.port))
+        except OSError as error:
+            logging.error(f"Пул PostgreSQL не занял порт {self.port}: {error}")
+            self.state = "failed"
+            self._settled.set()
+            loop.close()
+            return
+        self.state = "running"
+        self._settled.set()
+        logging.info(f"Пул PostgreSQL слушает {self.address}, до {self.pool_size} соединений "
+                     f"с сервером на порту {self.server_port}")
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            for pool in self._pools.values():
+                for backend in pool.idle:
+                    backend.close()
+            self._pools.clear()
+            self._sessions.clear()
+            loop.close()
+            logging.info("Пул PostgreSQL остановлен.")
+
+    async def _read_startup(self, reader, writer):
+        """Возвращает параметры StartupMessage или None, если соединение было запросом отмены."""
+        while True:
+            length, code = struct.unpack("!ii", await reader.readexactly(8))
+            payload = await reader.readexactly(length - 8)
+            if code in PG_ENCRYPTION_REQUESTS:
+                # между локальными процессами шифрование не нужно, libpq с sslmode=prefer продолжит без него
+                writer.write(b"N")
+                await writer.drain()
+            elif code == PG_CANCEL_REQUEST:
+                await self._cancel(payload)
+                return None
+            elif code == PG_PROTOCOL_VERSION:
+                fields = payload.split(b"\0")
+                # список параметров завершается пустым именем
+                return {name: value for name, value in zip(fields[0::2], fields[1::2]) if name}
+            else:
+                writer.write(pg_error("0A000", "Пул поддерживает только протокол 3.0"))
+                await writer.drain()
+                return None
+
+    async def _cancel(self, key):
+        session = self._sessions.get(key)
+        backend = session.backend if session else None
+        if backend is None or backend.key is None:
+            return
+        _, writer = await asyncio.open_connection("127.0.0.1", self.server_port)
+        writer.write(struct.pack("!ii", 16, PG_CANCEL_REQUEST) + backend.key)
+        await writer.drain()
+        writer.close()
+
+    async def _connect(self, startup):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.server_port)
+        except OSError as error:
+            raise PgBackendError(f"PostgreSQL на порту {self.server_port} недоступен: {error}")
+        parameters = b"".join(name + b"\0" + value + b"\0" for name, value in startup) + b"\0"
+        writer.write(struct.pack("!ii", 8 + len(parameters), PG_PROTOCOL_VERSION) + parameters)
+        status, key = [], None
+        while True:
+            kind, payload = await read_pg_message(reader)
+            if kind == b"R" and payload[:4] != b"\0\0\0\0":
+                writer.close()
+                raise PgBackendError("Пул подключается к PostgreSQL без пароля, нужен метод trust в pg_hba.conf")
+            if kind == b"E":
+                writer.close()
+                fields = dict((field[:1], field[1:]) for field in payload.split(b"\0") if field)
+                raise PgBackendError(fields.get(b"M", b"").decode("utf-8", "replace"))
+            if kind == b"S":
+                status.append(pg_message(kind, payload))
+            elif kind == b"K":
+                key = payload
+            elif kind == b"Z":
+                return PgBackend(reader, writer, status, key)
+
+    async def _acquire(self, pool):
+        async with pool.changed:
+            try:
+                await asyncio.wait_for(pool.changed.wait_for(lambda: pool.active < self.pool_size),
+                                       PGPOOL_WAIT_TIMEOUT)
+            except TimeoutError:
+                raise PgBackendError(f"Все {self.pool_size} соединений пула заняты дольше "
+                                     f"{PGPOOL_WAIT_TIMEOUT:.0f} с")
+            pool.active += 1
+        while pool.idle:
+            backend = pool.idle.pop()
+            # сервер мог закрыть простаивающее соединение, например при перезапуске
+            if not backend.writer.is_closing():
+                return backend
+        try:
+            return await self._connect(pool.startup)
+        except BaseException:
+            await self._release(pool, None)
+            raise
+
+    async def _release(self, pool, backend, reusable=False):
+        if backend is not None:
+            if reusable and not backend.writer.is_closing():
+                pool.idle.append(backend)
+            else:
+                backend.close()
+        async with pool.changed:
+            pool.active -= 1
+            pool.changed.notify()
+
+    async def _relay(self, session, writer):
+        """Передаёт ответы сервера клиенту и возвращает соединение в пул, когда транзакция завершена."""
+        backend = session.backend
+        try:
+            while True:
+                kind, payload = await read_pg_message(backend.reader)
+                if kind == b"Z":
+                    session.pending -= 1
+                    if session.pending <= 0 and payload == b"I" and not session.pinned:
+                        session.backend = None
+                        await self._release(session.pool, backend, reusable=True)
+                        writer.write(pg_message(kind, payload))
+                        return
+                writer.write(pg_message(kind, payload))
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            # сервер закрыл соединение: клиенту больше некуда отправлять запросы
+            writer.close()
+
+    async def _serve_client(self, reader, writer):
+        session = key = relay = None
+        try:
+            parameters = await self._read_startup(reader, writer)
+            if parameters is None:
+                return
+            user = parameters.pop(b"user", b"")
+            database = parameters.pop(b"database", b"") or user
+            unsupported = [name.decode("utf-8", "replace") for name in parameters
+                           if name.lower() not in PGPOOL_STARTUP_PARAMETERS]
+            if unsupported:
+                raise PgBackendError(f"Пул не передаёт серверу параметры подключения: {', '.join(unsupported)}")
+            startup = ((b"user", user), (b"database", database), *sorted(parameters.items()))
+            pool = self._pools.get(startup)
+            if pool is None:
+                pool = self._pools[startup] = PgBackendPool(startup)
+            if pool.parameters is None:
+                # первое подключение проверяет, что база есть, и запоминает параметры сервера для этих настроек
+                backend = await self._acquire(pool)
+                pool.parameters = backend.parameters
+                await self._release(pool, backend, reusable=True)
+            session = PgSession(pool)
+            key = struct.pack("!i", self._next_pid) + os.urandom(4)
+            self._next_pid += 1
+            self._sessions[key] = session
+            writer.write(pg_message(b"R", b"\0\0\0\0") + b"".join(pool.parameters) + pg_message(b"K", key) +
+                         pg_message(b"Z", b"I"))
+            await writer.drain()
+            while True:
+                kind, payload = await read_pg_message(reader)
+                if kind == b"X":
+                    break
+                if session.backend is None:
+                    session.backend = await self._acquire(pool)
+                    relay = asyncio.create_task(self._relay(session, writer))
+                if kind in (b"Q", b"S", b"F"):
+                    session.pending += 1
+                elif kind == b"P" and not payload.startswith(b"\0"):
+                    session.pinned = True
+                session.backend.writer.write(pg_message(kind, payload))
+                await session.backend.writer.drain()
+        except PgBackendError as error:
+            writer.write(pg_error("08006", error.message))
+            # без drain ошибка может не дойти до клиента до закрытия соединения
+            try:
+                await writer.drain()
+            except OSError:
+                pass
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if relay is not None:
+                relay.cancel()
+            if session is not None and session.backend is not None:
+                # посреди транзакции или с закреплённым состоянием соединение другим клиентам не отдаётся
+                await self._release(session.pool, session.backend)
+            self._sessions.pop(key, None)
+            writer.close()
+
+
+class Postgresql(DatabaseServer):
+    title = "PostgreSQL"
+    service_probe = staticmethod(postgresql_probe)
+
+    def __init__(self, postgresql_path, project_path, postgresql_options=None, tuning_overrides=None):
+        super().__init__()
+        self.path = postgresql_path
+        self.project_path = project_path
+        self.version = postgresql_version(postgresql_path)
+        self.postgresql_options = postgresql_options or {}
+        self.tuning_overrides = tuning_overrides or {}
+        self.datadir = self.storage_path(self.postgresql_options, os.path.join(self.path, "data"))
+        self.applied_tuning = {}
+        self.pooler = None
 
         self.log_dir = os.path.join(project_path, "userdata", "logs")
         os.makedirs(self.log_dir, exist_ok=True)
 
-        self.log_file = os.path.join(self.log_dir, "mysql.log")
+        self.log_file = os.path.join(self.log_dir, "postgresql.log")
         logging.basicConfig(
             filename=self.log_file,
             level=logging.INFO,
             format="%(asctime)s - %(levelname)s - %(message)s"
         )
-        logging.info("MySQL initialized")
+        logging.info("Postgresql initialized")
+
+    @property
+    def port(self):
+        if "port" in self.applied_tuning:
+            return self.applied_tuning["port"]
+        return (self.tuning_overrides.get("postgresql") or {}).get("port", POSTGRESQL_PORT)
+
+    def configure(self):
+        """Пересобирает postgresql.peresvet.conf и подключает его к postgresql.conf.
+        Возвращает изменённые параметры."""
+        profile = self.postgresql_options.get("profile", "dev-fast")
+        tuning = self.ephemeral_tuning("postgresql",
+                                       tune_postgresql(self.version, profile, self.tuning_overrides.get("postgresql")))
+        record_tuning(self.project_path, "postgresql", tuning)
+        write_config(os.path.join(self.datadir, POSTGRESQL_CONF), render_postgresql_config(tuning))
+
+        # подключение дописывается в конец, чтобы значения Пересвета не перекрывались стандартными
+        main_conf = os.path.join(self.datadir, "postgresql.conf")
+        with open(main_conf, "r", encoding="utf-8", errors="replace") as conf_file:
+            content = conf_file.read()
+        if POSTGRESQL_INCLUDE not in content:
+            write_config(main_conf, content.rstrip("\n") + "\n\n" + POSTGRESQL_INCLUDE + "\n")
+
+        changed = {name for name in tuning.keys() | self.applied_tuning.keys()
+                   if tuning.get(name) != self.applied_tuning.get(name)}
+        self.applied_tuning = tuning
+        if changed:
+            logging.info(f"postgresql.conf для PostgreSQL {self.version} собран по профилю {profile}")
+        return changed
+
+    def _init_command(self):
+        return postgresql_init_command(self.path)
 
     def run(self):
-        if self.is_running:
-            logging.info("MySQL уже запущен.")
+        super().run()
+        self.update_pooler()
+
+    def stop(self, discard=True):
+        if self.pooler:
+            self.pooler.stop()
+        super().stop(discard)
+
+    def update_pooler(self):
+        """Запускает, останавливает или меняет размер пула соединений по настройкам pooler и pool_size."""
+        if not self.postgresql_options.get("pooler"):
+            if self.pooler:
+                self.pooler.stop()
+                self.pooler = None
             return
-        command = rf'"{self.path}\bin\mysqld.exe" --defaults-file="{self.path}\my.ini" --console'
-        self._execute_command(command, "MySQL запущен.", wait=False)
-        self.is_running = True
-
-    def stop(self):
-        if not self.is_running:
-            logging.info("MySQL уже остановлен.")
+        pool_size = self.postgresql_options.get("pool_size", PGPOOL_DEFAULT_SIZE)
+        if self.pooler is None:
+            self.pooler = PostgresqlPooler(self.log_file, server_port=self.port, pool_size=pool_size)
+        self.pooler.server_port = self.port
+        if self.pooler.pool_size != pool_size:
+            self.pooler.resize(pool_size)
+        if not self.pooler.is_running:
+            self.pooler.run()
+
+    def _start(self):
+        self.configure()
+        # pg_ctl сам ждёт готовности и завершается с ошибкой, если postmaster не поднялся
+        command = rf'"{self.path}\bin\pg_ctl.exe" start -D "{self.datadir}" -l "{self.log_file}"'
+        return self._execute_command(command, "PostgreSQL запускается.", wait=False)
+
+    def _shutdown(self):
+        command = rf'"{self.path}\bin\pg_ctl.exe" stop -D "{self.datadir}"'
+        return self._execute_command(command, "PostgreSQL остановлен.")
+
+    def reload(self, postgresql_options=None, tuning_overrides=None):
+        if postgresql_options is not None:
+            self.postgresql_options = postgresql_options
+            self.check_storage(postgresql_options)
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        if self.state != "running":
             return
-        command = rf'"{self.path}\bin\mysqladmin.exe" -u root shutdown'
-        success = self._execute_command(command, "MySQL остановлен.")
-        if success:
-            self.is_running = False
+        if bool(self.pooler) != bool(self.postgresql_options.get("pooler")):
+            logging.info("Адрес PostgreSQL для PHP (PGPORT) сменится после перезапуска сервера.")
+        port = self.port
+        changed = self.configure()
+        if changed & POSTGRESQL_RESTART_SETTINGS:
+            # останавливать нужно сервер, который слушает старый порт
+            self.applied_tuning = {**self.applied_tuning, "port": port}
+            self.stop(discard=False)
+            self.run()
+            return
+        if changed:
+            command = rf'"{self.path}\bin\pg_ctl.exe" reload -D "{self.datadir}"'
+            self._execute_command(command, "PostgreSQL перечитал конфигурацию.")
+        self.update_pooler()
 
-    def restart(self):
-        self.stop()
-        self.run()
-        logging.info("MySQL перезапущен.")
+    def run_pgadmin(self):
+        command = rf'"{self.path}\pgAdmin 4\bin\pgAdmin4.exe"'
+        self._execute_command(command, "pgAdmin 4 запущен.", wait=False)
 
-    def _execute_command(self, command, success_message, wait=True):
-        try:
-            log_output = open(self.log_file, "a")
-            if wait:
-                process = subprocess.run(command, shell=True, stdout=log_output, stderr=log_output, text=True)
-                log_output.close()
-                if process.returncode == 0:
-                    logging.info(success_message)
-                    print(success_message)
-                    return True
-                else:
-                    logging.error(f"Ошибка выполнения: {self.log_file}")
-                    return False
-            else:
-                subprocess.Popen(command, shell=True, stdout=log_output, stderr=log_output)
-                log_output.close()
-                logging.info(success_message)
-                return True
-        except Exception as e:
-            logging.error(f"Ошибка: {e}")
-            print(f"Ошибка: {e}")
+
+class MySQL(DatabaseServer):
+    title = "MySQL"
+    service_probe = staticmethod(mysql_probe)
+
+    def __init__(self, mysql_path, project_path, mysql_options=None, tuning_overrides=None):
+        super().__init__()
+        self.path = mysql_path
+        self.project_path = project_path
+        self.version = mysql_version(mysql_path)
+        self.mysql_options = mysql_options or {}
+        self.tuning_overrides = tuning_overrides or {}
+        self.conf_path = os.path.join(self.path, "my.ini")
+        self.datadir = self.storage_path(self.mysql_options, os.path.join(self.path, "data"))
+
+        self.log_dir = os.path.join(project_path, "userdata", "logs")
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        self.log_file = os.path.join(self.log_dir, "mysql.log")
+        logging.basicConfig(
+            filename=self.log_file,
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        logging.info("MySQL initialized")
+
+    @property
+    def port(self):
+        return MYSQL_PORT
+
+    def configure(self):
+        """Пересобирает my.ini под профиль и объём памяти. Возвращает True, если файл изменился."""
+        profile = self.mysql_options.get("profile", "dev-fast")
+        tuning = self.ephemeral_tuning("mysql", tune_mysql(self.version, profile, self.tuning_overrides.get("mysql")))
+        record_tuning(self.project_path, "mysql", tuning)
+        config = render_mysql_config(self.path, self.datadir, os.path.join(self.log_dir, "mysql_error.log"), tuning)
+        if not write_config(self.conf_path, config):
             return False
+        logging.info(f"my.ini для MySQL {'.'.join(map(str, self.version))} собран по профилю {profile}")
+        return True
 
+    def _init_command(self):
+        return mysql_init_command(self.path)
+
+    def _start(self):
+        self.configure()
+        command = rf'"{self.path}\bin\mysqld.exe" --defaults-file="{self.path}\my.ini" --console'
+        return self._execute_command(command, "MySQL запускается.", wait=False)
 
-class Redis:
-    def __init__(self, redis_path, project_path):
-        self.is_running = False
+    def _shutdown(self):
+        command = rf'"{self.path}\bin\mysqladmin.exe" -u root shutdown'
+        return self._execute_command(command, "MySQL остановлен.")
+
+    def reload(self, mysql_options=None, tuning_overrides=None):
+        if mysql_options is not None:
+            self.mysql_options = mysql_options
+            self.check_storage(mysql_options)
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        # буферы InnoDB и журнал применяются только при запуске mysqld
+        if self.configure() and self.state == "running":
+            self.restart()
+
+
+REDIS_PORT = 6379
+REDIS_PROFILES = ("cache", "durable")
+# применяются только при запуске redis-server, остальные параметры меняются через CONFIG SET
+REDIS_RESTART_SETTINGS = {"bind", "port", "tcp-backlog", "unixsocket", "unixsocketperm", "io-threads",
+                          "io-threads-do-reads"}
+
+
+def redis_version(redis_path):
+    # bin/redis/<версия>, у сборок для Windows бывает четвёртый номер: 5.0.14.1
+    match = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", os.path.basename(os.path.normpath(redis_path)))
+    if match:
+        return tuple(int(part or 0) for part in match.groups())
+    raise ValueError(f"Не удалось определить версию Redis из пути: {redis_path}")
+
+
+def tune_redis(version, profile, overrides=None, socket_path=None):
+    """Подбирает лимит памяти, вытеснение, сохранение на диск и потоки ввода-вывода под объём памяти,
+    число ядер, профиль (cache, durable) и версию Redis (3.x-7.x)."""
+    if profile not in REDIS_PROFILES:
+        raise ValueError(f"Неизвестный профиль Redis: {profile}")
+    memory_mb = get_total_memory_mb()
+    cache = profile == "cache"
+
+    values = {
+        "bind": "127.0.0.1",
+        "port": REDIS_PORT,
+        # всплеск подключений PHP-процессов не должен упираться в очередь 511 по умолчанию;
+        # в Linux очередь дополнительно ограничена net.core.somaxconn
+        "tcp-backlog": 1024,
+        "timeout": 0,
+        "tcp-keepalive": 60,
+        "maxmemory": f"{clamp(memory_mb // 16, 64, 2048)}mb" if cache else f"{clamp(memory_mb // 8, 128, 4096)}mb",
+        # в durable вытесняются только ключи со сроком жизни (сессии, кэш), остальные данные сохраняются
+        "maxmemory-policy": "allkeys-lru" if cache else "volatile-lru",
+        # в кэше много ключей со сроком жизни: чаще проверять их истечение
+        "hz": 20 if cache else 10,
+    }
+    if cache:
+        # кэш восстанавливается приложением, запись на диск только отнимает время и память на fork
+        values["save"] = ""
+        values["appendonly"] = False
+    else:
+        # при сбое теряется не больше секунды записей
+        values["appendonly"] = True
+        values["appendfsync"] = "everysec"
+    if socket_path:
+        values["unixsocket"] = socket_path.replace("\\", "/")
+        values["unixsocketperm"] = 700
+    if version >= (4, 0):
+        if cache:
+            # память вытесненных и истёкших ключей освобождается в фоновом потоке
+            values["lazyfree-lazy-eviction"] = True
+            values["lazyfree-lazy-expire"] = True
+        else:
+            values["aof-use-rdb-preamble"] = True
+    if version >= (5, 0):
+        values["dynamic-hz"] = True
+    io_threads = clamp(get_cpu_count() // 2, 1, 4)
+    if cache and version >= (6, 0) and io_threads > 1:
+        # команды по-прежнему выполняет один поток, в остальных идёт чтение и запись сокетов
+        values["io-threads"] = io_threads
+        if version < (8, 0):
+            values["io-threads-do-reads"] = True
+
+    for directive, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        values[directive] = value
+    return values
+
+
+def render_redis_value(value):
+    if value is True or value is False:
+        return "yes" if value else "no"
+    if value == "":
+        return '""'
+    return str(value)
+
+
+def render_redis_config(datadir, tuning):
+    # в кавычках redis.conf обратная косая черта начинает escape-последовательность
+    return render_template(
+        "redis.conf",
+        dir=datadir.replace("\\", "/"),
+        tuning="\n".join(f"{name} {render_redis_value(value)}" for name, value in tuning.items()),
+    ) + "\n"
+
+
+def set_redis_environment(port, socket_path=None):
+    """Общий адрес Redis для объектного кэша сайтов: REDIS_HOST, REDIS_PORT и REDIS_URL читают Laravel,
+    Symfony и плагины кэша. Процессы PHP наследуют окружение панели, поэтому вызывать нужно до их запуска."""
+    os.environ.update(REDIS_HOST="127.0.0.1", REDIS_PORT=str(port), REDIS_URL=f"redis://127.0.0.1:{port}")
+    if socket_path:
+        os.environ["REDIS_SOCKET"] = socket_path
+
+
+def redis_command(address, *arguments, timeout=2.0):
+    """Выполняет команду Redis и возвращает первую строку ответа или None, если сервер недоступен."""
+    request = f"*{len(arguments)}\r\n".encode()
+    for argument in arguments:
+        argument = str(argument).encode()
+        request += f"${len(argument)}\r\n".encode() + argument + b"\r\n"
+    try:
+        with open_connection(address, timeout) as connection:
+            connection.sendall(request)
+            return connection.recv(4096).split(b"\r\n", 1)[0]
+    except OSError:
+        return None
+
+
+class Redis(DatabaseServer):
+    title = "Redis"
+    service_probe = staticmethod(redis_probe)
+
+    def __init__(self, redis_path, project_path, redis_options=None, tuning_overrides=None):
+        super().__init__()
         self.path = redis_path
+        self.project_path = project_path
+        self.version = redis_version(redis_path)
+        self.redis_options = redis_options or {}
+        self.tuning_overrides = tuning_overrides or {}
+        self.conf_path = os.path.join(self.path, "redis.conf")
+        # каталог для RDB и AOF; в отличие от MySQL и PostgreSQL инициализировать его не нужно
+        self.data_path = self.storage_path(self.redis_options, os.path.join(self.path, "data"))
+        self.socket_path = os.path.join(project_path, "userdata", "run", "redis.sock") \
+            if unix_sockets_supported() else None
+        self.applied_tuning = {}
 
         self.log_dir = os.path.join(project_path, "userdata", "logs")
         os.makedirs(self.log_dir, exist_ok=True)
@@ -593,47 +3423,294 @@ class Redis:
         )
         logging.info("Redis initialized")
 
-    def run(self):
-        if self.is_running:
-            logging.info("Redis уже запущен.")
+    @property
+    def port(self):
+        if "port" in self.applied_tuning:
+            return self.applied_tuning["port"]
+        return (self.tuning_overrides.get("redis") or {}).get("port", REDIS_PORT)
+
+    def session_save_path(self):
+        """session.save_path для phpredis. Сессии лежат в базе 1, чтобы FLUSHDB объектного кэша сайта
+        в базе 0 не разлогинивал пользователей; persistent оставляет соединение открытым между запросами."""
+        if self.socket_path:
+            return f"unix://{self.socket_path}?database=1&persistent=1"
+        return f"tcp://127.0.0.1:{self.port}?database=1&persistent=1&timeout=2"
+
+    def configure(self):
+        """Пересобирает redis.conf под профиль и объём памяти. Возвращает изменённые параметры."""
+        profile = self.redis_options.get("profile", "cache")
+        tuning = self.ephemeral_tuning("redis", tune_redis(self.version, profile, self.tuning_overrides.get("redis"),
+                                                           self.socket_path))
+        record_tuning(self.project_path, "redis", tuning)
+        os.makedirs(self.data_path, exist_ok=True)
+        if self.socket_path:
+            os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        write_config(self.conf_path, render_redis_config(self.data_path, tuning))
+
+        changed = {name for name in tuning.keys() | self.applied_tuning.keys()
+                   if tuning.get(name) != self.applied_tuning.get(name)}
+        previous, self.applied_tuning = self.applied_tuning, tuning
+        if changed:
+            logging.info(f"redis.conf для Redis {'.'.join(map(str, self.version))} собран по профилю {profile}")
+        return changed, previous
+
+    def _start(self):
+        self.configure()
+        command = rf'"{self.path}\redis-server.exe" "{self.conf_path}"'
+        return self._execute_command(command, "Redis запускается.", wait=False)
+
+    def _shutdown(self):
+        command = rf'"{self.path}\redis-cli.exe" -p {self.port} shutdown'
+        return self._execute_command(command, "Redis остановлен.")
+
+    def reload(self, redis_options=None, tuning_overrides=None):
+        if redis_options is not None:
+            self.redis_options = redis_options
+            self.check_storage(redis_options)
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        if self.state != "running":
             return
-        command = rf'"{self.path}\redis-server.exe" "{self.path}\redis.conf"'
-        self._execute_command(command, "Redis запущен.", wait=False)
-        self.is_running = True
-
-    def stop(self):
-        if not self.is_running:
-            logging.info("Redis уже остановлен.")
+        changed, previous = self.configure()
+        # параметр, убранный из настроек, возвращается к значению по умолчанию только при запуске
+        if changed & REDIS_RESTART_SETTINGS or changed - self.applied_tuning.keys():
+            self.applied_tuning = {**self.applied_tuning, "port": previous.get("port", REDIS_PORT)}
+            self.restart()
             return
-        command = rf'"{self.path}\redis-cli.exe" shutdown'
-        success = self._execute_command(command, "Redis остановлен.")
-        if success:
-            self.is_running = False
+        for name in sorted(changed):
+            value = self.applied_tuning[name]
+            reply = redis_command(self.address, "CONFIG", "SET", name,
+                                  render_redis_value(value) if isinstance(value, bool) else value)
+            if reply != b"+OK":
+                logging.error(f"Redis не применил {name}: {reply}, изменение вступит в силу после перезапуска.")
 
-    def restart(self):
-        self.stop()
-        self.run()
-        logging.info("Redis перезапущен.")
 
-    def _execute_command(self, command, success_message, wait=True):
-        try:
-            log_output = open(self.log_file, "a")
-            if wait:
-                process = subprocess.run(command, shell=True, stdout=log_output, stderr=log_output, text=True)
-                log_output.close()
-                if process.returncode == 0:
-                    logging.info(success_message)
-                    print(success_message)
-                    return True
-                else:
-                    logging.error(f"Ошибка выполнения: смотри {self.log_file}")
-                    return False
+MONGODB_PORT = 27017
+MONGODB_OP_MSG = 2013
+
+
+def mongodb_version(mongodb_path):
+    # архив распаковывается в bin/mongodb/<версия>/mongodb-win32-x86_64-windows-<полная версия>
+    for part in (os.path.basename(os.path.normpath(mongodb_path)), os.path.basename(os.path.dirname(mongodb_path))):
+        match = re.search(r"(\d+)\.(\d+)\.(\d+)", part)
+        if match:
+            return tuple(int(number) for number in match.groups())
+    raise ValueError(f"Не удалось определить версию MongoDB из пути: {mongodb_path}")
+
+
+def tune_mongodb(profile, overrides=None):
+    """Подбирает кэш WiredTiger, интервал сброса журнала и сбор диагностики под объём памяти
+    и профиль (dev-fast, durable, benchmark). Параметры записываются через точку: net.port."""
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"Неизвестный профиль MongoDB: {profile}")
+    memory_mb = get_total_memory_mb()
+    durable = profile == "durable"
+    benchmark = profile == "benchmark"
+
+    # по умолчанию mongod занимает половину памяти за вычетом 1 ГБ и вытесняет остальной стек
+    if benchmark:
+        cache_mb = clamp((memory_mb - 1024) // 2, 256, 16384)
+    elif durable:
+        cache_mb = clamp(memory_mb // 8, 256, 8192)
+    else:
+        cache_mb = clamp(memory_mb // 16, 256, 2048)
+
+    values = {
+        "net.bindIp": "127.0.0.1",
+        "net.port": MONGODB_PORT,
+        "storage.wiredTiger.engineConfig.cacheSizeGB": max(round(cache_mb / 1024, 2), 0.25),
+        # записи без j: true попадают на диск раз в интервал (1-500 мс, по умолчанию 100) и теряются при сбое ОС
+        "storage.journal.commitIntervalMs": 50 if durable else 100 if benchmark else 500,
+    }
+    if not durable and not benchmark:
+        # FTDC раз в секунду пишет метрики в diagnostic.data, на машине разработчика они не нужны
+        values["setParameter.diagnosticDataCollectionEnabled"] = False
+
+    for directive, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        values[directive] = value
+    return values
+
+
+def render_mongodb_value(value):
+    if value is True or value is False:
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    # строка в двойных кавычках JSON - корректная строка YAML, обратная косая черта в пути экранируется
+    return json.dumps(value, ensure_ascii=False)
+
+
+def render_mongodb_config(dbpath, log_path, tuning):
+    settings = {"storage.dbPath": dbpath, "systemLog.destination": "file", "systemLog.path": log_path,
+                "systemLog.logAppend": True, **tuning}
+    tree = {}
+    for name, value in settings.items():
+        *sections, key = name.split(".")
+        node = tree
+        for section in sections:
+            node = node.setdefault(section, {})
+        node[key] = value
+
+    lines = []
+
+    def render(node, indent):
+        for key, value in node.items():
+            if isinstance(value, dict):
+                lines.append(f"{indent}{key}:")
+                render(value, indent + "  ")
             else:
-                subprocess.Popen(command, shell=True, stdout=log_output, stderr=log_output)
-                log_output.close()
-                logging.info(success_message)
-                return True
-        except Exception as e:
-            logging.error(f"Ошибка: {e}")
-            print(f"Ошибка: {e}")
-            return False
+                lines.append(f"{indent}{key}: {render_mongodb_value(value)}")
+
+    render(tree, "")
+    return render_template("mongod.conf", config="\n".join(lines)) + "\n"
+
+
+def bson_document(fields):
+    """Кодирует плоский документ BSON: строки, целые, дробные числа и флаги."""
+    body = b""
+    for name, value in fields.items():
+        name = name.encode() + b"\0"
+        if isinstance(value, bool):
+            body += b"\x08" + name + (b"\x01" if value else b"\x00")
+        elif isinstance(value, int):
+            body += b"\x10" + name + struct.pack("<i", value)
+        elif isinstance(value, float):
+            body += b"\x01" + name + struct.pack("<d", value)
+        else:
+            value = str(value).encode() + b"\0"
+            body += b"\x02" + name + struct.pack("<i", len(value)) + value
+    return struct.pack("<i", len(body) + 5) + body + b"\0"
+
+
+def bson_ok(document):
+    # ok в ответе - double, у некоторых команд int32
+    for kind, format_ in ((b"\x01", "<d"), (b"\x10", "<i")):
+        index = document.find(kind + b"ok\0")
+        if index != -1:
+            return struct.unpack_from(format_, document, index + 4)[0] == 1
+    return False
+
+
+def mongodb_command(address, command, timeout=2.0):
+    """Отправляет команду в сообщении OP_MSG и возвращает документ ответа или None, если ответа нет.
+    Первым ключом команды должно идти её имя, база указывается в $db."""
+    # после заголовка идут флаги сообщения и секция типа 0 с документом команды
+    body = struct.pack("<I", 0) + b"\0" + bson_document(command)
+    header = struct.pack("<iiii", 16 + len(body), 1, 0, MONGODB_OP_MSG)
+    try:
+        with open_connection(address, timeout) as connection:
+            connection.sendall(header + body)
+            reply = b""
+            while len(reply) < 4 or len(reply) < struct.unpack_from("<i", reply)[0]:
+                chunk = connection.recv(65536)
+                if not chunk:
+                    return None
+                reply += chunk
+    except OSError:
+        return None
+    if struct.unpack_from("<i", reply, 12)[0] != MONGODB_OP_MSG:
+        return None
+    return reply[21:]
+
+
+def mongodb_probe(address, timeout=1.0):
+    """Отправляет hello. mongod открывает порт только после восстановления журнала WiredTiger,
+    поэтому любой ответ с ok: 1 означает, что сервер принимает запросы."""
+    reply = mongodb_command(address, {"hello": 1, "$db": "admin"}, timeout)
+    return reply is not None and bson_ok(reply)
+
+
+def mongodb_runtime_parameter(name, value):
+    """Параметр setParameter, которым значение из mongod.conf меняется без перезапуска, или None."""
+    if name == "storage.wiredTiger.engineConfig.cacheSizeGB":
+        return "wiredTigerEngineRuntimeConfig", f"cache_size={round(float(value) * 1024)}M"
+    if name == "storage.journal.commitIntervalMs":
+        return "journalCommitInterval", int(value)
+    if name.startswith("setParameter."):
+        return name[len("setParameter."):], value
+    return None
+
+
+class MongoDB(DatabaseServer):
+    title = "MongoDB"
+    service_probe = staticmethod(mongodb_probe)
+
+    def __init__(self, mongodb_path, project_path, mongodb_options=None, tuning_overrides=None):
+        super().__init__()
+        self.path = mongodb_path
+        self.project_path = project_path
+        self.version = mongodb_version(mongodb_path)
+        self.mongodb_options = mongodb_options or {}
+        self.tuning_overrides = tuning_overrides or {}
+        self.conf_path = os.path.join(self.path, "mongod.conf")
+        # файлы данных несовместимы между основными версиями, поэтому у каждой свой каталог;
+        # mongod создаёт их сам при первом запуске, отдельная инициализация не нужна
+        self.data_path = os.path.join(project_path, "userdata", "mongodb", "{}.{}".format(*self.version))
+        self.applied_tuning = {}
+
+        self.log_dir = os.path.join(project_path, "userdata", "logs")
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        self.log_file = os.path.join(self.log_dir, "mongodb.log")
+        self.server_log = os.path.join(self.log_dir, "mongod.log")
+        logging.basicConfig(
+            filename=self.log_file,
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(message)s"
+        )
+        logging.info("MongoDB initialized")
+
+    @property
+    def port(self):
+        if "net.port" in self.applied_tuning:
+            return self.applied_tuning["net.port"]
+        return (self.tuning_overrides.get("mongodb") or {}).get("net.port", MONGODB_PORT)
+
+    def configure(self):
+        """Пересобирает mongod.conf под профиль и объём памяти. Возвращает изменённые параметры."""
+        profile = self.mongodb_options.get("profile", "dev-fast")
+        tuning = tune_mongodb(profile, self.tuning_overrides.get("mongodb"))
+        record_tuning(self.project_path, "mongodb", tuning)
+        os.makedirs(self.data_path, exist_ok=True)
+        write_config(self.conf_path, render_mongodb_config(self.data_path, self.server_log, tuning))
+
+        changed = {name for name in tuning.keys() | self.applied_tuning.keys()
+                   if tuning.get(name) != self.applied_tuning.get(name)}
+        previous, self.applied_tuning = self.applied_tuning, tuning
+        if changed:
+            logging.info(f"mongod.conf для MongoDB {'.'.join(map(str, self.version))} собран по профилю {profile}")
+        return changed, previous
+
+    def _start(self):
+        self.configure()
+        command = rf'"{self.path}\bin\mongod.exe" --config "{self.conf_path}"'
+        return self._execute_command(command, "MongoDB запускается.", wait=False)
+
+    def _shutdown(self):
+        # mongosh не входит в архив сервера с 6.0, поэтому команда отправляется напрямую;
+        # mongod закрывает соединение, не отвечая, а завершения дожидается stop()
+        mongodb_command(self.address, {"shutdown": 1, "$db": "admin"})
+        logging.info("MongoDB остановлен.")
+        return True
+
+    def reload(self, mongodb_options=None, tuning_overrides=None):
+        if mongodb_options is not None:
+            self.mongodb_options = mongodb_options
+        if tuning_overrides is not None:
+            self.tuning_overrides = tuning_overrides
+        if self.state != "running":
+            return
+        changed, previous = self.configure()
+        # параметр, убранный из настроек, возвращается к значению по умолчанию только при запуске
+        runtime = {name: mongodb_runtime_parameter(name, self.applied_tuning[name])
+                   for name in changed if name in self.applied_tuning}
+        if None in runtime.values() or len(runtime) < len(changed):
+            self.applied_tuning = {**self.applied_tuning, "net.port": previous.get("net.port", MONGODB_PORT)}
+            self.restart()
+            return
+        for name, (parameter, value) in sorted(runtime.items()):
+            reply = mongodb_command(self.address, {"setParameter": 1, parameter: value, "$db": "admin"})
+            if reply is None or not bson_ok(reply):
+                logging.error(f"MongoDB не применил {name}, изменение вступит в силу после перезапуска.")